@@ -1,7 +1,6 @@
 #!/bin/bash
 
-# This file wipes out the current database and migrations (if any) and starts
-# from scratch.
+# This file wipes out the current database and starts from scratch.
 #
 # The current user must have privileges to create and drop PostgreSQL databases
 # from the command line.  This requires superuser or CREATEDB privileges.
@@ -17,15 +16,11 @@
 
 echo "Drop database"
 dropdb usdafood
-echo "Clear old migrations"
-mv './restful/migrations/'* ./restful/oldmigrations
 echo "Create new database 'usdafood'"
 createdb usdafood
-echo "Load schema and data"
-psql -d usdafood -f ./database/initial_build.sql
-echo "Make migrations"
-python manage.py makemigrations usdarest
-echo "Apply migrations"
+echo "Apply migrations (release bookkeeping, see restful/migrations)"
 python manage.py migrate
+echo "Load schema and data (see restful/management/commands/load_sr.py)"
+python manage.py load_sr
 echo "All done.  Exit."
 exit 1
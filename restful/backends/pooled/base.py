@@ -0,0 +1,102 @@
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql_psycopg2 import base
+
+from restful.backends.pooled.pool import ConnectionPool, PoolTimeout
+
+# PostgreSQL backend handing out pooled connections.
+#
+# settings.DATABASES:
+#   'ENGINE': 'restful.backends.pooled',
+#   'CONN_MAX_AGE': 0,  # give connections back to the pool after a request
+#   'POOL': {'MAX_SIZE': 10, 'TIMEOUT': 10, 'HEALTH_CHECK_INTERVAL': 30,
+#            'MAX_LIFETIME': 3600},
+#
+# Everything else behaves like django.db.backends.postgresql_psycopg2.
+
+
+class PooledConnection(extensions.connection):
+    """
+    psycopg2 connection that can carry per-connection state across requests:
+    the release schema on its search_path (see restful/release.py) and the
+    names of the statements prepared on it (see restful/prepared.py).
+    """
+    def __init__(self, *args, **kwargs):
+        super(PooledConnection, self).__init__(*args, **kwargs)
+        self.usda_schema = None
+        self.prepared = set()
+
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def _is_usable(conn):
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except psycopg2.Error:
+        return False
+    return True
+
+
+def _reset(conn):
+    """
+    Make a returned connection ready for the next request.
+    """
+    if conn.closed:
+        return False
+    try:
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        # back to psycopg2's defaults, Django sets autocommit on connect
+        conn.autocommit = False
+    except psycopg2.Error:
+        return False
+    return True
+
+
+def get_pool(alias, settings_dict, conn_params):
+    pool = _pools.get(alias)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                options = settings_dict.get('POOL', {})
+                pool = _pools[alias] = ConnectionPool(
+                    lambda: psycopg2.connect(
+                        connection_factory=PooledConnection, **conn_params),
+                    _is_usable, _reset, lambda conn: conn.close(),
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10),
+                    health_check_interval=options.get(
+                        'HEALTH_CHECK_INTERVAL', 30),
+                    max_lifetime=options.get('MAX_LIFETIME', 3600))
+    return pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict, conn_params)
+        try:
+            connection = pool.get()
+        except PoolTimeout as e:
+            raise psycopg2.OperationalError(str(e))
+
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        # a connection closed inside an atomic block stays referenced by
+        # this wrapper until the block exits, it can't be shared
+        get_pool(self.alias, self.settings_dict, None).put(
+            self.connection, discard=self.in_atomic_block)
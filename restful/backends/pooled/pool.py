@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+
+# a process-wide pool of database connections, see base.py.
+#
+# Under gevent workers (see usdarest/gunicorn_conf.py) every request runs in
+# its own greenlet with its own Django connection.  The pool caps the number
+# of PostgreSQL connections a worker opens at max_size: requests beyond that
+# wait (cooperatively, threading is monkey patched) for a connection to come
+# back.  Connections are reused across requests, which saves the TCP and
+# authentication handshake and keeps their prepared statements (see
+# restful/prepared.py).
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Pool of at most max_size connections made by connect().
+
+    is_usable(conn): health check, run on connections idle for more than
+                     health_check_interval seconds before handing them out.
+    reset(conn): called when a connection comes back, returns False if the
+                 connection must be discarded.
+    close(conn): closes a connection.
+    max_lifetime: connections older than this many seconds are replaced.
+    timeout: seconds to wait for a free connection before PoolTimeout.
+    """
+    def __init__(self, connect, is_usable, reset, close, max_size=10,
+                 timeout=10, health_check_interval=30, max_lifetime=3600):
+        self.connect = connect
+        self.is_usable = is_usable
+        self.reset = reset
+        self.close = close
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        # (connection, created, last used) of the idle connections, most
+        # recently used last
+        self._idle = deque()
+        self._created = {}
+
+    def get(self):
+        """
+        Take a connection out of the pool, opening one if none is idle.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout("No database connection free after %ss." %
+                              self.timeout)
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, created, last_used = self._idle.pop()
+                now = time.time()
+                if now - created > self.max_lifetime or (
+                        now - last_used > self.health_check_interval and
+                        not self.is_usable(conn)):
+                    self._discard(conn)
+                    continue
+                return conn
+            conn = self.connect()
+            self._created[id(conn)] = time.time()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def put(self, conn, discard=False):
+        """
+        Give a connection back, or close it if discard or if it can't be
+        reset.
+        """
+        try:
+            if discard or not self.reset(conn):
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, self._created[id(conn)],
+                                       time.time()))
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            self.close(conn)
+        except Exception:
+            pass
+
+    def clear(self):
+        """
+        Close the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    @property
+    def size(self):
+        """
+        Number of open connections, idle or in use.
+        """
+        return len(self._created)
+
+    @property
+    def idle(self):
+        return len(self._idle)
@@ -0,0 +1,289 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from restful.models import FoodGroup, NutrientDef, Weight
+from restful.release import current_version
+
+# read-through cache of the small, read-only USDA reference tables.
+#
+# usda_food_group (25 rows), usda_nutrient_def (150 rows) and usda_weight
+# (15,228 rows, also kept as gram factors per measure) never change within a
+# release, so each worker loads them once and serves FoodGroupList,
+# NutrientList, NutrientDetail, FoodSeqDetail, etc. from memory.  Keys
+# include the release and when it was loaded (release.current_version()),
+# so every worker picks up a new or reloaded release without any explicit
+# flushing, and drops the tables of the one it served before.
+#
+# Lookups go through a per-process copy first, then the configured backend,
+# then the database:
+#
+#   USDAREST_REFERENCE_CACHE = {
+#       'BACKEND': 'restful.cache.DjangoCacheBackend',
+#       'OPTIONS': {'alias': 'default'},
+#   }
+#
+# LocalMemoryBackend (the default) keeps everything in the worker process,
+# loaded copies are shared copy-on-write by workers forked from a preloaded
+# gunicorn master.  DjangoCacheBackend stores the tables in one of Django's
+# CACHES so workers (and the warm_cache management command) share one copy.
+
+
+class LocalMemoryBackend(object):
+    """
+    Cache backend storing values in a dict of the current process.
+
+    max_entries: if given, the oldest entries are dropped to stay below it.
+    """
+    def __init__(self, max_entries=None, **options):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value):
+        self._data[key] = value
+        if self.max_entries is not None:
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class DummyBackend(object):
+    """
+    Cache backend that doesn't cache, i.e. to turn the response cache off.
+    """
+    def __init__(self, **options):
+        pass
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete_many(self, keys):
+        pass
+
+
+class DjangoCacheBackend(object):
+    """
+    Cache backend storing values in one of the CACHES from settings.
+    Values never expire, they are keyed by release instead.
+    """
+    def __init__(self, alias='default', **options):
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, None)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(keys)
+
+
+def _load_food_groups():
+    return OrderedDict((group.food_group_id, group) for group in
+                       FoodGroup.objects.order_by('food_group_id'))
+
+
+def _load_nutrient_defs():
+    return OrderedDict((nutrient.nutr_id, nutrient) for nutrient in
+                       NutrientDef.objects.order_by('nutr_id'))
+
+
+def _load_weights():
+    # seq is a blank padded CHAR(2) column in usda_weight ('1 '), strip it
+    weights = {}
+    for weight in Weight.objects.order_by('food', 'seq'):
+        weight.seq = weight.seq.strip()
+        weights.setdefault(weight.food_id, OrderedDict())[weight.seq] = weight
+    return weights
+
+
+def measure_key(unit):
+    """
+    Normalized measure description, for matching units like "Cup" to
+    usda_weight.measure_desc.
+    """
+    return ' '.join(unit.lower().split())
+
+
+def _load_gram_factors():
+    # grams per one unit of each food measure, by seq and by measure
+    # description: Gm_Wgt is the weight of Amount units (i.e. 2 tbsp).  A
+    # description like 'cup, chopped' is also found by its head word 'cup',
+    # unless a measure is just 'cup'.  A head word of measures that weigh
+    # differently ('cup, chopped' and 'cup, melted') maps to the tuple of
+    # their descriptions instead, see calculations.gram_factor().
+    factors = {}
+    heads = {}
+    for food_id, seq, amount, measure_desc, grams in Weight.objects.order_by(
+            'food', 'seq').values_list('food_id', 'seq', 'amount',
+                                       'measure_desc', 'grams'):
+        if not amount:
+            continue
+        factor = grams / amount
+        food_factors = factors.setdefault(food_id, {})
+        food_factors[seq.strip()] = factor
+        food_factors.setdefault(measure_key(measure_desc), factor)
+        head = measure_key(measure_desc.split(',')[0].split('(')[0])
+        heads.setdefault((food_id, head), OrderedDict()).setdefault(
+            factor, measure_desc)
+    for (food_id, head), measures in heads.items():
+        food_factors = factors[food_id]
+        if head not in food_factors:
+            food_factors[head] = (next(iter(measures)) if len(measures) == 1
+                                  else tuple(measures.values()))
+    return factors
+
+
+class ReferenceCache(object):
+    """
+    Read-through cache of the reference tables of the current release.
+
+    tables: {name: loader} where loader() returns the table as a dict.
+    """
+    tables = OrderedDict([
+        ('foodgroups', _load_food_groups),
+        ('nutrients', _load_nutrient_defs),
+        ('weights', _load_weights),
+        ('gram_factors', _load_gram_factors),
+    ])
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._local = {}
+        self._version = None
+
+    def key(self, table, version=None):
+        return 'usdarest:%s:%s' % (version or current_version(), table)
+
+    def get(self, table):
+        """
+        Return a table as a dict, loading it on first use.
+        """
+        version = current_version()
+        if version != self._version:
+            self._switch(version)
+        key = self.key(table, version)
+        value = self._local.get(key)
+        if value is None:
+            value = self.backend.get(key)
+            if value is None:
+                value = self.tables[table]()
+                self.backend.set(key, value)
+            self._local[key] = value
+        return value
+
+    def warm(self):
+        """
+        Load every table of the current release.
+        """
+        for table in self.tables:
+            self.get(table)
+
+    def _switch(self, version):
+        # the release changed or was loaded again, drop the tables of the
+        # one served before
+        previous, self._version = self._version, version
+        self._local = {}
+        if previous is not None:
+            self.backend.delete_many([self.key(table, previous)
+                                      for table in self.tables])
+
+    def invalidate(self):
+        """
+        Drop all tables of the current release, they are loaded again on
+        next use.
+        """
+        keys = [self.key(table) for table in self.tables]
+        for key in keys:
+            self._local.pop(key, None)
+        self.backend.delete_many(keys)
+
+    # lookups used by the views
+
+    def food_groups(self):
+        return list(self.get('foodgroups').values())
+
+    def food_group(self, food_group_id):
+        return self.get('foodgroups').get(food_group_id)
+
+    def nutrient_defs(self):
+        return list(self.get('nutrients').values())
+
+    def nutrient_def(self, nutr_id):
+        return self.get('nutrients').get(nutr_id)
+
+    def weights(self, food_id):
+        return list(self.get('weights').get(food_id, {}).values())
+
+    def weight(self, food_id, seq_id):
+        return self.get('weights').get(food_id, {}).get(str(seq_id).strip())
+
+    def gram_factors(self, food_id):
+        """
+        {seq or measure_key(measure_desc): grams per unit} of a food.
+        """
+        return self.get('gram_factors').get(food_id, {})
+
+
+def _backend_from_settings(name):
+    config = getattr(settings, name, {})
+    backend = import_string(config.get('BACKEND',
+                                       'restful.cache.LocalMemoryBackend'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+_reference_cache = None
+_response_cache = None
+_lock = threading.Lock()
+
+
+def get_reference_cache():
+    """
+    Return the process-wide ReferenceCache configured in settings.
+    """
+    global _reference_cache
+    if _reference_cache is None:
+        with _lock:
+            if _reference_cache is None:
+                _reference_cache = ReferenceCache(
+                    _backend_from_settings('USDAREST_REFERENCE_CACHE'))
+    return _reference_cache
+
+
+def get_response_cache():
+    """
+    Return the process-wide backend for rendered responses configured in
+    settings (see mixins.CachedResponseMixin).
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _lock:
+            if _response_cache is None:
+                _response_cache = _backend_from_settings(
+                    'USDAREST_RESPONSE_CACHE')
+    return _response_cache
+
+
+@receiver(setting_changed)
+def _reset_backends(**kwargs):
+    # pick up override_settings() of the cache configuration in tests
+    global _reference_cache, _response_cache
+    if kwargs['setting'] == 'USDAREST_REFERENCE_CACHE':
+        _reference_cache = None
+    elif kwargs['setting'] == 'USDAREST_RESPONSE_CACHE':
+        _response_cache = None
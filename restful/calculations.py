@@ -0,0 +1,351 @@
+import operator
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+from functools import reduce
+
+import numpy
+from django.db.models import Q
+
+from restful import matrix, prepared
+from restful.cache import get_reference_cache, measure_key
+from restful.models import NutrientData
+from restful.release import current_release
+
+# nutrient value calculations shared by the views and serializers.
+#
+# N = (V*W)/100
+# where:
+# N = nutrient value per household measure,
+# V = nutrient value per 100 g (Nutr_Val in the Nutrient Data file)
+# W = g weight of portion (Gm_Wgt in the Weight file). *(Gm_Wgt -> grams)
+#
+# V and W come from the database, or from the in-memory nutrient matrix
+# when it is enabled (see matrix.py).
+
+
+def _seq_key(seq_id):
+    """
+    Weight.seq is a CHAR(2) column so values come back blank padded ('1 ').
+    Strip them so '1' and '1 ' refer to the same measure.
+    """
+    return str(seq_id).strip()
+
+
+def scale(value, grams):
+    """
+    Scale a nutrient value per 100 g to a portion of `grams` grams.
+    """
+    return (value * grams) / 100
+
+
+def nutrient_values(triples):
+    """
+    Calculate the nutrient value per seq (measure) for many foods at once.
+
+    triples: iterable of (food_id, seq_id, nutr_id) tuples.
+
+    Returns a list of Decimal values in the same order as `triples`, None
+    where the food, measure or nutrient does not exist.  The triples are
+    resolved with a query joining usda_nutrient_data to usda_weight that
+    only matches the requested triples (one query per MAX_PARAMS bound
+    parameters).
+    """
+    triples = [(food_id, _seq_key(seq_id), nutr_id)
+               for food_id, seq_id, nutr_id in triples]
+    if not triples:
+        return []
+
+    if matrix.is_enabled():
+        return _matrix_nutrient_values(matrix.get_matrix(), triples)
+
+    if len(triples) == 1 and prepared.is_enabled():
+        return [_prepared_nutrient_value(*triples[0])]
+
+    # the nutrients asked for per (food, measure)
+    wanted = OrderedDict()
+    for food_id, seq_id, nutr_id in triples:
+        wanted.setdefault((food_id, seq_id), set()).add(nutr_id)
+
+    values = {}
+    for batch in _batches(list(wanted.items())):
+        # seq is a CHAR(2) column, whether comparisons ignore its blank
+        # padding is backend dependent: match both forms
+        condition = reduce(operator.or_, (
+            Q(food_id=food_id, nutrient_id__in=nutr_ids,
+              food__weight__seq__in=(seq_id, seq_id.ljust(2)))
+            for (food_id, seq_id), nutr_ids in batch))
+        rows = NutrientData.objects.filter(condition).values_list(
+            'food_id', 'nutrient_id', 'nutr_value',
+            'food__weight__seq', 'food__weight__grams')
+        for food_id, nutr_id, value, seq, grams in rows:
+            values[(food_id, _seq_key(seq), nutr_id)] = scale(value, grams)
+
+    return [values.get(triple) for triple in triples]
+
+
+# bound parameters per nutrient_values() query, below SQLite's limit of 999
+MAX_PARAMS = 900
+
+
+def _batches(wanted):
+    """
+    Split the ((food_id, seq_id), nutr_ids) items of nutrient_values() into
+    lists that fit in MAX_PARAMS parameters.
+    """
+    batch = []
+    params = 0
+    for item in wanted:
+        # food_id, both forms of seq and the nutr_ids
+        size = 3 + len(item[1])
+        if batch and params + size > MAX_PARAMS:
+            yield batch
+            batch = []
+            params = 0
+        batch.append(item)
+        params += size
+    if batch:
+        yield batch
+
+
+def _prepared_nutrient_value(food_id, seq_id, nutr_id):
+    # the single lookup behind /foods/<food_id>/seqs/<seq>/nutrients/<nutr_id>
+    rows = prepared.execute(
+        'usdarest_nutrient_value',
+        'SELECT d.nutr_value, w.seq, w.grams FROM usda_nutrient_data d '
+        'JOIN usda_weight w ON w.food_id = d.food_id '
+        'WHERE d.food_id = $1 AND d.nutr_id = $2', [food_id, nutr_id])
+    for value, seq, grams in rows:
+        if _seq_key(seq) == seq_id:
+            return scale(value, grams)
+    return None
+
+
+def _matrix_nutrient_values(nutrient_matrix, triples):
+    values = []
+    for food_id, seq_id, nutr_id in triples:
+        value = nutrient_matrix.value(food_id, nutr_id)
+        grams = nutrient_matrix.grams(food_id, seq_id)
+        if value is None or grams is None:
+            values.append(None)
+        else:
+            values.append(scale(value, grams))
+    return values
+
+
+def nutrient_value(food_id, seq_id, nutr_id):
+    """
+    Calculate a single nutrient value per seq (measure) of a food.  Returns
+    None if the food, measure or nutrient does not exist.
+    """
+    return nutrient_values([(food_id, seq_id, nutr_id)])[0]
+
+
+def nutrient_profile(food_id, seq_id):
+    """
+    Calculate the value of every nutrient for a seq (measure) of a food.
+
+    Returns a (grams, nutrients) tuple where nutrients is a list of dicts
+    with nutr_id, nutr_desc, units and value keys in SR report order, or None
+    if the food or measure does not exist.  The measure's grams come from the
+    reference cache, the values from one scan of the food's
+    usda_nutrient_data rows.
+    """
+    seq_id = _seq_key(seq_id)
+    if matrix.is_enabled():
+        return _matrix_nutrient_profile(matrix.get_matrix(), food_id, seq_id)
+
+    weight = get_reference_cache().weight(food_id, seq_id)
+    if weight is None:
+        return None
+    grams = weight.grams
+    rows = NutrientData.objects.filter(food_id=food_id).order_by(
+        'nutrient__sr_order').values_list(
+        'nutrient_id', 'nutrient__nutr_desc', 'nutrient__units', 'nutr_value')
+    nutrients = [{"nutr_id": nutr_id,
+                  "nutr_desc": nutr_desc,
+                  "units": units,
+                  "value": scale(value, grams)}
+                 for nutr_id, nutr_desc, units, value in rows]
+    return grams, nutrients
+
+
+def _matrix_nutrient_profile(nutrient_matrix, food_id, seq_id):
+    grams = nutrient_matrix.grams(food_id, seq_id)
+    if grams is None:
+        return None
+    nutrients = [{"nutr_id": nutr_id,
+                  "nutr_desc": nutr_desc,
+                  "units": units,
+                  "value": scale(value, grams)}
+                 for nutr_id, nutr_desc, units, value
+                 in nutrient_matrix.profile(food_id)]
+    return grams, nutrients
+
+
+def recipe_nutrients(ingredients):
+    """
+    Calculate the nutrients of a recipe (or meal) made of several foods.
+
+    ingredients: list of dicts with a food_id, a quantity and either a seq_id
+                 (quantity is a multiple of that measure) or grams (quantity
+                 is a multiple of that many grams).
+
+    Returns a dict with the total "grams", the total of every nutrient any
+    ingredient has a value for in "nutrients" (SR report order) and a
+    per-ingredient breakdown of grams and {nutr_id: value} in "ingredients".
+    Grams are rounded to 1 decimal place and values to the nutrient's
+    decimal_places, as Decimals like portion_nutrients().  Raises
+    LookupError if an ingredient's food or measure does not exist.
+
+    The totals are a single weighted matrix product of the ingredients' gram
+    weights and their rows of the nutrient matrix.  Missing values count as 0.
+    """
+    if matrix.is_enabled():
+        nutrient_matrix = matrix.get_matrix()
+    else:
+        nutrient_matrix = matrix.NutrientMatrix.build(
+            current_release(),
+            food_ids=set(ingredient['food_id'] for ingredient in ingredients))
+
+    rows = []
+    grams = []
+    for i, ingredient in enumerate(ingredients):
+        food_id = ingredient['food_id']
+        row = nutrient_matrix.food_index.get(food_id)
+        if ingredient.get('grams') is not None:
+            portion = ingredient['grams']
+        else:
+            portion = nutrient_matrix.grams(food_id,
+                                            _seq_key(ingredient['seq_id']))
+        if row is None or portion is None:
+            raise LookupError("Ingredient %d: unknown food or measure." % i)
+        rows.append(row)
+        grams.append(float(portion * ingredient.get('quantity', 1)))
+
+    values = nutrient_matrix.values[rows].astype(numpy.float64)
+    missing = numpy.isnan(values)
+    values[missing] = 0
+    factors = numpy.array(grams, dtype=numpy.float64) / 100
+
+    totals = numpy.dot(factors, values)
+    breakdown = values * factors[:, numpy.newaxis]
+    nutrient_defs = get_reference_cache().get('nutrients')
+    places = [int(nutrient_defs[nutr_id].decimal_places)
+              for nutr_id in nutrient_matrix.nutr_ids]
+
+    nutrients = [{"nutr_id": nutrient_matrix.nutr_ids[col],
+                  "nutr_desc": nutrient_matrix.nutrients[col][0],
+                  "units": nutrient_matrix.nutrients[col][1],
+                  "value": _round_float(totals[col], places[col])}
+                 for col in numpy.flatnonzero(~missing.all(axis=0))]
+    breakdown = [{"food_id": ingredient['food_id'],
+                  "grams": _round_float(grams[i], 1),
+                  "nutrients": dict((nutrient_matrix.nutr_ids[col],
+                                     _round_float(breakdown[i, col],
+                                                  places[col]))
+                                    for col in numpy.flatnonzero(~missing[i]))}
+                 for i, ingredient in enumerate(ingredients)]
+    return {"grams": _round_float(sum(grams), 1),
+            "nutrients": nutrients,
+            "ingredients": breakdown}
+
+
+# grams per unit of the mass units accepted besides a food's own measures
+MASS_UNITS = {
+    'g': Decimal('1'),
+    'gram': Decimal('1'),
+    'kg': Decimal('1000'),
+    'mg': Decimal('0.001'),
+    'oz': Decimal('28.349523125'),
+    'ounce': Decimal('28.349523125'),
+    'lb': Decimal('453.59237'),
+    'pound': Decimal('453.59237'),
+}
+
+
+def gram_factor(food_id, unit=None, seq_id=None):
+    """
+    Grams in one `unit` (a mass unit or one of the food's measures, i.e.
+    "cup" or "cups") or one unit of the food measure seq_id.  None if the
+    unit or measure is unknown.  Raises LookupError listing the measures if
+    unit is only the head word of measures that weigh differently, i.e.
+    "cup" for "cup, chopped" and "cup, melted".
+    """
+    factors = get_reference_cache().gram_factors(food_id)
+    if seq_id is not None:
+        return factors.get(_seq_key(seq_id))
+    key = measure_key(unit)
+    for key in (key, key[:-1] if key.endswith('s') else None):
+        if key in MASS_UNITS:
+            return MASS_UNITS[key]
+        if key in factors:
+            factor = factors[key]
+            if isinstance(factor, tuple):
+                raise LookupError('"%s" is ambiguous, one of: %s.' % (
+                    unit, '; '.join(factor)))
+            return factor
+    return None
+
+
+def portion_nutrients(portions, nutr_ids=None):
+    """
+    Calculate the nutrients of arbitrary portions of foods.
+
+    portions: list of dicts with a food_id, a quantity and either a unit
+              (a mass unit or a measure description, see gram_factor()) or
+              a seq_id.
+    nutr_ids: if given, only these nutrients are included.
+
+    Returns a list with the grams and the nutrients (nutr_id, nutr_desc,
+    units and value, in SR report order) of each portion.  Values are
+    rounded to the nutrient's decimal_places.  Raises LookupError if a
+    portion's food or unit does not exist.
+    """
+    if matrix.is_enabled():
+        nutrient_matrix = matrix.get_matrix()
+    else:
+        nutrient_matrix = matrix.NutrientMatrix.build(
+            current_release(),
+            food_ids=set(portion['food_id'] for portion in portions))
+    nutrient_defs = get_reference_cache().get('nutrients')
+    if nutr_ids is not None:
+        nutr_ids = set(nutr_ids)
+
+    results = []
+    for i, portion in enumerate(portions):
+        profile = nutrient_matrix.profile(portion['food_id'])
+        if profile is None:
+            raise LookupError("Portion %d: unknown food." % i)
+        try:
+            factor = gram_factor(portion['food_id'], portion.get('unit'),
+                                 portion.get('seq_id'))
+        except LookupError as e:
+            raise LookupError("Portion %d: %s" % (i, e))
+        if factor is None:
+            raise LookupError("Portion %d: unknown unit or measure." % i)
+        grams = portion.get('quantity', 1) * factor
+        results.append({
+            "food_id": portion['food_id'],
+            "grams": _round_places(grams, 1),
+            "nutrients": [{"nutr_id": nutr_id,
+                           "nutr_desc": nutr_desc,
+                           "units": units,
+                           "value": _round_places(
+                               scale(value, grams),
+                               int(nutrient_defs[nutr_id].decimal_places))}
+                          for nutr_id, nutr_desc, units, value in profile
+                          if nutr_ids is None or nutr_id in nutr_ids]})
+    return results
+
+
+def _round_places(value, places):
+    return value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def _round_float(value, places):
+    """
+    _round_places() for a float result of the nutrient matrix.  It is first
+    rounded to the 6 decimal places a value per 100 g (3 places) times a
+    gram weight (1 place) / 100 can have, which drops float32 noise.
+    """
+    return _round_places(Decimal(repr(round(float(value), 6))), places)
@@ -0,0 +1,140 @@
+from json.encoder import encode_basestring
+from operator import attrgetter, itemgetter
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+from rest_framework import fields, relations, renderers
+
+from restful import profiling
+
+# fast JSON output for the read-only list and detail endpoints.
+#
+# DRF serializers look up every field of every object, call each field's
+# to_representation() and build an OrderedDict that json.dumps() walks
+# again.  A RowEncoder does that work once per serializer class: it reads
+# the serializer's fields, then turns rows (values_list() tuples, or model
+# instances / dicts from the reference cache and search) straight into JSON
+# text.
+#
+# Output is byte for byte what DRF's JSONRenderer makes of the serializer's
+# data with the default settings (UNICODE_JSON, COMPACT_JSON and
+# COERCE_DECIMAL_TO_STRING on), see test_encoders.py.
+
+
+class RawJSON(object):
+    """
+    Response data that is already JSON text, see JSONRenderer.
+    """
+    def __init__(self, text):
+        self.text = text
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    DRF's JSONRenderer, passing RawJSON data through untouched.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with profiling.timer('render'):
+            if isinstance(data, RawJSON):
+                return bytes(data.text.replace('\u2028', '\\u2028')
+                             .replace('\u2029', '\\u2029').encode('utf-8'))
+            return super(JSONRenderer, self).render(data, accepted_media_type,
+                                                    renderer_context)
+
+
+def encode_string(value):
+    return encode_basestring(six.text_type(value))
+
+
+def encode_value(value):
+    """
+    JSON text of a str, int, None or bool.
+    """
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, six.integer_types):
+        return str(value)
+    return encode_string(value)
+
+
+def _field_encoder(field):
+    """
+    Function turning a field's value into JSON text, null for None like
+    Serializer.to_representation().
+    """
+    if isinstance(field, (relations.PrimaryKeyRelatedField, fields.CharField)):
+        # the primary keys of the usda_* tables are all CHAR columns
+        encode = encode_string
+    elif isinstance(field, fields.DecimalField):
+        def encode(value):
+            return encode_value(field.to_representation(value))
+    else:
+        raise ImproperlyConfigured("RowEncoder can't encode %s fields." %
+                                   type(field).__name__)
+
+    def encode_or_null(value):
+        return 'null' if value is None else encode(value)
+    return encode_or_null
+
+
+class RowEncoder(object):
+    """
+    Precompiled JSON encoder for the fields of a serializer class.
+
+    fields: the serializer's field names, in output order.
+    sources: model attribute (or values_list) names of the fields, i.e.
+             "food_group_id" for a "food_group" relation.
+    """
+    _encoders = {}
+
+    def __init__(self, serializer_class):
+        serializer_fields = [field for field in
+                             serializer_class().fields.values()
+                             if not field.write_only]
+        self.fields = tuple(field.field_name for field in serializer_fields)
+        self.sources = tuple(
+            field.source + '_id'
+            if isinstance(field, relations.RelatedField) else field.source
+            for field in serializer_fields)
+        self.prefixes = tuple(
+            ('{' if i == 0 else ',') + encode_string(name) + ':'
+            for i, name in enumerate(self.fields))
+        self.encoders = tuple(_field_encoder(field)
+                              for field in serializer_fields)
+        self._attrs = attrgetter(*self.sources)
+        self._items = itemgetter(*self.sources)
+
+    @classmethod
+    def for_serializer(cls, serializer_class):
+        """
+        The RowEncoder of a serializer class, compiled on first use.
+        """
+        encoder = cls._encoders.get(serializer_class)
+        if encoder is None:
+            encoder = cls._encoders[serializer_class] = cls(serializer_class)
+        return encoder
+
+    def row(self, obj):
+        """
+        The values of a model instance or dict as a row tuple.
+        """
+        values = self._items(obj) if isinstance(obj, dict) \
+            else self._attrs(obj)
+        return values if len(self.sources) > 1 else (values,)
+
+    def encode(self, row):
+        """
+        JSON text of one row tuple.
+        """
+        return ''.join([prefix + encode(value) for prefix, encode, value
+                        in zip(self.prefixes, self.encoders, row)]) + '}'
+
+    def encode_many(self, rows):
+        """
+        JSON text of a list of row tuples.
+        """
+        return '[' + ','.join([self.encode(row) for row in rows]) + ']'
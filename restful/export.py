@@ -0,0 +1,146 @@
+import csv
+from itertools import groupby
+
+from django.db import connection
+from django.utils import six
+from rest_framework.utils.encoders import JSONEncoder
+
+from restful.models import FoodDesc, Weight, NutrientDef, NutrientData
+from restful.serializers import FoodDetailSerializer
+
+# bulk export of the whole dataset, one food at a time.
+#
+# Foods, weights and nutrient data are read with three server-side cursors
+# ordered by food_id and merged food by food, so memory use stays flat no
+# matter how many rows are exported.  The generators below yield text and
+# are meant to be wrapped in a StreamingHttpResponse (see views.FoodExport).
+
+# rows fetched from the database per round trip
+ITERSIZE = 2000
+
+FOOD_FIELDS = tuple('food_group_id' if field == 'food_group' else field
+                    for field in FoodDetailSerializer.Meta.fields)
+WEIGHT_FIELDS = ('seq', 'amount', 'measure_desc', 'grams')
+
+
+def _rows(queryset, name):
+    """
+    Yield the rows of a values_list() queryset.  On PostgreSQL this uses a
+    named (server-side) cursor fetching ITERSIZE rows at a time, elsewhere
+    rows are fetched ITERSIZE at a time from a regular cursor.
+    """
+    sql, params = queryset.query.sql_with_params()
+    connection.ensure_connection()
+    if connection.vendor == 'postgresql':
+        # withhold=True keeps the cursor usable outside of a transaction
+        cursor = connection.connection.cursor(name=name, withhold=True)
+        cursor.itersize = ITERSIZE
+        try:
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close()
+    else:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchmany(ITERSIZE)
+            while rows:
+                for row in rows:
+                    yield row
+                rows = cursor.fetchmany(ITERSIZE)
+        finally:
+            cursor.close()
+
+
+def _by_food(rows):
+    """
+    Group (food_id, ...) rows ordered by food_id into (food_id, [rows]).
+    """
+    for food_id, group in groupby(rows, key=lambda row: row[0]):
+        yield food_id, [row[1:] for row in group]
+
+
+def _strip(value):
+    # usda_* tables use blank padded CHAR columns
+    return value.strip() if isinstance(value, six.string_types) else value
+
+
+def foods():
+    """
+    Yield a dict for every food with its FoodDetailSerializer fields, a list
+    of its "weights" and a {nutr_id: value per 100 g} dict of "nutrients".
+    """
+    food_rows = _rows(FoodDesc.objects.order_by('food_id').values_list(
+        *FOOD_FIELDS), 'export_foods')
+    weights = _by_food(_rows(Weight.objects.order_by('food', 'seq').values_list(
+        'food_id', *WEIGHT_FIELDS), 'export_weights'))
+    nutrients = _by_food(_rows(NutrientData.objects.order_by(
+        'food', 'nutrient').values_list('food_id', 'nutrient_id', 'nutr_value'),
+        'export_nutrients'))
+
+    # merge the three food_id ordered streams
+    weight = next(weights, None)
+    nutrient = next(nutrients, None)
+    for row in food_rows:
+        food = dict(zip(FOOD_FIELDS, (_strip(value) for value in row)))
+        food_id = food['food_id']
+
+        food['weights'] = []
+        while weight is not None and weight[0] <= food_id:
+            if weight[0] == food_id:
+                food['weights'] = [dict(zip(WEIGHT_FIELDS, map(_strip, w)))
+                                   for w in weight[1]]
+            weight = next(weights, None)
+
+        food['nutrients'] = {}
+        while nutrient is not None and nutrient[0] <= food_id:
+            if nutrient[0] == food_id:
+                food['nutrients'] = dict((_strip(nutr_id), value)
+                                         for nutr_id, value in nutrient[1])
+            nutrient = next(nutrients, None)
+
+        yield food
+
+
+def ndjson():
+    """
+    Yield the export as newline delimited JSON, one food per line.
+    """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'),
+                          sort_keys=True)
+    for food in foods():
+        yield encoder.encode(food) + '\n'
+
+
+class _Line(object):
+    """
+    File-like object for csv.writer that hands back the last line written.
+    """
+    def write(self, value):
+        self.value = value
+
+
+def csv_rows():
+    """
+    Yield the export as CSV, one food per row: the food fields, one
+    nutr_<nutr_id> column per nutrient (value per 100 g, blank if missing)
+    and the food's weights as a JSON list.
+    """
+    nutr_ids = list(NutrientDef.objects.order_by('nutr_id').values_list(
+        'nutr_id', flat=True))
+    line = _Line()
+    writer = csv.writer(line)
+
+    writer.writerow(FOOD_FIELDS +
+                    tuple('nutr_%s' % nutr_id for nutr_id in nutr_ids) +
+                    ('weights',))
+    yield line.value
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for food in foods():
+        writer.writerow([food[field] for field in FOOD_FIELDS] +
+                        [food['nutrients'].get(nutr_id, '')
+                         for nutr_id in nutr_ids] +
+                        [encoder.encode(food['weights'])])
+        yield line.value
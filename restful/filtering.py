@@ -0,0 +1,91 @@
+import numpy
+
+from restful import matrix
+from restful.cache import get_reference_cache
+from restful.models import NutrientData
+from restful.rankings import get_ranking_index
+
+# multi-nutrient range filters, i.e. foods with protein >= 20 g and sodium
+# <= 100 mg per 100 g.
+#
+# Instead of joining usda_nutrient_data once per constrained nutrient, the
+# constrained columns are scanned as arrays: each constraint gives a boolean
+# mask over the foods and the masks are and-ed together.  The columns come
+# from the nutrient matrix when it is enabled (no query at all), otherwise
+# from a single query for the rows of the constrained nutrients.  Foods
+# without a value for a constrained nutrient never match.
+
+
+def _default_grams(food_ids):
+    # grams of the default measure (lowest seq) of each food, NaN if none
+    grams = []
+    reference_cache = get_reference_cache()
+    for food_id in food_ids:
+        weights = reference_cache.weights(food_id)
+        grams.append(float(min(weights, key=lambda w: int(w.seq)).grams)
+                     if weights else numpy.nan)
+    return numpy.array(grams)
+
+
+def nutrient_columns(nutr_ids, food_groups=None):
+    """
+    (food_ids, values, grams): the foods (of food_groups, default: all), a
+    float64 array of their values per 100 g of each of nutr_ids (NaN if
+    missing) and the grams of their default measures (NaN if none).
+    """
+    if matrix.is_enabled():
+        nutrient_matrix = matrix.get_matrix()
+        cols = [nutrient_matrix.nutr_index[nutr_id] for nutr_id in nutr_ids]
+        # float32 to the 3 decimals of nutr_value, so bounds compare exactly
+        values = numpy.round(
+            nutrient_matrix.values[:, cols].astype(numpy.float64), 3)
+        food_ids = nutrient_matrix.food_ids
+        grams = get_ranking_index().grams
+        if food_groups is not None:
+            rows = numpy.in1d(nutrient_matrix.food_groups, list(food_groups))
+            values = values[rows]
+            food_ids = [food_id for food_id, keep in zip(food_ids, rows)
+                        if keep]
+            grams = grams[rows]
+        return food_ids, values, grams
+
+    rows = NutrientData.objects.filter(nutrient_id__in=nutr_ids)
+    if food_groups is not None:
+        rows = rows.filter(food__food_group_id__in=food_groups)
+    rows = list(rows.values_list('food_id', 'nutrient_id', 'nutr_value'))
+    food_ids = sorted(set(food_id for food_id, _, _ in rows))
+    food_index = dict((food_id, i) for i, food_id in enumerate(food_ids))
+    col_index = dict((nutr_id, i) for i, nutr_id in enumerate(nutr_ids))
+    values = numpy.empty((len(food_ids), len(nutr_ids)))
+    values.fill(numpy.nan)
+    for food_id, nutr_id, value in rows:
+        values[food_index[food_id], col_index[nutr_id]] = value
+    return food_ids, values, _default_grams(food_ids)
+
+
+def filter_foods(constraints, basis='100g', food_group=None):
+    """
+    The sorted food_ids of the foods meeting every constraint.
+
+    constraints: list of (nutr_id, minimum, maximum) tuples, minimum or
+                 maximum may be None.  Bounds are inclusive.
+    basis: '100g' for values per 100 g, 'measure' per default measure (the
+           lowest seq, as in rankings.py).
+    food_group: only foods of this food group.
+    """
+    nutr_ids = list(set(nutr_id for nutr_id, _, _ in constraints))
+    food_ids, values, grams = nutrient_columns(
+        nutr_ids, None if food_group is None else [food_group])
+    if basis == 'measure':
+        values = numpy.round(values * (grams / 100)[:, numpy.newaxis], 6)
+
+    mask = numpy.ones(len(food_ids), dtype=bool)
+    with numpy.errstate(invalid='ignore'):
+        for nutr_id, minimum, maximum in constraints:
+            column = values[:, nutr_ids.index(nutr_id)]
+            mask &= ~numpy.isnan(column)
+            if minimum is not None:
+                mask &= column >= minimum
+            if maximum is not None:
+                mask &= column <= maximum
+    return [food_ids[i] for i in numpy.flatnonzero(mask)]
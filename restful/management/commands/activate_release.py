@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from restful.models import Release
+
+
+class Command(BaseCommand):
+    """
+    Serve another release loaded with `manage.py load_sr --release`, i.e. to
+    roll forward to SR28 or back to SR27.  Running workers switch within
+    USDAREST_RELEASE_CHECK_INTERVAL seconds, no restart needed.
+    """
+    help = "Serve a loaded USDA release."
+
+    def add_arguments(self, parser):
+        parser.add_argument('release', help="Name of the release, i.e. SR28.")
+
+    def handle(self, *args, **options):
+        release = Release.objects.filter(name=options['release']).first()
+        if release is None:
+            raise CommandError("Release %s isn't loaded, loaded releases: %s."
+                               % (options['release'], ", ".join(
+                                   str(r) for r in Release.objects.all())))
+        release.activate()
+        self.stdout.write("Serving %s, running workers switch within %ss." % (
+            release, getattr(settings, 'USDAREST_RELEASE_CHECK_INTERVAL', 30)))
@@ -0,0 +1,346 @@
+import http.client
+import json
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import RegexURLResolver
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from restful import release, similarity, urls
+
+# (url name, method, path, JSON body) of the requests benchmarked, at least
+# one for every URL in restful/urls.py (see check_coverage()).  The food,
+# measure and nutrient ids exist in the test fixture as well as in SR27.
+ENDPOINTS = (
+    ('food:food-list', 'GET', '/foods', None),
+    ('food:food-list', 'GET', '/foods?page_size=100', None),
+    ('food:food-list', 'GET',
+     '/foods?ids=01001,01002,01003,01004,01005&nutrients=203,204,205', None),
+    ('food:food-search', 'GET', '/foods/search?q=butter', None),
+    ('food:food-filter', 'GET', '/foods/filter?min_204=50&max_307=1000',
+     None),
+    ('food:food-filter', 'GET',
+     '/foods/filter?min_203=0.1&basis=measure&food_group=0100', None),
+    ('food:nutrient-batch', 'POST', '/foods/nutrients',
+     [{'food_id': '01001', 'seq_id': '1', 'nutr_id': '203'},
+      {'food_id': '01001', 'seq_id': '2', 'nutr_id': '204'}]),
+    ('food:food-detail', 'GET', '/foods/01001', None),
+    ('food:food-similar', 'GET', '/foods/01001/similar', None),
+    ('food:food-similar', 'GET', '/foods/01001/similar?nutrients=203,204,205',
+     None),
+    ('food:weight-list', 'GET', '/foods/01001/seqs', None),
+    ('food:weight-detail', 'GET', '/foods/01001/seqs/1', None),
+    ('food:nutrient-list', 'GET', '/foods/01001/seqs/1/nutrients', None),
+    ('food:nutrient-detail', 'GET', '/foods/01001/seqs/1/nutrients/203',
+     None),
+    ('nutrient:nutrient-list', 'GET', '/nutrients', None),
+    ('nutrient:nutrient-detail', 'GET', '/nutrients/203', None),
+    ('nutrient:nutrient-top', 'GET', '/nutrients/203/top', None),
+    ('foodgroup:foodgroup-list', 'GET', '/foodgroups', None),
+    ('foodgroup:foodgroup-detail', 'GET', '/foodgroups/0100', None),
+    ('recipe:recipe-compute', 'POST', '/recipes/compute',
+     {'ingredients': [{'food_id': '01001', 'seq_id': '1', 'quantity': '2'},
+                      {'food_id': '01001', 'grams': '50'}]}),
+    ('portion:portion-compute', 'POST', '/portions/compute',
+     {'portions': [{'food_id': '01001', 'quantity': '250', 'unit': 'g'},
+                   {'food_id': '01001', 'quantity': '1.5', 'unit': 'cups'}]}),
+    ('diet:diet-optimize', 'POST', '/diets/optimize',
+     {'targets': [{'nutr_id': '203', 'min': '0.5'},
+                  {'nutr_id': '204', 'max': '80'}],
+      'objective': 'energy'}),
+    ('export:food-export', 'GET', '/export/foods.ndjson', None),
+    ('export:food-export', 'GET', '/export/foods.csv', None),
+    ('metrics', 'GET', '/metrics', None),
+)
+
+FIXTURE = os.path.join(os.path.dirname(settings.BASE_DIR), 'restful', 'test',
+                       'fixtures', 'initial_data.json')
+
+
+def url_names(patterns=urls.urlpatterns, namespace=None):
+    """
+    Yield the namespaced names of the URLs in patterns.
+    """
+    for pattern in patterns:
+        if isinstance(pattern, RegexURLResolver):
+            for name in url_names(pattern.url_patterns, pattern.namespace):
+                yield name
+        elif pattern.name:
+            yield '%s:%s' % (namespace, pattern.name) if namespace \
+                else pattern.name
+
+
+def check_coverage():
+    """
+    Names of the URLs in restful/urls.py without a request in ENDPOINTS.
+    """
+    return sorted(set(url_names()) - set(name for name, _, _, _
+                                         in ENDPOINTS))
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile of a sorted list.
+    """
+    return values[max(0, int(round(p / 100.0 * len(values))) - 1)]
+
+
+def summary(name, mode, method, path, timings, elapsed, queries):
+    timings = sorted(timings)
+    return {'name': name, 'mode': mode, 'method': method, 'path': path,
+            'requests': len(timings),
+            'throughput': round(len(timings) / elapsed, 1),
+            'p50': round(percentile(timings, 50) * 1000, 3),
+            'p95': round(percentile(timings, 95) * 1000, 3),
+            'p99': round(percentile(timings, 99) * 1000, 3),
+            'queries': queries}
+
+
+def regressions(results, baseline, latency_threshold, latency_slack):
+    """
+    Messages for the results with more queries than the baseline, or a p95
+    latency more than latency_threshold (a fraction) and latency_slack
+    milliseconds above it.
+    """
+    previous = dict(((result['mode'], result['path']), result)
+                    for result in baseline['results'])
+    messages = []
+    for result in results:
+        base = previous.get((result['mode'], result['path']))
+        if base is None:
+            continue
+        label = '%s %s (%s)' % (result['method'], result['path'],
+                                result['mode'])
+        if result['queries'] is not None and \
+                base['queries'] is not None and \
+                result['queries'] > base['queries']:
+            messages.append('%s: %d queries, was %d.' % (
+                label, result['queries'], base['queries']))
+        if result['p95'] > base['p95'] * (1 + latency_threshold) and \
+                result['p95'] - base['p95'] > latency_slack:
+            messages.append('%s: p95 %.3f ms, was %.3f ms.' % (
+                label, result['p95'], base['p95']))
+    return messages
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    """
+    Benchmark every endpoint of restful/urls.py.
+
+    Each request of ENDPOINTS is sent --requests times through the Django
+    test client (in process, no HTTP) and through a real WSGI server
+    (wsgiref, one thread per connection) on a random local port, after
+    --warmup untimed requests.  Reported per request: throughput, p50, p95
+    and p99 latency and the number of SQL queries of a warm request.
+
+    Runs against the configured database, i.e. full SR27 once load_sr has
+    run, or with --fixture against a throwaway test database loaded with
+    restful/test/fixtures/initial_data.json.
+
+    --output saves the results as JSON, --baseline compares them with saved
+    results and fails if an endpoint makes more queries or got slower than
+    --latency-threshold.
+    """
+    help = "Measure throughput, latency and queries of every endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Timed requests per endpoint and mode.")
+        parser.add_argument('--warmup', type=int, default=20,
+                            help="Untimed requests per endpoint and mode.")
+        parser.add_argument('--mode', choices=('client', 'server', 'both'),
+                            default='both')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help="Concurrent connections to the WSGI "
+                                 "server.")
+        parser.add_argument('--fixture', action='store_true', default=False,
+                            help="Use a test database with the test "
+                                 "fixture.")
+        parser.add_argument('--no-cache', action='store_true', default=False,
+                            help="Turn the response cache off.")
+        parser.add_argument('--output', help="Write the results as JSON.")
+        parser.add_argument('--baseline',
+                            help="JSON results to compare with, fail on "
+                                 "regressions.")
+        parser.add_argument('--latency-threshold', type=float, default=0.2,
+                            help="Allowed p95 increase over the baseline, "
+                                 "as a fraction (default: 0.2).")
+        parser.add_argument('--latency-slack', type=float, default=1.0,
+                            help="p95 increases below this many ms are "
+                                 "never regressions (default: 1.0).")
+
+    def handle(self, *args, **options):
+        missing = check_coverage()
+        if missing:
+            raise CommandError("No benchmark for %s, add them to ENDPOINTS." %
+                               ", ".join(missing))
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        overrides = {}
+        if options['no_cache']:
+            overrides['USDAREST_RESPONSE_CACHE'] = {
+                'BACKEND': 'restful.cache.DummyBackend'}
+        with override_settings(**overrides):
+            if options['fixture']:
+                with self.fixture_database():
+                    results = self.run(options)
+            else:
+                results = self.run(options)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'results': results}, f, indent=2)
+        if baseline is not None:
+            messages = regressions(results, baseline,
+                                   options['latency_threshold'],
+                                   options['latency_slack'])
+            if messages:
+                raise CommandError("Regressions:\n" + "\n".join(messages))
+            self.stdout.write("No regressions against %s." %
+                              options['baseline'])
+
+    @contextmanager
+    def fixture_database(self):
+        from restful.test.runner import UnManagedModelTestRunner
+        runner = UnManagedModelTestRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        with override_settings(MIGRATION_MODULES={
+                'restful': 'migrations_not_used_in_tests'}):
+            old_config = runner.setup_databases()
+        try:
+            call_command('loaddata', FIXTURE, verbosity=0)
+            release.check(force=True)
+            # don't save indexes of the fixture as the release's, or load
+            # the release's snapshot
+            with override_settings(USDAREST_SIMILARITY_DIR=None,
+                                   USDAREST_SNAPSHOT_DIR=None):
+                similarity.build()
+                yield
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+    def run(self, options):
+        results = []
+        if options['mode'] in ('client', 'both'):
+            results.extend(self.run_client(options))
+        if options['mode'] in ('server', 'both'):
+            queries = dict((result['path'], result['queries'])
+                           for result in results)
+            results.extend(self.run_server(options, queries))
+        return results
+
+    def run_client(self, options):
+        client = Client()
+
+        def send(method, path, body):
+            if method == 'POST':
+                response = client.post(path, json.dumps(body),
+                                       content_type='application/json')
+            else:
+                response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            if response.status_code != 200:
+                raise CommandError("%s %s returned %d." % (
+                    method, path, response.status_code))
+
+        for name, method, path, body in ENDPOINTS:
+            for _ in range(options['warmup']):
+                send(method, path, body)
+            with CaptureQueriesContext(connection) as captured:
+                send(method, path, body)
+            # the next request resets connection.queries
+            queries = len(captured.captured_queries)
+            timings = []
+            start = time.perf_counter()
+            for _ in range(options['requests']):
+                t = time.perf_counter()
+                send(method, path, body)
+                timings.append(time.perf_counter() - t)
+            elapsed = time.perf_counter() - start
+            yield summary(name, 'client', method, path, timings, elapsed,
+                          queries)
+
+    def run_server(self, options, queries):
+        """
+        Queries are counted by the test client run, or are None: the server
+        handles requests on connections of its own threads.
+        """
+        server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                             server_class=_ThreadingWSGIServer,
+                             handler_class=_QuietHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        port = server.server_address[1]
+
+        def send(method, path, body):
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            try:
+                t = time.perf_counter()
+                if method == 'POST':
+                    conn.request(method, path, json.dumps(body),
+                                 {'Content-Type': 'application/json'})
+                else:
+                    conn.request(method, path)
+                response = conn.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - t
+            finally:
+                conn.close()
+            if response.status != 200:
+                raise CommandError("%s %s returned %d." % (
+                    method, path, response.status))
+            return elapsed
+
+        try:
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                for name, method, path, body in ENDPOINTS:
+                    for _ in range(options['warmup']):
+                        send(method, path, body)
+                    start = time.perf_counter()
+                    timings = list(pool.map(
+                        lambda _: send(method, path, body),
+                        range(options['requests'])))
+                    elapsed = time.perf_counter() - start
+                    yield summary(name, 'server', method, path, timings,
+                                  elapsed, queries.get(path))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def report(self, results):
+        row = '%-7s %-6s %-42s %9s %9s %9s %9s %7s'
+        self.stdout.write(row % ('mode', 'method', 'path', 'req/s',
+                                 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for result in results:
+            self.stdout.write(row % (
+                result['mode'], result['method'], result['path'][:42],
+                result['throughput'], result['p50'], result['p95'],
+                result['p99'],
+                '-' if result['queries'] is None else result['queries']))
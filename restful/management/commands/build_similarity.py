@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restful import release, similarity
+from restful.release import current_release
+
+
+class Command(BaseCommand):
+    """
+    Build the nutrient similarity index of the current release and save it
+    under USDAREST_SIMILARITY_DIR, where workers memory-map it at startup
+    (see restful/similarity.py).  Run after load_sr.
+    """
+    help = "Build and save the food similarity index."
+
+    def handle(self, *args, **options):
+        directory = similarity.get_directory()
+        if not directory:
+            raise CommandError("Set USDAREST_SIMILARITY_DIR first.")
+        # the active release, the index records when it was loaded
+        release.check(force=True)
+        index = similarity.build()
+        self.stdout.write("Saved the similarity index of %d foods for "
+                          "release %s in %s." % (
+                              len(index.food_ids), current_release(),
+                              directory))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restful import release, snapshot
+from restful.release import current_release
+
+
+class Command(BaseCommand):
+    """
+    Write the binary snapshot of the current release's tables under
+    USDAREST_SNAPSHOT_DIR, where workers memory-map it at startup (see
+    restful/snapshot.py).  Run after load_sr.
+    """
+    help = "Build and save the binary snapshot of the SR tables."
+
+    def handle(self, *args, **options):
+        # the active release, the snapshot records when it was loaded
+        release.check(force=True)
+        path = snapshot.get_path()
+        if not path:
+            raise CommandError("Set USDAREST_SNAPSHOT_DIR first.")
+        snapshot.write(path)
+        snapshot.invalidate()
+        rows = snapshot.get_snapshot().rows
+        self.stdout.write("Saved the snapshot of release %s (%d foods, %d "
+                          "nutrient values) in %s." % (
+                              current_release(), rows['food_desc'],
+                              rows['nutrient_data'], path))
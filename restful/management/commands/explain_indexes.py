@@ -0,0 +1,111 @@
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from restful.cache import get_reference_cache
+from restful.models import FoodDesc, NutrientData
+
+# (name, url) of the endpoints compared, URLs that don't query the usda_*
+# tables once the reference cache is warm are left out.
+ENDPOINTS = (
+    ('food-detail', '/foods/01001'),
+    ('nutrient-detail', '/foods/01001/seqs/1/nutrients/203'),
+    ('nutrient-profile', '/foods/01001/seqs/1/nutrients'),
+    ('food-search', '/foods/search?q=cheese&food_group=0100'),
+    ('food-list', '/foods?page_size=100'),
+)
+
+# (name, queryset) of queries not (yet) behind an endpoint
+QUERIES = (
+    ('ranking (SQL)', lambda: NutrientData.objects.filter(
+        nutrient='203').order_by('-nutr_value').values_list(
+        'food_id', 'nutr_value')[:50]),
+    ('foods by group', lambda: FoodDesc.objects.filter(
+        food_group='0100').values_list('food_id', 'long_desc')),
+)
+
+
+class Command(BaseCommand):
+    """
+    Show the query plans of the endpoints with and without index scans, i.e.
+    what the indexes of restful/sr.py INDEXES (migrations 0002 and 0004)
+    and the primary keys buy.
+
+    Each endpoint is requested once through the Django test client to
+    capture its SQL, then every query is EXPLAINed, and again in a
+    transaction that turns off index, index-only and bitmap scans with SET
+    LOCAL.  Nothing is dropped or locked beyond what the queries read, so it
+    is safe against a live database.  PostgreSQL only.
+    """
+    help = "Compare query plans with and without index scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', default=False,
+                            help="EXPLAIN ANALYZE: run the queries and show "
+                                 "actual times.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("explain_indexes needs PostgreSQL, not %s." %
+                               connection.vendor)
+        explain = 'EXPLAIN (ANALYZE, BUFFERS) ' if options['analyze'] \
+            else 'EXPLAIN '
+
+        queries = OrderedDict()
+        for name, sql in self.captured_queries():
+            queries.setdefault(name, []).append(sql)
+
+        with connection.cursor() as cursor:
+            with_indexes = self.plans(cursor, explain, queries)
+            with transaction.atomic():
+                # until the end of the transaction
+                for setting in ('enable_indexscan', 'enable_indexonlyscan',
+                                'enable_bitmapscan'):
+                    cursor.execute("SET LOCAL %s = off" % setting)
+                without_indexes = self.plans(cursor, explain, queries)
+
+        for name, sqls in queries.items():
+            for i, sql in enumerate(sqls):
+                self.stdout.write("== %s: %s" % (name, sql[:200]))
+                self.stdout.write("-- without indexes")
+                self.stdout.write(without_indexes[(name, i)])
+                self.stdout.write("-- with indexes")
+                self.stdout.write(with_indexes[(name, i)])
+                self.stdout.write("")
+
+    def captured_queries(self):
+        """
+        Yield (name, sql) of every usda_* query of ENDPOINTS and QUERIES.
+        """
+        client = Client()
+        with override_settings(
+                USDAREST_RESPONSE_CACHE={
+                    'BACKEND': 'restful.cache.DummyBackend'},
+                USDAREST_NUTRIENT_MATRIX=False):
+            get_reference_cache().warm()
+            for name, url in ENDPOINTS:
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError("%s returned %d." % (
+                        url, response.status_code))
+                for query in captured.captured_queries:
+                    if 'usda_' in query['sql']:
+                        yield name, query['sql']
+        for name, queryset in QUERIES:
+            with CaptureQueriesContext(connection) as captured:
+                list(queryset())
+            for query in captured.captured_queries:
+                yield name, query['sql']
+
+    def plans(self, cursor, explain, queries):
+        plans = {}
+        for name, sqls in queries.items():
+            for i, sql in enumerate(sqls):
+                cursor.execute(explain + sql)
+                plans[(name, i)] = '\n'.join(
+                    '   ' + row[0] for row in cursor.fetchall())
+        return plans
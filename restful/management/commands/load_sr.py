@@ -0,0 +1,203 @@
+import datetime
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from restful import sr
+from restful.search import has_trigrams
+from restful.models import Release, ReleaseChange
+
+STAGING = '%s_staging'
+
+
+class Command(BaseCommand):
+    """
+    Load the USDA SR ASCII files into the usda_* tables (table layouts in
+    restful/sr.py).
+
+    Every file is streamed through COPY FROM STDIN into a staging table
+    (<table>_staging), serial ids are assigned by the staging table's
+    sequence as rows arrive.  Constraints and indexes are built once the
+    rows are in, then all staging tables replace the live tables in a single
+    transaction so readers see either the old or the new data, never a mix.
+    PostgreSQL only.
+
+    The release named by USDA_RELEASE in settings is loaded into the public
+    schema, other releases (--release SR28) into a schema of their own next
+    to the release being served.  The foods that changed compared to the
+    active release are recorded (models.ReleaseChange), and the release is
+    served once activated (--activate, or `manage.py activate_release`).
+    """
+    help = "Load the USDA SR ASCII files into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path',
+                            default=os.path.join(
+                                os.path.dirname(settings.BASE_DIR),
+                                'database', 'sr27asc'),
+                            help="Directory of the SR ASCII files.")
+        parser.add_argument('--release', default=settings.USDA_RELEASE,
+                            help="Name of the release, i.e. SR28.")
+        parser.add_argument('--release-date', default=None,
+                            help="Publication date of the release, "
+                                 "YYYY-MM-DD.")
+        parser.add_argument('--activate', action='store_true', default=False,
+                            help="Serve the release once loaded.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("load_sr needs PostgreSQL, not %s." %
+                               connection.vendor)
+        path = options['path']
+        for table in sr.TABLES.values():
+            file_path = os.path.join(path, table.file_name)
+            if not os.path.isfile(file_path):
+                raise CommandError("%s not found." % file_path)
+
+        name = options['release']
+        if not re.match(r'^[A-Za-z]\w*$', name):
+            raise CommandError("Invalid release name %r." % name)
+        schema = 'public' if name == settings.USDA_RELEASE else name.lower()
+        release_date = self.release_date(name, options['release_date'])
+
+        # pg_trgm is installed by migration 0005_pg_trgm or an admin
+        indexes = sr.INDEXES
+        if not has_trigrams(connection):
+            indexes = [index for index in sr.INDEXES
+                       if index[0] not in sr.TRIGRAM_INDEXES]
+            self.stdout.write("pg_trgm is not installed, skipping %s (see "
+                              "migration 0005_pg_trgm)." % ", ".join(
+                                  sr.TRIGRAM_INDEXES))
+
+        started = time.time()
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS %s" % schema)
+            total = 0
+            for table in sr.TABLES.values():
+                total += self.load_table(cursor, path, schema, table, indexes)
+            self.swap(cursor, schema, indexes)
+            elapsed = time.time() - started
+            self.stdout.write("Loaded %d rows in %.1fs (%d rows/s)." % (
+                total, elapsed, total / max(elapsed, 0.001)))
+
+            release = self.register(cursor, name, schema, release_date,
+                                    options['activate'])
+
+        if release.active:
+            self.stdout.write("Serving %s, running workers switch within "
+                              "%ss." % (name, getattr(
+                                  settings, 'USDAREST_RELEASE_CHECK_INTERVAL',
+                                  30)))
+
+    def release_date(self, name, value):
+        if value is not None:
+            try:
+                return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid release date %r." % value)
+        release = Release.objects.filter(name=name).first()
+        if release is not None:
+            return release.release_date
+        if name == settings.USDA_RELEASE:
+            return datetime.datetime.strptime(settings.USDA_RELEASE_DATE,
+                                              '%Y-%m-%d').date()
+        raise CommandError("--release-date is required for a new release.")
+
+    def load_table(self, cursor, path, schema, table, indexes):
+        """
+        COPY a file into a new staging table and build its constraints and
+        its indexes among `indexes` (see sr.INDEXES).  Returns the number of
+        rows loaded.
+        """
+        staging = '%s.%s' % (schema, STAGING % table.name)
+        cursor.execute("DROP TABLE IF EXISTS %s" % staging)
+        cursor.execute(sr.create_table_sql(table, staging))
+
+        started = time.time()
+
+        def progress(rows):
+            self.stdout.write("  %s: %d rows (%d rows/s)" % (
+                table.name, rows, rows / max(time.time() - started, 0.001)))
+
+        stream = sr.CopyStream(sr.read_table(path, table), progress=progress)
+        cursor.cursor.copy_expert("COPY %s (%s) FROM STDIN" % (
+            staging, ", ".join(column.name for column in table.columns)),
+            stream)
+        elapsed = time.time() - started
+        self.stdout.write("%s: %d rows in %.1fs (%d rows/s)" % (
+            table.name, stream.rows, elapsed,
+            stream.rows / max(elapsed, 0.001)))
+
+        # constraint and index names are per schema: no schema prefix
+        for suffix, definition in table.constraints:
+            cursor.execute("ALTER TABLE %s ADD CONSTRAINT %s_%s %s" % (
+                staging, STAGING % table.name, suffix, definition))
+        for name, table_name, definition in indexes:
+            if table_name == table.name:
+                cursor.execute("CREATE INDEX %s ON %s %s" % (
+                    STAGING % name, staging, definition))
+        # VACUUM sets the visibility map, which index-only scans need
+        cursor.execute("VACUUM ANALYZE %s" % staging)
+        return stream.rows
+
+    def swap(self, cursor, schema, indexes):
+        """
+        Replace the live tables of a schema by its staging tables.
+        """
+        with transaction.atomic():
+            for table in sr.TABLES.values():
+                staging = '%s.%s' % (schema, STAGING % table.name)
+                cursor.execute("DROP TABLE IF EXISTS %s.%s" % (
+                    schema, table.name))
+                cursor.execute("ALTER TABLE %s RENAME TO %s" % (
+                    staging, table.name))
+                # renaming a constraint's index renames the constraint
+                for suffix, _ in table.constraints:
+                    cursor.execute("ALTER INDEX %s_%s RENAME TO %s_%s" % (
+                        staging, suffix, table.name, suffix))
+                if table.surrogate_id:
+                    cursor.execute("ALTER SEQUENCE %s_id_seq RENAME TO "
+                                   "%s_id_seq" % (staging, table.name))
+            for name, _, _ in indexes:
+                cursor.execute("ALTER INDEX %s.%s RENAME TO %s" % (
+                    schema, STAGING % name, name))
+        self.stdout.write("Swapped in %s." % ", ".join(sr.TABLES))
+
+    def register(self, cursor, name, schema, release_date, activate):
+        """
+        Record the release and the foods that changed since the active
+        release, and activate it if asked to or if nothing is active.
+        """
+        with transaction.atomic():
+            active = Release.objects.filter(active=True).first()
+            release, _ = Release.objects.update_or_create(
+                name=name, defaults={'schema': schema,
+                                     'release_date': release_date})
+            # a release loaded again under the same name gets no changes:
+            # food_version() includes loaded_at, so all of its foods' cache
+            # keys change
+            if active is not None and active.name != name:
+                cursor.execute(sr.reference_changed_sql(active.schema,
+                                                        schema))
+                if cursor.fetchone():
+                    cursor.execute("SELECT food_id FROM %s.usda_food_desc "
+                                   "UNION SELECT food_id FROM "
+                                   "%s.usda_food_desc" % (active.schema,
+                                                          schema))
+                else:
+                    cursor.execute(sr.changed_foods_sql(active.schema,
+                                                        schema))
+                food_ids = [row[0] for row in cursor.fetchall()]
+                release.changes.all().delete()
+                ReleaseChange.objects.bulk_create(
+                    ReleaseChange(release=release, food_id=food_id)
+                    for food_id in food_ids)
+                self.stdout.write("%d foods changed since %s." % (
+                    len(food_ids), active.name))
+            if activate or active is None:
+                release.activate()
+        return release
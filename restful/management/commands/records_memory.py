@@ -0,0 +1,76 @@
+import gc
+import os
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from restful import records, sr
+
+
+def traced(load):
+    """
+    (result of load(), bytes allocated by it and still alive).
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = load()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+class Command(BaseCommand):
+    """
+    Measure, with tracemalloc, the memory held by every row of the usda_*
+    tables as model instances and as the records of restful/records.py.
+
+    Rows are read from the database, or with --path from the SR ASCII files
+    (model instances are then built from the typed rows without saving
+    them, no database needed).  Tables whose file is missing are skipped.
+    """
+    help = "Compare the memory of model instances and records."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None,
+                            help="Directory of the SR ASCII files, instead "
+                                 "of the database.")
+
+    def handle(self, *args, **options):
+        directory = options['path']
+        if directory is not None and not os.path.isdir(directory):
+            raise CommandError("%s is not a directory." % directory)
+
+        self.stdout.write('%-20s %8s %12s %12s %8s' % (
+            'table', 'rows', 'models', 'records', 'ratio'))
+        total_models = total_records = 0
+        for record_type in records.RECORD_TYPES:
+            table = record_type.table
+            model = record_type.model
+            if directory is None:
+                instances, model_size = traced(
+                    lambda: list(model.objects.all()))
+                rows, record_size = traced(
+                    lambda: records.from_values_list(record_type))
+            elif os.path.exists(os.path.join(directory, table.file_name)):
+                names = records.value_names(record_type)
+                instances, model_size = traced(lambda: [
+                    model(**dict(zip(names, row)))
+                    for row in sr.read_table(directory, table, typed=True)])
+                rows, record_size = traced(
+                    lambda: records.from_sr_file(record_type, directory))
+            else:
+                self.stdout.write('%-20s skipped, no %s' % (table.name,
+                                                            table.file_name))
+                continue
+            total_models += model_size
+            total_records += record_size
+            self.stdout.write('%-20s %8d %12d %12d %7.1fx' % (
+                table.name, len(rows), model_size, record_size,
+                model_size / float(max(record_size, 1))))
+            del instances, rows
+        self.stdout.write('%-20s %8s %12d %12d %7.1fx' % (
+            'total', '', total_models, total_records,
+            total_models / float(max(total_records, 1))))
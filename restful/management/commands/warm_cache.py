@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from restful.cache import get_reference_cache
+from restful.release import current_release
+
+
+class Command(BaseCommand):
+    """
+    Pre-load the reference tables of the current release into the reference
+    cache (see restful/cache.py).  Only useful with a shared backend such as
+    DjangoCacheBackend, the default LocalMemoryBackend lives and dies with
+    this command's process.
+    """
+    help = "Load the USDA reference tables into the reference cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invalidate', action='store_true',
+                            default=False,
+                            help="Drop the cached tables of the current "
+                                 "release before loading them again.")
+
+    def handle(self, *args, **options):
+        reference_cache = get_reference_cache()
+        if options['invalidate']:
+            reference_cache.invalidate()
+        reference_cache.warm()
+        self.stdout.write("Cached %s for release %s." % (
+            ", ".join(reference_cache.tables), current_release()))
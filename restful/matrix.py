@@ -0,0 +1,217 @@
+import threading
+from decimal import Decimal
+
+import numpy
+from django.conf import settings
+
+from restful import snapshot
+from restful.models import FoodDesc, Weight, NutrientDef, NutrientData
+from restful.release import current_release, current_version
+
+# in-memory columnar copy of usda_nutrient_data.
+#
+# The API only ever reads nutr_value keyed by (food_id, nutr_id), so the
+# 654,572 row table is held as a dense 8,618 x 150 float32 matrix (about 5 MB)
+# with index maps from food_id and nutr_id to rows and columns.  Missing
+# values are NaN.  Enable it with USDAREST_NUTRIENT_MATRIX = True in settings,
+# the matrix is then loaded at worker startup (see usdarest/wsgi.py) and
+# nutrient calculations are served from it without touching the database.
+# With a snapshot of the release (see snapshot.py) it is filled from the
+# memory-mapped snapshot instead of the database.
+
+
+class NutrientMatrix(object):
+    """
+    Nutrient values per 100 g for every food and nutrient of a release.
+
+    release: the data release the matrix was built from.
+    version: release.current_version() it was built for by get_matrix().
+    food_ids: food_id of each row, sorted.
+    nutr_ids: nutr_id of each column, in SR report order (sr_order).
+    values: float32 array of shape (len(food_ids), len(nutr_ids)), NaN where
+            a food has no value for a nutrient.
+    nutrients: (nutr_desc, units) of each column.
+    weights: {(food_id, seq): grams} of every food measure.
+    food_groups: food_group_id of each row.
+
+    float32 holds the 3 decimal places of nutr_value exactly for values below
+    10,000, larger values (a handful of energy in kJ and vitamin IU values)
+    may be off in the last decimal place.
+    """
+    def __init__(self, release, food_ids, nutr_ids, values, nutrients,
+                 weights, food_groups):
+        self.release = release
+        self.version = None
+        self.food_ids = food_ids
+        self.food_groups = food_groups
+        self.nutr_ids = nutr_ids
+        self.values = values
+        self.nutrients = nutrients
+        self.weights = weights
+        self.food_index = dict((food_id, i) for i, food_id in enumerate(food_ids))
+        self.nutr_index = dict((nutr_id, i) for i, nutr_id in enumerate(nutr_ids))
+
+    @classmethod
+    def build(cls, release, food_ids=None):
+        """
+        Build the matrix from the database.  If food_ids is given only those
+        foods are loaded, i.e. for a one-off calculation over a few foods.
+        """
+        foods = FoodDesc.objects.all()
+        nutrient_data = NutrientData.objects.all()
+        weight = Weight.objects.all()
+        if food_ids is not None:
+            foods = foods.filter(food_id__in=food_ids)
+            nutrient_data = nutrient_data.filter(food_id__in=food_ids)
+            weight = weight.filter(food_id__in=food_ids)
+
+        food_rows = list(foods.order_by('food_id').values_list(
+            'food_id', 'food_group_id'))
+        food_ids = [food_id for food_id, _ in food_rows]
+        food_groups = [food_group_id for _, food_group_id in food_rows]
+        nutrient_defs = list(NutrientDef.objects.order_by(
+            'sr_order', 'nutr_id').values_list('nutr_id', 'nutr_desc', 'units'))
+        nutr_ids = [nutr_id for nutr_id, _, _ in nutrient_defs]
+        nutrients = [(nutr_desc, units) for _, nutr_desc, units in nutrient_defs]
+
+        food_index = dict((food_id, i) for i, food_id in enumerate(food_ids))
+        nutr_index = dict((nutr_id, i) for i, nutr_id in enumerate(nutr_ids))
+        values = numpy.empty((len(food_ids), len(nutr_ids)), dtype=numpy.float32)
+        values.fill(numpy.nan)
+        rows = nutrient_data.values_list(
+            'food_id', 'nutrient_id', 'nutr_value').iterator()
+        for food_id, nutr_id, value in rows:
+            values[food_index[food_id], nutr_index[nutr_id]] = value
+
+        weights = {}
+        for food_id, seq, grams in weight.values_list(
+                'food_id', 'seq', 'grams').iterator():
+            weights[(food_id, seq.strip())] = grams
+
+        return cls(release, food_ids, nutr_ids, values, nutrients, weights,
+                   food_groups)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Build the matrix from a snapshot.Snapshot, without any query.
+        """
+        columns = snapshot.columns
+        food_ids = snapshot.food_ids
+        food_group_ids = snapshot.strings('food_group.food_group_id')
+        food_groups = [food_group_ids[row]
+                       for row in columns['food_desc.food_group_id']]
+        nutr_ids = snapshot.strings('nutrient_def.nutr_id')
+        nutrients = list(zip(snapshot.strings('nutrient_def.nutr_desc'),
+                             snapshot.strings('nutrient_def.units')))
+
+        # nutrient_data rows are sorted by food, see the offsets index
+        offsets = columns['nutrient_data.offsets']
+        rows = numpy.repeat(numpy.arange(len(food_ids)), numpy.diff(offsets))
+        values = numpy.empty((len(food_ids), len(nutr_ids)), dtype=numpy.float32)
+        values.fill(numpy.nan)
+        values[rows, columns['nutrient_data.nutrient_id']] = (
+            columns['nutrient_data.nutr_value'] /
+            10.0 ** snapshot.decimal_places['nutrient_data.nutr_value'])
+
+        weights = {}
+        offsets = columns['weight.offsets']
+        seqs = snapshot.strings('weight.seq')
+        grams = columns['weight.grams']
+        for row, food_id in enumerate(food_ids):
+            for i in range(offsets[row], offsets[row + 1]):
+                weights[(food_id, seqs[i].strip())] = snapshot.decimal(
+                    'weight.grams', grams[i])
+
+        return cls(snapshot.release, food_ids, nutr_ids, values, nutrients,
+                   weights, food_groups)
+
+    def value(self, food_id, nutr_id):
+        """
+        Nutrient value per 100 g as a Decimal, None if missing.
+        """
+        row = self.food_index.get(food_id)
+        col = self.nutr_index.get(nutr_id)
+        if row is None or col is None:
+            return None
+        return _decimal(self.values[row, col])
+
+    def grams(self, food_id, seq_id):
+        """
+        Gram weight of a food measure, None if missing.
+        """
+        return self.weights.get((food_id, seq_id))
+
+    def profile(self, food_id):
+        """
+        (nutr_id, nutr_desc, units, value) of every nutrient a food has a
+        value for, in SR report order.  None if the food does not exist.
+        """
+        row = self.food_index.get(food_id)
+        if row is None:
+            return None
+        values = self.values[row]
+        return [(self.nutr_ids[col],) + self.nutrients[col] +
+                (_decimal(values[col]),)
+                for col in numpy.flatnonzero(~numpy.isnan(values))]
+
+
+def _decimal(value):
+    """
+    Convert a float32 matrix value back to the NUMERIC(10,3) Decimal stored
+    in usda_nutrient_data, None for NaN.
+    """
+    if numpy.isnan(value):
+        return None
+    return Decimal('%.3f' % value)
+
+
+_matrix = None
+_lock = threading.Lock()
+
+
+def is_enabled():
+    """
+    True if nutrient calculations should be served from the matrix.
+    """
+    return getattr(settings, 'USDAREST_NUTRIENT_MATRIX', False)
+
+
+def get_matrix():
+    """
+    Return the NutrientMatrix of the current release, building it (from the
+    release's snapshot if there is one) the first time and rebuilding it
+    whenever the release changes or is loaded again.
+    """
+    global _matrix
+    version = current_version()
+    matrix = _matrix
+    if matrix is None or matrix.version != version:
+        with _lock:
+            if _matrix is None or _matrix.version != version:
+                release_snapshot = snapshot.get_snapshot()
+                if release_snapshot is not None:
+                    matrix = NutrientMatrix.from_snapshot(release_snapshot)
+                else:
+                    matrix = NutrientMatrix.build(current_release())
+                matrix.version = version
+                _matrix = matrix
+            matrix = _matrix
+    return matrix
+
+
+def load():
+    """
+    Load the matrix at worker startup if it is enabled.
+    """
+    if is_enabled():
+        get_matrix()
+
+
+def invalidate():
+    """
+    Drop the matrix, it is rebuilt on next use.
+    """
+    global _matrix
+    with _lock:
+        _matrix = None
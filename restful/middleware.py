@@ -0,0 +1,52 @@
+import time
+
+from restful import profiling, release
+
+# middleware for the API, see MIDDLEWARE_CLASSES in settings.py
+
+
+class ReleaseMiddleware(object):
+    """
+    Switch to a newly activated USDA release between requests and serve
+    each request from a single release (see release.py).
+    """
+    def process_request(self, request):
+        release.check()
+        release.pin()
+
+    def process_response(self, request, response):
+        release.unpin()
+        return response
+
+
+class ProfilingMiddleware(object):
+    """
+    Profile a sample of the requests (USDAREST_PROFILING_SAMPLE_RATE): query
+    count and time, serializer and render time, reported in a Server-Timing
+    header, on the restful.profiling logger and at /metrics (see
+    profiling.py).  Goes first in MIDDLEWARE_CLASSES to time the others too.
+    """
+    def process_request(self, request):
+        if profiling.should_sample():
+            profiling.start()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = profiling.current()
+        if profile is not None:
+            profile.view_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        if not profiling.is_enabled():
+            return response
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        profiling.count(view)
+        profile = profiling.stop()
+        if profile is not None:
+            phases = profile.phases()
+            response['Server-Timing'] = profiling.server_timing(
+                phases, profile.queries)
+            profiling.log(view, request.method, request.get_full_path(),
+                          response.status_code, phases, profile.queries)
+            profiling.observe(view, phases, profile.queries)
+        return response
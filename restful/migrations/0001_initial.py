@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodDesc',
+            fields=[
+                ('food_id', models.CharField(primary_key=True, max_length=5, serialize=False, db_column='food_id')),
+                ('long_desc', models.CharField(verbose_name='long description', max_length=200)),
+                ('short_desc', models.CharField(verbose_name='short description', max_length=200)),
+                ('common_name', models.CharField(max_length=100, blank=True)),
+                ('manufacture_name', models.CharField(max_length=65, blank=True)),
+                ('survey', models.CharField(max_length=1, blank=True)),
+                ('refuse_desc', models.CharField(verbose_name='refuse description', max_length=135, blank=True)),
+                ('refuse', models.DecimalField(blank=True, null=True, max_digits=2, decimal_places=0)),
+                ('scientific_name', models.CharField(max_length=65, blank=True)),
+                ('n_factor', models.DecimalField(blank=True, null=True, max_digits=4, decimal_places=2)),
+                ('pro_factor', models.DecimalField(blank=True, null=True, max_digits=4, decimal_places=2)),
+                ('fat_factor', models.DecimalField(blank=True, null=True, max_digits=4, decimal_places=2)),
+                ('cho_factor', models.DecimalField(blank=True, null=True, max_digits=4, decimal_places=2)),
+            ],
+            options={
+                'verbose_name': 'Food description',
+                'db_table': 'usda_food_desc',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='FoodGroup',
+            fields=[
+                ('food_group_id', models.CharField(primary_key=True, max_length=4, serialize=False)),
+                ('food_group_desc', models.CharField(max_length=60)),
+            ],
+            options={
+                'db_table': 'usda_food_group',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='NutrientData',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('nutr_value', models.DecimalField(verbose_name='value', max_digits=10, decimal_places=3)),
+                ('num_data_pts', models.DecimalField(verbose_name='number data points', max_digits=5, decimal_places=0)),
+                ('std_error', models.DecimalField(verbose_name='standard error', blank=True, null=True, max_digits=8, decimal_places=3)),
+                ('source_code', models.CharField(max_length=2)),
+                ('derivation_code', models.CharField(max_length=4, blank=True)),
+                ('ref_food_id', models.CharField(verbose_name='reference food id', max_length=5, blank=True)),
+                ('fortified', models.CharField(max_length=1, blank=True)),
+                ('number_studies', models.DecimalField(blank=True, null=True, max_digits=2, decimal_places=0)),
+                ('min_value', models.DecimalField(blank=True, null=True, max_digits=10, decimal_places=3)),
+                ('max_value', models.DecimalField(blank=True, null=True, max_digits=10, decimal_places=3)),
+                ('degrees_freedom', models.DecimalField(blank=True, null=True, max_digits=4, decimal_places=0)),
+                ('low_error_bound', models.DecimalField(blank=True, null=True, max_digits=10, decimal_places=3)),
+                ('upper_error_bound', models.DecimalField(blank=True, null=True, max_digits=10, decimal_places=3)),
+                ('statistical_cmt', models.CharField(verbose_name='statistical comment', max_length=10, blank=True)),
+                ('addmod_date', models.CharField(max_length=10, blank=True, null=True)),
+                ('confidence_code', models.CharField(max_length=1, blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'usda_nutrient_data',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='NutrientDef',
+            fields=[
+                ('nutr_id', models.CharField(primary_key=True, max_length=3, serialize=False, db_column='nutr_id')),
+                ('units', models.CharField(max_length=7)),
+                ('tagname', models.CharField(max_length=20, blank=True)),
+                ('nutr_desc', models.CharField(verbose_name='nutrient description', max_length=60)),
+                ('decimal_places', models.CharField(max_length=1)),
+                ('sr_order', models.DecimalField(max_digits=6, decimal_places=0)),
+            ],
+            options={
+                'verbose_name': 'Nutrient definition',
+                'db_table': 'usda_nutrient_def',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Weight',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('seq', models.CharField(max_length=1)),
+                ('amount', models.DecimalField(max_digits=5, decimal_places=3)),
+                ('measure_desc', models.CharField(verbose_name='measure description', max_length=84)),
+                ('grams', models.DecimalField(max_digits=7, decimal_places=1)),
+                ('num_data_pts', models.DecimalField(verbose_name='number data points', blank=True, null=True, max_digits=4, decimal_places=0)),
+                ('std_dev', models.DecimalField(verbose_name='standard deviation', blank=True, null=True, max_digits=7, decimal_places=3)),
+            ],
+            options={
+                'db_table': 'usda_weight',
+                'managed': False,
+            },
+        ),
+    ]
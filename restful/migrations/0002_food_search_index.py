@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# full-text and trigram indexes behind /foods/search, PostgreSQL only (other
+# databases use the in-memory index in restful/search.py).
+#
+# The indexed expression must stay identical to SEARCH_VECTOR in
+# restful/search.py or PostgreSQL won't use the index.  `manage.py load_sr`
+# creates the same indexes (restful/sr.py INDEXES), hence IF NOT EXISTS.
+#
+# The trigram index needs pg_trgm, which may need a superuser to install:
+# it is left out without the extension rather than failing the migration.
+
+CREATE_SQL = [
+    "CREATE INDEX IF NOT EXISTS usda_food_desc_search ON usda_food_desc USING gin (("
+    "setweight(to_tsvector('english', coalesce(long_desc, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(common_name, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(short_desc, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(scientific_name, '')), 'D')))",
+]
+
+# needs the pg_trgm extension, only created if it is installed (see
+# migration 0005_pg_trgm, which installs it when allowed to)
+TRIGRAM_SQL = [
+    "CREATE INDEX IF NOT EXISTS usda_food_desc_long_desc_trgm ON usda_food_desc "
+    "USING gin (long_desc gin_trgm_ops)",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS usda_food_desc_search",
+    "DROP INDEX IF EXISTS usda_food_desc_long_desc_trgm",
+]
+
+
+def has_trigrams(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def run_on_postgresql(statements, trigram_statements=()):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        # on a new database load_sr creates the tables and indexes later
+        tables = schema_editor.connection.introspection.table_names()
+        if 'usda_food_desc' not in tables:
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+        if trigram_statements and has_trigrams(schema_editor):
+            for sql in trigram_statements:
+                schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restful', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(CREATE_SQL, TRIGRAM_SQL),
+                             run_on_postgresql(DROP_SQL)),
+    ]
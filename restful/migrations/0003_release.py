@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restful', '0002_food_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Release',
+            fields=[
+                ('name', models.CharField(primary_key=True, max_length=10, serialize=False)),
+                ('schema', models.CharField(max_length=63)),
+                ('release_date', models.DateField()),
+                ('loaded_at', models.DateTimeField(auto_now=True)),
+                ('active', models.BooleanField(default=False)),
+            ],
+            options={
+                'db_table': 'foodapp_release',
+                'ordering': ('release_date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ReleaseChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('food_id', models.CharField(max_length=5)),
+                ('release', models.ForeignKey(related_name='changes', to='restful.Release')),
+            ],
+            options={
+                'db_table': 'foodapp_release_change',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='releasechange',
+            unique_together=set([('release', 'food_id')]),
+        ),
+    ]
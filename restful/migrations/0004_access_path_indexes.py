@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# indexes for the (food_id, nutr_id) and (food_id, seq) lookups behind
+# FoodSeqNutrientObj and the views, rankings and food group filters,
+# PostgreSQL only.  Covering (INCLUDE) indexes need PostgreSQL 11.
+#
+# Same as restful/sr.py INDEXES, which `manage.py load_sr` creates for new
+# loads.  Index-only scans need an up to date visibility map: load_sr runs
+# VACUUM ANALYZE, on a database loaded before this migration run
+#   VACUUM ANALYZE usda_nutrient_data; VACUUM ANALYZE usda_weight;
+# once.  `manage.py explain_indexes` shows the plans with and without them.
+
+CREATE_SQL = [
+    "CREATE INDEX IF NOT EXISTS usda_nutrient_data_food_nutr_value "
+    "ON usda_nutrient_data (food_id, nutr_id) INCLUDE (nutr_value)",
+    "CREATE INDEX IF NOT EXISTS usda_nutrient_data_nutr_value "
+    "ON usda_nutrient_data (nutr_id, nutr_value)",
+    "CREATE INDEX IF NOT EXISTS usda_weight_food_seq_grams "
+    "ON usda_weight (food_id, seq) INCLUDE (grams)",
+    "CREATE INDEX IF NOT EXISTS usda_food_desc_food_group "
+    "ON usda_food_desc (food_group_id)",
+    "ANALYZE usda_nutrient_data",
+    "ANALYZE usda_weight",
+    "ANALYZE usda_food_desc",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS usda_nutrient_data_food_nutr_value",
+    "DROP INDEX IF EXISTS usda_nutrient_data_nutr_value",
+    "DROP INDEX IF EXISTS usda_weight_food_seq_grams",
+    "DROP INDEX IF EXISTS usda_food_desc_food_group",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        # on a new database load_sr creates the tables and indexes later
+        tables = schema_editor.connection.introspection.table_names()
+        if 'usda_nutrient_data' not in tables:
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restful', '0003_release'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(CREATE_SQL),
+                             run_on_postgresql(DROP_SQL)),
+    ]
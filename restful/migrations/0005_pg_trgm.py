@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import DatabaseError, migrations, transaction
+
+# the pg_trgm extension behind the trigram ranking and typo tolerant
+# fallback of /foods/search, and the usda_food_desc_long_desc_trgm index
+# (restful/sr.py INDEXES), PostgreSQL only.
+#
+# CREATE EXTENSION needs a superuser before PostgreSQL 13.  If the
+# database user may not create it, this migration leaves it to an admin,
+# once per database:
+#   CREATE EXTENSION pg_trgm;
+# Until then search only uses the full-text index and neither the
+# migrations nor `manage.py load_sr` build the trigram index; load_sr
+# builds it on its next run after the extension is installed.
+
+
+def create_extension(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        # a savepoint, a failed statement would abort the migration
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError:
+        return
+    # the trigram index migration 0002 skipped without the extension
+    tables = schema_editor.connection.introspection.table_names()
+    if 'usda_food_desc' in tables:
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS usda_food_desc_long_desc_trgm "
+            "ON usda_food_desc USING gin (long_desc gin_trgm_ops)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restful', '0004_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_extension, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,18 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models.query import QuerySet
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, \
+    quote_etag
+from rest_framework.response import Response
+
+from restful.cache import get_response_cache
+from restful.encoders import JSONRenderer, RawJSON, RowEncoder
+from restful.release import current_version, food_version, \
+    release_timestamp
 
 # used in views.py for urls with multiple named regex patterns
 #   i.e. /foods/<food_id>/seqs/<seq_id>/nutrients/<nutr_id>
@@ -15,4 +29,162 @@ class MultipleFieldLookupMixin(object):
         filter = {}
         for field in self.lookup_fields:
             filter[field] = self.kwargs[field]
-        return get_object_or_404(queryset, **filter)  # Lookup the object
\ No newline at end of file
+        return get_object_or_404(queryset, **filter)  # Lookup the object
+
+
+# used in views.py for the read-only endpoints.
+#
+# The API only serves data of one USDA release, so responses only change
+# when the release does.  Responses get a strong ETag derived from the
+# release, the URL and the Accept header, Last-Modified (the release date)
+# and Cache-Control headers, and conditional GETs are answered with a 304.
+# The 304 is only sent for a response that exists: one in the response
+# cache (answered without running the view) or a 200 the view just
+# returned.
+#
+# Responses about a single food use the release the food last changed in
+# instead (release.food_version), so their ETags and cached copies survive
+# new releases that leave the food alone.  Both include when the release
+# was loaded, so reloading a release under the same name changes them.
+class CachedResponseMixin(object):
+    """
+    Apply this mixin to a read-only APIView to add ETag, Last-Modified and
+    Cache-Control headers and conditional GET support.  With
+    `cache_rendered_response = True` rendered JSON responses are also kept
+    in the response cache (see cache.py), so repeat hits to the same URL
+    skip the database and serializers entirely.
+    """
+    cache_rendered_response = False
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super(CachedResponseMixin, self).dispatch(request, *args,
+                                                             **kwargs)
+
+        version = self.data_version()
+        key = self.response_key(request, version)
+        etag = quote_etag(key)
+        last_modified = release_timestamp(version)
+        response = None
+        if self.cache_rendered_response:
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+        if response is None:
+            response = super(CachedResponseMixin, self).dispatch(
+                request, *args, **kwargs)
+            if response.status_code != 200 or not self.is_json(response):
+                # errors and the browsable API (which contains a
+                # per-request csrf token) get no validators and are not
+                # cached
+                return response
+            if self.cache_rendered_response:
+                response.render()
+                get_response_cache().set(
+                    key, (response.content, response['Content-Type']))
+        # only a response known to exist (cached or just rendered) is
+        # answered with a 304, so a 404 never becomes a 304
+        if self.not_modified(request, key, last_modified):
+            response = HttpResponseNotModified()
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=%d' % getattr(
+            settings, 'USDAREST_CACHE_MAX_AGE', 0)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def data_version(self):
+        """
+        Version of the release the response's data last changed in (see
+        release.current_version()).
+        """
+        if 'food_id' in self.kwargs:
+            return food_version(self.kwargs['food_id'])
+        return current_version()
+
+    def response_key(self, request, version):
+        """
+        Key identifying a response: the same for the same data version, URL
+        (including the query string, i.e. ?format=) and Accept header.
+        """
+        digest = hashlib.sha1(('%s %s' % (
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''))).encode('utf-8')).hexdigest()
+        return '%s-%s' % (version, digest)
+
+    def not_modified(self, request, key, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return key in etags or '*' in etags
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        return (if_modified_since is not None and
+                last_modified <= if_modified_since)
+
+    def is_json(self, response):
+        renderer = getattr(response, 'accepted_renderer', None)
+        return renderer is not None and renderer.format == 'json'
+
+
+# used in views.py for the list and detail endpoints of the usda_* tables.
+#
+# JSON responses are built by a RowEncoder (see encoders.py) from
+# values_list() rows instead of model instances and DRF serializer data.
+# Other formats (the browsable API), indented JSON and everything with
+# USDAREST_FAST_SERIALIZERS = False go through the serializer as usual.
+class FastSerializerMixin(object):
+    """
+    Apply this mixin to a ListAPIView or RetrieveAPIView whose serializer
+    only has char, decimal and primary key fields.  Querysets are read with
+    values_list(), lists of objects or dicts (reference cache, search) are
+    encoded as they are.
+    """
+    def use_fast_path(self, request):
+        if not getattr(settings, 'USDAREST_FAST_SERIALIZERS', True):
+            return False
+        renderer = request.accepted_renderer
+        return (isinstance(renderer, JSONRenderer) and renderer.get_indent(
+            request.accepted_media_type, {}) is None)
+
+    def get_encoder(self):
+        return RowEncoder.for_serializer(self.get_serializer_class())
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_path(request):
+            return super(FastSerializerMixin, self).list(request, *args,
+                                                         **kwargs)
+        encoder = self.get_encoder()
+        queryset = self.filter_queryset(self.get_queryset())
+        if isinstance(queryset, QuerySet):
+            # tells the paginator how to find its key in the rows
+            self.row_fields = encoder.sources
+            queryset = queryset.values_list(*encoder.sources)
+            to_row = None
+        else:
+            to_row = encoder.row
+
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        if to_row is not None:
+            rows = [to_row(obj) for obj in rows]
+        data = RawJSON(encoder.encode_many(rows))
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_fast_path(request):
+            return super(FastSerializerMixin, self).retrieve(request, *args,
+                                                             **kwargs)
+        encoder = self.get_encoder()
+        return Response(RawJSON(encoder.encode(self.get_row(encoder))))
+
+    def get_row(self, encoder):
+        """
+        The row tuple of the object to retrieve.  Override to read it with
+        values_list(), by default it comes from get_object().
+        """
+        return encoder.row(self.get_object())
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 # a subset of the USDA Food and Nutrition Database tables
 #
@@ -255,3 +255,59 @@ class NutrientDef(models.Model):
         db_table = 'usda_nutrient_def'
         managed = False
         verbose_name = 'Nutrient definition'
+
+
+class Release(models.Model):
+    """
+    A USDA data release (SR27, SR28, ...) loaded with `manage.py load_sr`.
+
+    The release named by USDA_RELEASE in settings is kept in the public
+    schema, every other release in a PostgreSQL schema of its own, so
+    releases can be loaded side by side and switched between (see
+    release.py).
+
+    name: i.e. "SR28"
+    schema: PostgreSQL schema holding the release's usda_* tables.
+    release_date: publication date, used for Last-Modified headers.
+    loaded_at: when load_sr last loaded the release.
+    active: True for the one release the API serves.
+    """
+    name = models.CharField(primary_key=True, max_length=10)
+    schema = models.CharField(max_length=63)
+    release_date = models.DateField()
+    loaded_at = models.DateTimeField(auto_now=True)
+    active = models.BooleanField(default=False)
+
+    def __str__(self):
+        return self.name
+
+    def activate(self):
+        """
+        Make this the release the API serves, running workers switch to it
+        within USDAREST_RELEASE_CHECK_INTERVAL seconds.
+        """
+        with transaction.atomic():
+            Release.objects.exclude(pk=self.pk).update(active=False)
+            Release.objects.filter(pk=self.pk).update(active=True)
+        self.active = True
+
+    class Meta:
+        db_table = 'foodapp_release'
+        ordering = ('release_date',)
+
+
+class ReleaseChange(models.Model):
+    """
+    A food whose data changed in a release compared to the release active
+    when it was loaded: its nutrient data (by addmod_date), description or
+    weights differ, or it was added or removed.
+
+    Cached responses about foods that did not change stay valid across
+    releases (see release.food_version).
+    """
+    release = models.ForeignKey(Release, related_name='changes')
+    food_id = models.CharField(max_length=5)
+
+    class Meta:
+        db_table = 'foodapp_release_change'
+        unique_together = ('release', 'food_id')
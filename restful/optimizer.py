@@ -0,0 +1,234 @@
+import numpy
+
+from restful.cache import get_reference_cache
+from restful.filtering import nutrient_columns
+from restful.models import FoodDesc
+
+# daily meal plans: the foods that meet nutrient targets at the least total
+# mass or energy, as a linear program.
+#
+# The variables are the amounts of the candidate foods in units of 100 g,
+# each between 0 and max_grams.  Every target is a row of the foods' values
+# per 100 g of a nutrient with a minimum and/or a maximum, read with
+# filtering.nutrient_columns() (the nutrient matrix, or one query).  The
+# candidates are the foods with a value for every targeted nutrient (a
+# missing value is unknown, not 0) and at least one measure in the Weight
+# table, so the plan can be given in measures.
+#
+# The program is solved by linprog() below, a bounded variable revised
+# simplex method on numpy arrays.  With a handful of targets the basis is a
+# few rows and an iteration is one pass over the food columns, the whole
+# catalogue takes milliseconds.
+
+OBJECTIVES = ('mass', 'energy')
+
+# kcal, the 'energy' objective
+ENERGY = '208'
+
+# nutrient values are 3 decimals, smaller amounts of a food are noise
+MIN_GRAMS = 0.05
+
+
+class Infeasible(ValueError):
+    """
+    No solution meets the constraints.
+    """
+
+
+def _simplex(A, b, c, upper, x, basis, tol=1e-9, max_iter=10000,
+             refactor=50):
+    """
+    Minimize c.x subject to A.x = b, 0 <= x <= upper from a feasible basis
+    (column of each row) and x (non-basic variables at one of their bounds).
+    x and basis are updated in place.
+    """
+    is_basic = numpy.zeros(len(c), dtype=bool)
+    is_basic[basis] = True
+    at_upper = ~is_basic & (x > 0)
+    movable = upper > 0
+    degenerate = 0
+    for iteration in range(max_iter):
+        if iteration % refactor == 0:
+            # fresh inverse, the product form updates lose precision
+            inverse = numpy.linalg.inv(A[:, basis])
+            nonbasic = ~is_basic
+            x[basis] = inverse.dot(b - A[:, nonbasic].dot(x[nonbasic]))
+
+        # reduced costs, improving directions are up from the lower bound
+        # and down from the upper bound
+        reduced = c - c[basis].dot(inverse).dot(A)
+        candidates = ~is_basic & movable & numpy.where(
+            at_upper, reduced > tol, reduced < -tol)
+        if not candidates.any():
+            return x
+        if degenerate > 50:
+            # Bland's rule against cycling
+            j = numpy.flatnonzero(candidates)[0]
+        else:
+            j = numpy.argmax(numpy.where(candidates, abs(reduced), 0))
+        direction = -1.0 if at_upper[j] else 1.0
+
+        # ratio test: the first basic variable to reach one of its bounds
+        delta = direction * inverse.dot(A[:, j])
+        values = x[basis]
+        ratios = numpy.empty(len(basis))
+        ratios.fill(numpy.inf)
+        down = delta > tol
+        up = delta < -tol
+        ratios[down] = values[down] / delta[down]
+        ratios[up] = (upper[basis][up] - values[up]) / -delta[up]
+        ratios = numpy.maximum(ratios, 0)
+        r = numpy.argmin(ratios)
+        step = ratios[r]
+        degenerate = degenerate + 1 if step <= tol else 0
+
+        if upper[j] <= step:
+            # j reaches its other bound first
+            x[basis] -= upper[j] * delta
+            x[j] = upper[j] if direction > 0 else 0
+            at_upper[j] = direction > 0
+            continue
+        if not numpy.isfinite(step):
+            raise ValueError("The linear program is unbounded.")
+
+        x[basis] -= step * delta
+        x[j] += direction * step
+        leaving = basis[r]
+        at_upper[leaving] = delta[r] < 0
+        x[leaving] = upper[leaving] if at_upper[leaving] else 0
+        is_basic[leaving] = False
+        is_basic[j] = True
+        at_upper[j] = False
+        basis[r] = j
+
+        column = direction * delta
+        inverse[r] /= column[r]
+        column[r] = 0
+        inverse -= numpy.outer(column, inverse[r])
+    raise ValueError("The simplex method did not converge.")
+
+
+def linprog(c, A_ub, b_ub, upper):
+    """
+    Minimize c.x subject to A_ub.x <= b_ub and 0 <= x <= upper.  Raises
+    Infeasible if there is no such x.
+    """
+    m, n = A_ub.shape
+    # rows scaled to their largest coefficient, so the tolerances mean the
+    # same for grams and micrograms
+    scale = abs(A_ub).max(axis=1) if n else numpy.ones(m)
+    scale[scale == 0] = 1
+    sign = numpy.where(b_ub < 0, -1.0, 1.0)
+    rhs = b_ub / scale * sign
+
+    # A.x + slack = b, rows with b < 0 negated and started from an
+    # artificial variable that phase 1 drives to 0
+    artificial = numpy.flatnonzero(sign < 0)
+    k = len(artificial)
+    A = numpy.zeros((m, n + m + k))
+    A[:, :n] = A_ub / (scale * sign)[:, numpy.newaxis]
+    A[:, n:n + m] = numpy.diag(sign)
+    A[artificial, n + m + numpy.arange(k)] = 1
+    bounds = numpy.concatenate([upper, numpy.repeat(numpy.inf, m + k)])
+    basis = numpy.arange(n, n + m)
+    basis[artificial] = n + m + numpy.arange(k)
+    x = numpy.zeros(n + m + k)
+
+    if k:
+        cost = numpy.zeros(n + m + k)
+        cost[n + m:] = 1
+        _simplex(A, rhs, cost, bounds, x, basis)
+        if x[n + m:].sum() > 1e-7:
+            raise Infeasible("No solution meets the constraints.")
+        bounds[n + m:] = 0
+        x[n + m:] = 0
+    _simplex(A, rhs, numpy.concatenate([c, numpy.zeros(m + k)]), bounds, x,
+             basis)
+    return numpy.clip(x[:n], 0, upper)
+
+
+def optimize_diet(targets, objective='mass', food_groups=None, exclude=(),
+                  max_grams=500):
+    """
+    The plan of least total grams (or kcal) that meets the targets.
+
+    targets: list of (nutr_id, minimum, maximum) tuples, minimum or maximum
+             may be None.
+    objective: 'mass' or 'energy'.
+    food_groups: only foods of these food groups (default: all).
+    exclude: food_ids never to use.
+    max_grams: most grams of any one food.
+
+    Returns a dict with the total "grams" and "energy", the totals of the
+    targeted "nutrients" and the "foods" of the plan, each a quantity of its
+    default measure (lowest seq), the form of /recipes/compute ingredients.
+    Raises Infeasible if no combination of the candidate foods meets the
+    targets.
+    """
+    nutr_ids = sorted(set(nutr_id for nutr_id, _, _ in targets) |
+                      set([ENERGY]))
+    food_ids, values, grams = nutrient_columns(nutr_ids, food_groups)
+    excluded = set(exclude)
+    energy = values[:, nutr_ids.index(ENERGY)]
+    if objective == 'energy':
+        candidates = ~numpy.isnan(energy)
+    else:
+        candidates = numpy.ones(len(food_ids), dtype=bool)
+    for nutr_id, _, _ in targets:
+        candidates &= ~numpy.isnan(values[:, nutr_ids.index(nutr_id)])
+    candidates &= ~numpy.isnan(grams)
+    candidates &= numpy.array([food_id not in excluded
+                               for food_id in food_ids], dtype=bool)
+    rows = numpy.flatnonzero(candidates)
+    values = values[rows]
+
+    A_ub = []
+    b_ub = []
+    for nutr_id, minimum, maximum in targets:
+        column = values[:, nutr_ids.index(nutr_id)]
+        if minimum is not None:
+            A_ub.append(-column)
+            b_ub.append(-minimum)
+        if maximum is not None:
+            A_ub.append(column)
+            b_ub.append(maximum)
+    if objective == 'energy':
+        c = energy[rows]
+    else:
+        c = numpy.ones(len(rows))
+    amounts = linprog(c, numpy.array(A_ub).reshape(len(A_ub), len(rows)),
+                      numpy.array(b_ub, dtype=numpy.float64),
+                      numpy.repeat(max_grams / 100.0, len(rows)))
+
+    chosen = [(food_ids[row], amount * 100)
+              for row, amount in zip(rows, amounts)
+              if amount * 100 >= MIN_GRAMS]
+    names = dict(FoodDesc.objects.filter(
+        food_id__in=[food_id for food_id, _ in chosen]).values_list(
+        'food_id', 'long_desc'))
+    reference_cache = get_reference_cache()
+    foods = []
+    for food_id, food_grams in chosen:
+        weight = min(reference_cache.weights(food_id),
+                     key=lambda w: int(w.seq))
+        foods.append({"food_id": food_id,
+                      "long_desc": names.get(food_id),
+                      "seq_id": weight.seq.strip(),
+                      "measure_desc": weight.measure_desc,
+                      "quantity": round(food_grams / float(weight.grams), 2),
+                      "grams": round(food_grams, 1)})
+
+    nutrients = []
+    for nutr_id in sorted(set(nutr_id for nutr_id, _, _ in targets)):
+        nutrient = reference_cache.nutrient_def(nutr_id)
+        nutrients.append({
+            "nutr_id": nutr_id,
+            "nutr_desc": nutrient.nutr_desc,
+            "units": nutrient.units,
+            "value": round(float(
+                values[:, nutr_ids.index(nutr_id)].dot(amounts)), 3)})
+    total_energy = numpy.nan_to_num(energy[rows]).dot(amounts)
+    return {"grams": round(float(amounts.sum() * 100), 1),
+            "energy": round(float(total_energy), 1),
+            "nutrients": nutrients,
+            "foods": foods}
@@ -0,0 +1,133 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_right
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from restful.encoders import RawJSON, encode_value
+
+# keyset (cursor) pagination for the long list endpoints.
+#
+# Page number pagination needs a COUNT(*) and an OFFSET that grows with the
+# page number.  Keyset pagination remembers the last primary key of a page
+# and asks for the rows after it, which is a primary key index range scan no
+# matter how deep the page is.
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate a queryset, or a list sorted on the key, on its primary key.
+
+    ?cursor=<opaque cursor from the "next" link>
+    ?page_size=<1 to max_page_size, default page_size>
+    ?count=true to include the total number of results (an extra query).
+
+    The view may set `pagination_key` to paginate on a field other than the
+    model's primary key, and `pagination_keys` to the sorted keys of all
+    results if it has them.
+    """
+    page_size = 30
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        after = self.decode_cursor(request)
+        self.count = None
+
+        key = getattr(view, 'pagination_key', None)
+        keys = getattr(view, 'pagination_keys', None)
+        if keys is not None:
+            # the view found the sorted keys of the results (i.e. the food
+            # filter), only the page's rows are read
+            key = key or queryset.model._meta.pk.attname
+            start = 0 if after is None else bisect_right(keys, after)
+            if self.include_count(request):
+                self.count = len(keys)
+            results = list(queryset.filter(**{
+                key + '__in': keys[start:start + self.page_size + 1]
+            }).order_by(key))
+        elif isinstance(queryset, list):
+            if key is None and queryset:
+                key = queryset[0]._meta.pk.attname
+            keys = [getattr(obj, key) for obj in queryset]
+            start = 0 if after is None else bisect_right(keys, after)
+            results = queryset[start:start + self.page_size + 1]
+            if self.include_count(request):
+                self.count = len(queryset)
+        else:
+            key = key or queryset.model._meta.pk.attname
+            if self.include_count(request):
+                self.count = queryset.count()
+            queryset = queryset.order_by(key)
+            if after is not None:
+                queryset = queryset.filter(**{key + '__gt': after})
+            results = list(queryset[:self.page_size + 1])
+
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        self.next_key = None
+        if self.has_next:
+            last = self.page[-1]
+            if isinstance(last, tuple):
+                # values_list() rows of mixins.FastSerializerMixin
+                self.next_key = last[view.row_fields.index(key)]
+            else:
+                self.next_key = getattr(last, key)
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        if isinstance(data, RawJSON):
+            return Response(RawJSON(''.join(
+                ('{' if i == 0 else ',') + encode_value(name) + ':' +
+                encode_value(value) for i, (name, value)
+                in enumerate(response.items())) +
+                ',"results":' + data.text + '}'))
+        response['results'] = data
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def include_count(self, request):
+        return request.query_params.get(
+            self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            key = urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8')
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        # b64decode skips characters outside of the alphabet
+        if not key or self.encode_cursor(key) != encoded:
+            raise NotFound(self.invalid_cursor_message)
+        return key
+
+    def encode_cursor(self, key):
+        return urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.next_key))
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import connection
+
+# server-side prepared statements for the hottest fixed queries.
+#
+# A query run through execute() is PREPAREd once per database connection
+# and then only EXECUTEd, so PostgreSQL skips parsing and planning it.
+# That only pays off when connections live longer than a request, so it is
+# used with the pooled backend (restful/backends/pooled), whose connections
+# remember what was prepared on them.  Everywhere else is_enabled() is
+# False and callers use the ORM.
+#
+# PostgreSQL re-plans a prepared statement when search_path or the tables
+# it reads change, so release switches and load_sr are safe.
+
+
+def is_enabled():
+    """
+    True if the default connection supports prepared statements.
+    """
+    if connection.vendor != 'postgresql' or \
+            not getattr(settings, 'USDAREST_PREPARED_STATEMENTS', True):
+        return False
+    connection.ensure_connection()
+    return hasattr(connection.connection, 'prepared')
+
+
+def execute(name, sql, params):
+    """
+    Run sql (with $1, $2, ... parameters) as the prepared statement `name`
+    and return its rows.
+    """
+    prepared = connection.connection.prepared
+    with connection.cursor() as cursor:
+        if name not in prepared:
+            cursor.execute('PREPARE %s AS %s' % (name, sql))
+            prepared.add(name)
+        cursor.execute('EXECUTE %s (%s)' % (
+            name, ', '.join(['%s'] * len(params))), params)
+        return cursor.fetchall()
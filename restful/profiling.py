@@ -0,0 +1,255 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+
+# request profiling, see ProfilingMiddleware in middleware.py.
+#
+# A sampled request (USDAREST_PROFILING_SAMPLE_RATE) gets a Profile that
+# collects, for this request only:
+#   db:        number and time of its SQL queries, timed by a cursor wrapper
+#              installed on its database connections
+#   render:    time spent in restful.encoders.JSONRenderer
+#   serialize: the rest of the view's time, i.e. serializers, the *Obj
+#              calculations and the row encoders
+#   total:     from the first to the last middleware
+# which end up in the Server-Timing header of the response, a JSON log line
+# on the "restful.profiling" logger and the histograms served at /metrics.
+#
+# Metrics are kept per process: every gunicorn worker has its own.  Requests
+# that are not sampled only pay for a random() call and are counted in
+# usdarest_requests_total.
+
+logger = logging.getLogger('restful.profiling')
+
+_local = threading.local()
+_lock = threading.Lock()
+
+# upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PHASES = ('db', 'serialize', 'render', 'total')
+
+
+def sample_rate():
+    return getattr(settings, 'USDAREST_PROFILING_SAMPLE_RATE', 0)
+
+
+def is_enabled():
+    return sample_rate() > 0
+
+
+def should_sample():
+    rate = sample_rate()
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class Profile(object):
+    """
+    Timings of one request, in seconds.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+
+    def phases(self):
+        """
+        Dict of phase name: seconds.
+        """
+        end = time.perf_counter()
+        # the view's time includes rendering: DRF responses are rendered
+        # before the response middleware runs
+        view = end - self.view_start if self.view_start is not None else 0.0
+        return {'db': self.db, 'render': self.render,
+                'serialize': max(0.0, view - self.db - self.render),
+                'total': end - self.start}
+
+
+def current():
+    """
+    The Profile of the request being handled, or None if it isn't sampled.
+    """
+    return getattr(_local, 'profile', None)
+
+
+def start():
+    profile = _local.profile = Profile()
+    for conn in connections.all():
+        # instance attributes shadowing the methods, removed by stop()
+        conn.make_cursor = conn.make_debug_cursor = \
+            lambda cursor, conn=conn: _TimedCursor(cursor, conn)
+    return profile
+
+
+def stop():
+    profile = current()
+    _local.profile = None
+    for conn in connections.all():
+        conn.__dict__.pop('make_cursor', None)
+        conn.__dict__.pop('make_debug_cursor', None)
+    return profile
+
+
+@contextmanager
+def timer(name):
+    """
+    Add the time spent in the block to a phase of the current profile.
+    """
+    profile = current()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(profile, name,
+                getattr(profile, name) + time.perf_counter() - start)
+
+
+@contextmanager
+def _query():
+    profile = current()
+    if profile is not None:
+        profile.queries += 1
+    with timer('db'):
+        yield
+
+
+class _TimedCursor(CursorWrapper):
+    def execute(self, sql, params=None):
+        with _query():
+            return super(_TimedCursor, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with _query():
+            return super(_TimedCursor, self).executemany(sql, param_list)
+
+    def callproc(self, procname, params=None):
+        with _query():
+            return super(_TimedCursor, self).callproc(procname, params)
+
+
+def server_timing(phases, queries):
+    """
+    Server-Timing header value, durations in milliseconds.
+    """
+    return ', '.join(
+        '%s;dur=%.3f%s' % (name, phases[name] * 1000,
+                           ';desc="%d queries"' % queries
+                           if name == 'db' else '')
+        for name in PHASES)
+
+
+def log(view, method, path, status, phases, queries):
+    record = {'view': view, 'method': method, 'path': path,
+              'status': status, 'queries': queries}
+    for name in PHASES:
+        record[name + '_ms'] = round(phases[name] * 1000, 3)
+    logger.info(json.dumps(record, sort_keys=True))
+
+
+class Histogram(object):
+    """
+    Prometheus style histogram: cumulative bucket counts, sum and count.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+# view -> count and (view, phase) -> Histogram, phase 'queries' counts
+# queries instead of seconds
+_requests = {}
+_histograms = {}
+
+
+def count(view):
+    with _lock:
+        _requests[view] = _requests.get(view, 0) + 1
+
+
+def observe(view, phases, queries):
+    with _lock:
+        for name in PHASES:
+            histogram = _histograms.get((view, name))
+            if histogram is None:
+                histogram = _histograms[(view, name)] = Histogram(
+                    SECONDS_BUCKETS)
+            histogram.observe(phases[name])
+        histogram = _histograms.get((view, 'queries'))
+        if histogram is None:
+            histogram = _histograms[(view, 'queries')] = Histogram(
+                QUERIES_BUCKETS)
+        histogram.observe(queries)
+
+
+def reset():
+    with _lock:
+        _requests.clear()
+        _histograms.clear()
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (key, value.replace('"', '\\"'))
+                             for key, value in sorted(labels.items()))
+
+
+def _histogram_lines(name, histogram, **labels):
+    for bound, value in zip(histogram.buckets, histogram.counts):
+        yield '%s_bucket%s %d' % (name, _labels(le=repr(float(bound)),
+                                               **labels), value)
+    yield '%s_bucket%s %d' % (name, _labels(le='+Inf', **labels),
+                              histogram.count)
+    yield '%s_sum%s %r' % (name, _labels(**labels), float(histogram.sum))
+    yield '%s_count%s %d' % (name, _labels(**labels), histogram.count)
+
+
+def metrics():
+    """
+    The metrics in the Prometheus text format.
+    """
+    lines = ['# HELP usdarest_requests_total Requests handled, by view.',
+             '# TYPE usdarest_requests_total counter']
+    with _lock:
+        requests = sorted(_requests.items())
+        histograms = sorted(_histograms.items())
+    for view, value in requests:
+        lines.append('usdarest_requests_total%s %d' % (_labels(view=view),
+                                                       value))
+    lines.extend([
+        '# HELP usdarest_request_seconds Time of sampled requests, by view '
+        'and phase.',
+        '# TYPE usdarest_request_seconds histogram'])
+    for (view, phase), histogram in histograms:
+        if phase != 'queries':
+            lines.extend(_histogram_lines('usdarest_request_seconds',
+                                          histogram, view=view, phase=phase))
+    lines.extend([
+        '# HELP usdarest_request_queries SQL queries of sampled requests, '
+        'by view.',
+        '# TYPE usdarest_request_queries histogram'])
+    for (view, phase), histogram in histograms:
+        if phase == 'queries':
+            lines.extend(_histogram_lines('usdarest_request_queries',
+                                          histogram, view=view))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,189 @@
+import threading
+
+import numpy
+from django.db import connection
+
+from restful import matrix
+from restful.calculations import scale
+from restful.models import NutrientData
+
+# "top foods by nutrient" rankings, i.e. the 50 foods highest in protein.
+#
+# Sorting 654,572 nutrient data rows for every such query is avoided by
+# precomputing, once per nutrient matrix (see matrix.py), the order of the
+# foods for every nutrient: per 100 g and per default measure, overall and
+# within each food group.  A query then only slices the first k entries.
+#
+# The default measure of a food is its first Weight (lowest seq), the same
+# measure /foods/<food_id>/seqs lists first.
+#
+# The indexes are only built when the nutrient matrix is enabled, at worker
+# startup.  Otherwise rankings are read from the database with the
+# usda_nutrient_data_nutr_value (nutr_id, nutr_value) index, so no request
+# builds the matrix and blocks its worker.
+
+BASES = ('100g', 'measure')
+
+
+def default_measures(nutrient_matrix):
+    """
+    (seq_ids, grams) of the default measure of each row of the matrix: seq_id
+    is None and grams NaN for foods without any measure.
+    """
+    seqs = {}
+    for food_id, seq in nutrient_matrix.weights:
+        if food_id not in seqs or int(seq) < int(seqs[food_id]):
+            seqs[food_id] = seq
+    seq_ids = [seqs.get(food_id) for food_id in nutrient_matrix.food_ids]
+    grams = numpy.array([float(nutrient_matrix.weights[(food_id, seq)])
+                         if seq is not None else numpy.nan
+                         for food_id, seq in zip(nutrient_matrix.food_ids,
+                                                 seq_ids)])
+    return seq_ids, grams
+
+
+def _orders(values, rows=None):
+    """
+    For every column of values, the row numbers of its non-NaN values from
+    highest to lowest value.  rows: a boolean mask to only rank some rows.
+    """
+    # argsort puts NaN last; mergesort keeps ties in food_id order
+    order = numpy.argsort(-values, axis=0, kind='mergesort').astype(numpy.int32)
+    counts = (~numpy.isnan(values)).sum(axis=0)
+    orders = []
+    for col in range(values.shape[1]):
+        ranked = order[:counts[col], col]
+        if rows is not None:
+            ranked = ranked[rows[ranked]]
+        orders.append(ranked)
+    return orders
+
+
+class RankingIndex(object):
+    """
+    Precomputed per-nutrient food orders of a NutrientMatrix.
+
+    seq_ids, grams: the default measure of each row, see default_measures().
+    orders: {(basis, food_group_id or None): [row numbers per column]}
+    """
+    def __init__(self, nutrient_matrix):
+        self.matrix = nutrient_matrix
+        self.seq_ids, self.grams = default_measures(nutrient_matrix)
+        per_100g = nutrient_matrix.values.astype(numpy.float64)
+        per_measure = per_100g * (self.grams / 100)[:, numpy.newaxis]
+
+        food_groups = numpy.array(nutrient_matrix.food_groups)
+        self.orders = {}
+        for basis, values in zip(BASES, (per_100g, per_measure)):
+            self.orders[(basis, None)] = _orders(values)
+            for food_group in set(nutrient_matrix.food_groups):
+                self.orders[(basis, food_group)] = _orders(
+                    values, rows=food_groups == food_group)
+
+    def top(self, nutr_id, basis='100g', food_group=None, limit=50,
+            ascending=False):
+        """
+        The `limit` foods highest (or lowest) in a nutrient as a list of
+        (food_id, seq_id, grams, value) tuples.  seq_id and grams are None
+        for the 100g basis.  Foods without a value are left out.
+        """
+        col = self.matrix.nutr_index.get(nutr_id)
+        orders = self.orders.get((basis, food_group))
+        if col is None or orders is None:
+            return []
+        ranked = orders[col]
+        if ascending:
+            ranked = ranked[::-1]
+
+        results = []
+        for row in ranked[:limit]:
+            food_id = self.matrix.food_ids[row]
+            value = self.matrix.value(food_id, nutr_id)
+            if basis == '100g':
+                results.append((food_id, None, None, value))
+            else:
+                seq_id = self.seq_ids[row]
+                grams = self.matrix.grams(food_id, seq_id)
+                results.append((food_id, seq_id, grams, scale(value, grams)))
+        return results
+
+
+def top_foods(nutr_id, basis='100g', food_group=None, limit=50,
+              ascending=False):
+    """
+    RankingIndex.top() of the current release: from the precomputed index
+    if the nutrient matrix is enabled, else from the database.
+    """
+    if matrix.is_enabled():
+        return get_ranking_index().top(nutr_id, basis, food_group, limit,
+                                       ascending)
+    if basis == '100g':
+        return _database_top_100g(nutr_id, food_group, limit, ascending)
+    return _database_top_measure(nutr_id, food_group, limit, ascending)
+
+
+def _database_top_100g(nutr_id, food_group, limit, ascending):
+    # ties in food_id order, reversed for ascending like RankingIndex
+    rows = NutrientData.objects.filter(nutrient_id=nutr_id,
+                                       nutr_value__isnull=False)
+    if food_group:
+        rows = rows.filter(food__food_group_id=food_group)
+    if ascending:
+        rows = rows.order_by('nutr_value', '-food_id')
+    else:
+        rows = rows.order_by('-nutr_value', 'food_id')
+    return [(food_id, None, None, value) for food_id, value in
+            rows.values_list('food_id', 'nutr_value')[:limit]]
+
+
+def _database_top_measure(nutr_id, food_group, limit, ascending):
+    # the default measure is the lowest seq as a number, seq is CHAR(2)
+    sql = (
+        "SELECT d.food_id, d.nutr_value, w.seq, w.grams "
+        "FROM usda_nutrient_data d "
+        "JOIN usda_food_desc f ON f.food_id = d.food_id "
+        "JOIN usda_weight w ON w.food_id = d.food_id "
+        "WHERE d.nutr_id = %s AND d.nutr_value IS NOT NULL {group_filter}"
+        "AND w.seq = (SELECT s.seq FROM usda_weight s "
+        "WHERE s.food_id = d.food_id "
+        "ORDER BY CAST(TRIM(s.seq) AS INTEGER) LIMIT 1) "
+        "ORDER BY d.nutr_value * w.grams {order}, d.food_id {tie} "
+        "LIMIT %s").format(
+        group_filter='AND f.food_group_id = %s ' if food_group else '',
+        order='ASC' if ascending else 'DESC',
+        tie='DESC' if ascending else 'ASC')
+    params = [nutr_id] + ([food_group] if food_group else []) + [limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [(food_id, seq.strip(), grams, scale(value, grams))
+            for food_id, value, seq, grams in rows]
+
+
+_ranking_index = None
+_lock = threading.Lock()
+
+
+def get_ranking_index():
+    """
+    Return the RankingIndex of the current nutrient matrix, building it the
+    first time and whenever the matrix is rebuilt.
+    """
+    global _ranking_index
+    nutrient_matrix = matrix.get_matrix()
+    index = _ranking_index
+    if index is None or index.matrix is not nutrient_matrix:
+        with _lock:
+            if _ranking_index is None or \
+                    _ranking_index.matrix is not nutrient_matrix:
+                _ranking_index = RankingIndex(nutrient_matrix)
+            index = _ranking_index
+    return index
+
+
+def load():
+    """
+    Build the rankings at worker startup if the nutrient matrix is enabled.
+    """
+    if matrix.is_enabled():
+        get_ranking_index()
@@ -0,0 +1,99 @@
+import sys
+from collections import namedtuple
+
+from restful import sr
+from restful.models import FoodGroup, FoodDesc, Weight, NutrientDef, \
+    NutrientData
+
+# lightweight read-only records of the usda_* rows, for in-process
+# catalogues and batch computations.
+#
+# A model instance carries a __dict__, a ModelState and a Decimal per
+# numeric field.  A record is a namedtuple (no __dict__, one pointer per
+# field) whose fields are the table's columns as in restful/sr.py, numeric
+# values are floats (None for NULL) and the short CHAR codes (food_id,
+# nutr_id, source_code, ...) are interned so the 654,572 nutrient data rows
+# share one string per code.  See the records_memory command for the
+# memory used by either.
+#
+# For column-wise access to the whole dataset see snapshot.py.
+
+
+def _record_type(name, table_name, model, doc):
+    table = sr.TABLES[table_name]
+    columns = [column.name for column in table.columns]
+    record_type = type(name, (namedtuple(name, columns),), {
+        '__doc__': doc, '__slots__': (), 'table': table, 'model': model})
+    return record_type
+
+
+FoodGroupRecord = _record_type('FoodGroupRecord', 'usda_food_group', FoodGroup,
+                               "A usda_food_group row.")
+FoodRecord = _record_type('FoodRecord', 'usda_food_desc', FoodDesc,
+                          "A usda_food_desc row.")
+NutrientDefRecord = _record_type('NutrientDefRecord', 'usda_nutrient_def',
+                                 NutrientDef, "A usda_nutrient_def row.")
+WeightRecord = _record_type('WeightRecord', 'usda_weight', Weight,
+                            "A usda_weight row.")
+NutrientRecord = _record_type('NutrientRecord', 'usda_nutrient_data',
+                              NutrientData, "A usda_nutrient_data row.")
+
+RECORD_TYPES = (FoodGroupRecord, FoodRecord, NutrientDefRecord, WeightRecord,
+                NutrientRecord)
+
+
+def _intern(value):
+    return value if value is None else sys.intern(value)
+
+
+def _float(value):
+    return value if value is None else float(value)
+
+
+def _identity(value):
+    return value
+
+
+def converter(record_type):
+    """
+    Function converting a row of the table's values, in column order, to a
+    record.
+    """
+    convert = [_float if column.numeric else
+               _intern if column.sql_type.startswith('CHAR') else _identity
+               for column in record_type.table.columns]
+    make = record_type._make
+
+    def to_record(row):
+        return make([f(value) for f, value in zip(convert, row)])
+    return to_record
+
+
+def value_names(record_type):
+    """
+    values_list() names of the model fields of the record's columns.
+    """
+    attnames = dict((field.column, field.attname)
+                    for field in record_type.model._meta.concrete_fields)
+    return [attnames[name] for name in record_type._fields]
+
+
+def from_values_list(record_type, queryset=None):
+    """
+    Records of the rows of a queryset (default: the whole table) of the
+    record's model, read with values_list().
+    """
+    if queryset is None:
+        queryset = record_type.model.objects.all()
+    to_record = converter(record_type)
+    return [to_record(row) for row in
+            queryset.values_list(*value_names(record_type)).iterator()]
+
+
+def from_sr_file(record_type, directory):
+    """
+    Records of the rows of the table's SR ASCII file in directory.
+    """
+    to_record = converter(record_type)
+    return [to_record(row) for row in
+            sr.read_table(directory, record_type.table)]
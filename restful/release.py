@@ -0,0 +1,243 @@
+import calendar
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# the USDA data release (SR27, SR28, ...) the API is serving.
+#
+# in-memory engines and caches built from the usda_* tables remember the
+# release they were built from and rebuild when this changes.
+#
+# Releases loaded with `manage.py load_sr --release` live side by side in
+# their own PostgreSQL schemas (see models.Release).  Running workers look
+# up the active release at most every USDAREST_RELEASE_CHECK_INTERVAL
+# seconds (see middleware.ReleaseMiddleware) and switch to it between
+# requests: the switch replaces a single ReleaseState, a request pins the
+# state it started with and its connection's search_path points at that
+# release's schema, so no request sees data of two releases.
+#
+# Without any Release rows (i.e. the tests) the release named in settings
+# is served from the default schema.
+
+
+class ReleaseState(object):
+    """
+    The release served by this process.
+
+    versions: {food_id: name of the release its data last changed in}, foods
+              not in it last changed in `base`, the oldest release.
+    dates: {release name: release date} of this and older releases.
+    loaded_at: when load_sr last loaded it (ISO 8601), None without Release
+               rows.
+    loads: {release name: loaded_at} of this and older releases.
+    """
+    def __init__(self, name, schema=None, release_date=None, base=None,
+                 versions=None, dates=None, loaded_at=None, loads=None):
+        self.name = name
+        self.schema = schema
+        self.release_date = release_date
+        self.base = base or name
+        self.versions = versions or {}
+        self.dates = dates or {name: release_date}
+        self.loaded_at = loaded_at
+        self.loads = loads or {name: loaded_at}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(getattr(settings, 'USDA_RELEASE', 'SR27'),
+                   release_date=datetime.datetime.strptime(
+                       getattr(settings, 'USDA_RELEASE_DATE', '2014-08-29'),
+                       '%Y-%m-%d').date())
+
+    @classmethod
+    def from_release(cls, release):
+        from restful.models import Release, ReleaseChange
+        older = Release.objects.filter(
+            release_date__lte=release.release_date).order_by('release_date')
+        dates = dict((r.name, r.release_date) for r in older)
+        dates[release.name] = release.release_date
+        loads = dict((r.name, r.loaded_at.isoformat()) for r in older)
+        loads[release.name] = release.loaded_at.isoformat()
+        names = [r.name for r in older] or [release.name]
+        versions = {}
+        # later releases override earlier ones
+        changes = ReleaseChange.objects.filter(release__in=names).values_list(
+            'release', 'food_id')
+        order = dict((name, i) for i, name in enumerate(names))
+        for name, food_id in sorted(changes, key=lambda c: order[c[0]]):
+            versions[food_id] = name
+        return cls(release.name, release.schema, release.release_date,
+                   names[0], versions, dates, loads[release.name], loads)
+
+    def version(self, name):
+        """
+        Version of the data of a release: its name, with when it was loaded
+        if there are Release rows, i.e. "SR27@2015-06-01T10:00:00".
+        """
+        loaded_at = self.loads.get(name)
+        if loaded_at is None:
+            return name
+        return '%s@%s' % (name, loaded_at)
+
+    def food_version(self, food_id):
+        return self.version(self.versions.get(food_id, self.base))
+
+
+_state = None
+_checked = 0
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def get_state():
+    """
+    The ReleaseState of the current request, else of this process.
+    """
+    state = getattr(_local, 'state', None)
+    if state is None:
+        state = _state
+        if state is None:
+            with _lock:
+                if _state is None:
+                    _activate(ReleaseState.from_settings())
+                state = _state
+    return state
+
+
+def _activate(state):
+    global _state
+    _state = state
+
+
+def check(force=False):
+    """
+    Switch to the active Release if it changed.  Looks at the database at
+    most every USDAREST_RELEASE_CHECK_INTERVAL seconds (None: never) unless
+    `force`.  Returns the ReleaseState served from now on.
+    """
+    global _checked
+    interval = getattr(settings, 'USDAREST_RELEASE_CHECK_INTERVAL', 30)
+    now = time.time()
+    if not force and (interval is None or now - _checked < interval):
+        return get_state()
+    from restful.models import Release
+    with _lock:
+        _checked = now
+        try:
+            release = Release.objects.filter(active=True).first()
+        except DatabaseError:
+            # i.e. migrations not applied yet
+            release = None
+        current = _state
+        if release is None:
+            if current is None or current.schema is not None:
+                _activate(ReleaseState.from_settings())
+        elif current is None or current.schema is None or \
+                current.name != release.name or \
+                current.loaded_at != release.loaded_at.isoformat():
+            # another release, or the same one loaded again
+            _activate(ReleaseState.from_release(release))
+        return _state
+
+
+def pin():
+    """
+    Pin the release served to the current thread until unpin(), and point
+    the database connection at its schema.
+    """
+    state = get_state()
+    _local.state = state
+    use_schema(connection, state.schema)
+    return state
+
+
+def unpin():
+    _local.state = None
+
+
+def use_schema(conn, schema):
+    """
+    Point a database connection at a release schema (None: the default).
+    """
+    if conn.vendor != 'postgresql' or conn.connection is None:
+        return
+    if getattr(conn, 'usda_schema', None) != schema:
+        with conn.cursor() as cursor:
+            cursor.execute('SET search_path TO %s, public' % (
+                conn.ops.quote_name(schema or 'public')))
+        conn.usda_schema = schema
+        # pooled connections remember it across requests
+        if hasattr(conn.connection, 'usda_schema'):
+            conn.connection.usda_schema = schema
+
+
+@receiver(connection_created)
+def _set_search_path(sender, connection, **kwargs):
+    # new connections use the default schema, pooled ones (see
+    # backends/pooled) the one they were last pointed at
+    connection.usda_schema = getattr(connection.connection, 'usda_schema',
+                                     None)
+    state = getattr(_local, 'state', None) or _state
+    if state is not None:
+        use_schema(connection, state.schema)
+
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs):
+    global _state, _checked
+    if setting in ('USDA_RELEASE', 'USDA_RELEASE_DATE'):
+        _state = None
+        _checked = 0
+
+
+def current_release():
+    """
+    Name of the USDA data release currently served, i.e. "SR27".
+    """
+    return get_state().name
+
+
+def current_loaded_at():
+    """
+    When load_sr last loaded the current release (ISO 8601), None without
+    Release rows.  Files built from the tables record it, they are stale
+    once the release is loaded again.
+    """
+    return get_state().loaded_at
+
+
+def current_version():
+    """
+    Identifies the data currently served: the release name, with when it
+    was loaded if there are Release rows, i.e. "SR27@2015-06-01T10:00:00".
+    Changes when a release is loaded again under the same name.
+    """
+    state = get_state()
+    return state.version(state.name)
+
+
+def food_version(food_id):
+    """
+    Version (see current_version()) of the release a food's data last
+    changed in.  Cache keys built from it stay valid across releases that
+    did not change the food, and change when that release is loaded again.
+    """
+    return get_state().food_version(food_id)
+
+
+def release_timestamp(release=None):
+    """
+    Publication date of a release, by name or version (default: the current
+    release) as seconds since the epoch, for Last-Modified headers.
+    """
+    state = get_state()
+    if release is not None:
+        release = release.split('@')[0]
+    date = state.dates.get(release, state.release_date)
+    return calendar.timegm(date.timetuple())
@@ -0,0 +1,198 @@
+import re
+import threading
+from bisect import bisect_left
+
+from django.db import connection
+
+from restful.models import FoodDesc
+from restful.release import current_version
+
+# food search for /foods/search.
+#
+# On PostgreSQL searches use the full-text (tsvector) and trigram indexes
+# created by migration 0002_food_search_index.  Other databases (i.e. the
+# SQLite test setup) use an in-memory inverted index of the food
+# descriptions built once per worker and release version.
+#
+# Trigram ranking and the typo tolerant fallback need the pg_trgm
+# extension (see migration 0005_pg_trgm).  Without it searches only use
+# the full-text index; workers look for it once per connection.
+#
+# Every word of the query must match, the last word (or every word for the
+# in-memory index) as a prefix so results show up while the user types.
+# Matches in long_desc rank above common_name, short_desc and
+# scientific_name matches.
+
+# must match the expression indexed in migration 0002_food_search_index
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(long_desc, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(common_name, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(short_desc, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(scientific_name, '')), 'D')")
+
+RESULT_FIELDS = ('food_id', 'long_desc', 'short_desc', 'food_group_id')
+
+# (field, weight) of the searched FoodDesc fields
+FIELD_WEIGHTS = (('long_desc', 1.0), ('common_name', 0.4),
+                 ('short_desc', 0.2), ('scientific_name', 0.1))
+
+
+def tokenize(text):
+    """
+    Lowercase words of a text, i.e. "Cheese, cottage, 2%" -> cheese, cottage, 2
+    """
+    return re.findall(r'\w+', (text or '').lower(), re.UNICODE)
+
+
+def search_foods(q, food_group=None, limit=25):
+    """
+    Search foods by description.
+
+    Returns up to `limit` dicts with RESULT_FIELDS keys, best match first.
+    food_group: only return foods of this food_group_id.
+    """
+    words = tokenize(q)
+    if not words:
+        return []
+    if connection.vendor == 'postgresql':
+        return _postgresql_search(q, words, food_group, limit)
+    return get_search_index().search(words, food_group, limit)
+
+
+def has_trigrams(conn):
+    """
+    Whether the pg_trgm extension is installed in a PostgreSQL database,
+    remembered per connection.
+    """
+    if getattr(conn, 'usda_trgm', None) is None:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            conn.usda_trgm = cursor.fetchone() is not None
+    return conn.usda_trgm
+
+
+def _postgresql_search(q, words, food_group, limit):
+    # words are \w+ only so they're safe inside a tsquery
+    tsquery = ' & '.join(words[:-1] + [words[-1] + ':*'])
+    group_filter = 'AND food_group_id = %s' if food_group else ''
+    group_params = [food_group] if food_group else []
+    trigrams = has_trigrams(connection)
+    sql = (
+        "SELECT food_id, long_desc, short_desc, food_group_id "
+        "FROM usda_food_desc, to_tsquery('english', %s) query "
+        "WHERE ({vector}) @@ query {group_filter} "
+        "ORDER BY ts_rank_cd({vector}, query) DESC, {similarity}food_id "
+        "LIMIT %s").format(vector=SEARCH_VECTOR, group_filter=group_filter,
+                           similarity='similarity(long_desc, %s) DESC, '
+                           if trigrams else '')
+    params = [tsquery] + group_params + ([q] if trigrams else []) + [limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        if not rows and trigrams:
+            # nothing matched every word: fall back to trigram similarity
+            # of the whole query, which copes with typos
+            sql = (
+                "SELECT food_id, long_desc, short_desc, food_group_id "
+                "FROM usda_food_desc WHERE long_desc %% %s {group_filter} "
+                "ORDER BY similarity(long_desc, %s) DESC, food_id "
+                "LIMIT %s").format(group_filter=group_filter)
+            cursor.execute(sql, [q] + group_params + [q, limit])
+            rows = cursor.fetchall()
+    return [dict(zip(RESULT_FIELDS, row)) for row in rows]
+
+
+class SearchIndex(object):
+    """
+    In-memory inverted index of food descriptions.
+
+    version: release.current_version() of the data it was built from.
+    words: sorted list of every word in the indexed fields.
+    postings: {word: {food_id: weight}}, weight of the best field the word
+              appears in.
+    foods: {food_id: dict of RESULT_FIELDS}
+    """
+    def __init__(self, version, foods, postings):
+        self.version = version
+        self.foods = foods
+        self.postings = postings
+        self.words = sorted(postings)
+
+    @classmethod
+    def build(cls, version):
+        columns = ('food_id', 'food_group_id') + tuple(
+            field for field, _ in FIELD_WEIGHTS)
+        foods = {}
+        postings = {}
+        for row in FoodDesc.objects.values_list(*columns):
+            food = dict(zip(columns, row))
+            food_id = food['food_id']
+            foods[food_id] = dict((field, food[field])
+                                  for field in RESULT_FIELDS)
+            for field, weight in FIELD_WEIGHTS:
+                for word in tokenize(food[field]):
+                    posting = postings.setdefault(word, {})
+                    if posting.get(food_id, 0) < weight:
+                        posting[food_id] = weight
+        return cls(version, foods, postings)
+
+    def matches(self, word):
+        """
+        {food_id: score} of the foods with a word starting with `word`.
+        Exact word matches score higher than prefix matches.
+        """
+        scores = {}
+        i = bisect_left(self.words, word)
+        while i < len(self.words) and self.words[i].startswith(word):
+            indexed = self.words[i]
+            factor = 1.0 if indexed == word else 0.5
+            for food_id, weight in self.postings[indexed].items():
+                score = weight * factor
+                if scores.get(food_id, 0) < score:
+                    scores[food_id] = score
+            i += 1
+        return scores
+
+    def search(self, words, food_group=None, limit=25):
+        scores = None
+        # rarest words first keeps the intersection small
+        for matches in sorted((self.matches(word) for word in words), key=len):
+            if scores is None:
+                scores = matches
+            else:
+                scores = dict((food_id, score + matches[food_id])
+                              for food_id, score in scores.items()
+                              if food_id in matches)
+            if not scores:
+                return []
+
+        foods = self.foods
+        if food_group:
+            scores = dict((food_id, score) for food_id, score in scores.items()
+                          if foods[food_id]['food_group_id'] == food_group)
+        # best score first, then shorter (more general) descriptions
+        ranked = sorted(scores, key=lambda food_id: (
+            -scores[food_id], len(foods[food_id]['long_desc']), food_id))
+        return [foods[food_id] for food_id in ranked[:limit]]
+
+
+_search_index = None
+_lock = threading.Lock()
+
+
+def get_search_index():
+    """
+    Return the SearchIndex of the current release, building it the first
+    time and rebuilding it whenever the release changes or is loaded again.
+    """
+    global _search_index
+    version = current_version()
+    index = _search_index
+    if index is None or index.version != version:
+        with _lock:
+            if _search_index is None or _search_index.version != version:
+                _search_index = SearchIndex.build(version)
+            index = _search_index
+    return index
@@ -1,5 +1,13 @@
+from django.http import Http404
 from rest_framework import serializers, status
 from restful.models import FoodGroup, FoodDesc, Weight, NutrientDef, NutrientData
+from restful.calculations import nutrient_value, nutrient_values, \
+    nutrient_profile, recipe_nutrients, portion_nutrients
+from decimal import Decimal
+from restful.rankings import top_foods
+from restful.similarity import get_similarity_index
+from restful.optimizer import OBJECTIVES, Infeasible, optimize_diet
+from restful.cache import get_reference_cache
 
 # serializers.  Organized by url tree location.
 
@@ -26,6 +34,20 @@ class FoodDetailSerializer(serializers.ModelSerializer):
                   'fat_factor', 'cho_factor')
 
 
+# /foods?ids=<food_id>,...
+class FoodNutrientSerializer(serializers.ModelSerializer):
+    """
+    A nutrient value per 100 g of a food.
+    """
+    nutr_id = serializers.CharField(source='nutrient_id', read_only=True)
+    value = serializers.DecimalField(source='nutr_value', max_digits=10,
+                                     decimal_places=3, read_only=True)
+
+    class Meta:
+        model = NutrientData
+        fields = ('nutr_id', 'value')
+
+
 # /foods/<food_id>/seqs
 class FoodSeqListSerializer(serializers.ModelSerializer):
     """
@@ -48,6 +70,42 @@ class FoodSeqSerializer(serializers.ModelSerializer):
                   'num_data_pts', 'std_dev')
 
 
+# /foods?ids=<food_id>,...
+class FoodBulkWeightSerializer(FoodSeqSerializer):
+    """
+    A measure of a food, seq without the blank padding of the CHAR(2)
+    column ('1 ') as elsewhere in the API.
+    """
+    seq = serializers.SerializerMethodField()
+
+    def get_seq(self, weight):
+        return weight.seq.strip()
+
+
+# /foods?ids=<food_id>,...
+class FoodBulkSerializer(FoodDetailSerializer):
+    """
+    Detailed information for a food with its measures.  The weights (and
+    nutrient_data) of the foods must be prefetched, the weights to a
+    `weights` list.
+    """
+    weights = FoodBulkWeightSerializer(many=True, read_only=True)
+
+    class Meta(FoodDetailSerializer.Meta):
+        fields = FoodDetailSerializer.Meta.fields + ('weights',)
+
+
+class FoodBulkNutrientsSerializer(FoodBulkSerializer):
+    """
+    FoodBulkSerializer with the food's values of the requested nutrients.
+    """
+    nutrients = FoodNutrientSerializer(source='nutrient_data', many=True,
+                                       read_only=True)
+
+    class Meta(FoodBulkSerializer.Meta):
+        fields = FoodBulkSerializer.Meta.fields + ('nutrients',)
+
+
 # /foods/<food_id>/seqs/<seq_id>/nutrients/<nutr_id>
 class FoodSeqNutrientObj(object):
     """
@@ -63,23 +121,268 @@ class FoodSeqNutrientObj(object):
         """
         Calculate the nutrient value per seq (measure) of a food.
         """
-        # N = (V*W)/100
-        # where:
-        # N = nutrient value per household measure,
-        # V = nutrient value per 100 g (Nutr_Val in the Nutrient Data file)
-        # W = g weight of portion (Gm_Wgt in the Weight file). *(Gm_Wgt -> grams)
-        V = NutrientData.objects.all().filter(food_id=self.food_id).filter(nutrient=self.nutr_id)[0].nutr_value
-        W = Weight.objects.all().filter(food=self.food_id).filter(seq=self.seq_id)[0].grams
-        N = (V*W)/100
+        # see calculations.py for the formula and the query behind it
+        value = nutrient_value(self.food_id, self.seq_id, self.nutr_id)
+        if value is None:
+            raise Http404
         result = {"food_id": self.food_id,
                   "seq_id": self.seq_id,
                   "nutr_id": self.nutr_id,
-                  "value": N}
+                  "value": value}
         return result
 
+    @classmethod
+    def calculate_many(cls, objs):
+        """
+        Calculate the nutrient values of many FoodSeqNutrientObj's with a
+        single query.  Missing foods, measures or nutrients have a value of
+        None instead of raising Http404.
+        """
+        values = nutrient_values((obj.food_id, obj.seq_id, obj.nutr_id)
+                                 for obj in objs)
+        return [{"food_id": obj.food_id,
+                 "seq_id": obj.seq_id,
+                 "nutr_id": obj.nutr_id,
+                 "value": value} for obj, value in zip(objs, values)]
+
+
+# /foods/<food_id>/seqs/<seq_id>/nutrients
+class FoodSeqNutrientProfileObj(object):
+    """
+    Custom object, like FoodSeqNutrientObj, for the value of every nutrient
+    of a food measure.  Used to build a full nutrition label in one request.
+    """
+    def __init__(self, food_id, seq_id):
+        self.food_id = food_id
+        self.seq_id = seq_id
+
+    def calculate(self):
+        """
+        Calculate every nutrient value per seq (measure) of a food.
+        """
+        # see calculations.py for the query behind this
+        profile = nutrient_profile(self.food_id, self.seq_id)
+        if profile is None:
+            raise Http404
+        grams, nutrients = profile
+        result = {"food_id": self.food_id,
+                  "seq_id": self.seq_id,
+                  "grams": grams,
+                  "nutrients": nutrients}
+        return result
+
+
+# /foods/nutrients
+class FoodSeqNutrientSerializer(serializers.Serializer):
+    """
+    Validates one (food_id, seq_id, nutr_id) item of a batch calculation.
+    """
+    food_id = serializers.CharField(max_length=5)
+    seq_id = serializers.CharField(max_length=2)
+    nutr_id = serializers.CharField(max_length=3)
+
+
+# /recipes/compute
+class RecipeIngredientSerializer(serializers.Serializer):
+    """
+    One ingredient of a recipe: a quantity of either a food measure (seq_id)
+    or of grams of a food.
+    """
+    food_id = serializers.CharField(max_length=5)
+    seq_id = serializers.CharField(max_length=2, required=False)
+    grams = serializers.DecimalField(max_digits=7, decimal_places=1,
+                                     min_value=0, required=False)
+    quantity = serializers.DecimalField(max_digits=7, decimal_places=3,
+                                        min_value=0, default=Decimal('1'))
+
+    def validate(self, attrs):
+        if ('seq_id' in attrs) == ('grams' in attrs):
+            raise serializers.ValidationError(
+                "Give either a seq_id or grams for each ingredient.")
+        return attrs
+
+
+class RecipeSerializer(serializers.Serializer):
+    """
+    Validates the ingredient list of a recipe.
+    """
+    ingredients = RecipeIngredientSerializer(many=True)
+
+
+class RecipeObj(object):
+    """
+    Custom object, like FoodSeqNutrientObj, for the nutrients of a recipe
+    made of several ingredients.
+    """
+    def __init__(self, ingredients):
+        self.ingredients = ingredients
+
+    def calculate(self):
+        """
+        Calculate the total nutrients and per-ingredient breakdown.
+        """
+        # see calculations.py for the matrix product behind this
+        try:
+            return recipe_nutrients(self.ingredients)
+        except LookupError as e:
+            raise serializers.ValidationError({"ingredients": [str(e)]})
+
+
+# /foods/<food_id>/similar
+class SimilarFoodsObj(object):
+    """
+    Custom object for the foods with the nutrient profiles closest to a
+    food's, over all nutrients or the given nutr_ids.
+    """
+    def __init__(self, food_id, nutr_ids=None, metric='cosine', limit=10):
+        self.food_id = food_id
+        self.nutr_ids = nutr_ids
+        self.metric = metric
+        self.limit = limit
+
+    def calculate(self):
+        """
+        Look up the neighbours, see similarity.py for the index.
+        """
+        similar = get_similarity_index().similar(
+            self.food_id, self.nutr_ids, self.metric, self.limit)
+        if similar is None:
+            raise Http404
+        descriptions = FoodDesc.objects.in_bulk(
+            [food_id for food_id, _ in similar])
+        return {"food_id": self.food_id,
+                "metric": self.metric,
+                "nutrients": self.nutr_ids,
+                "results": [{"food_id": food_id,
+                             "long_desc": descriptions[food_id].long_desc,
+                             "distance": round(distance, 6)}
+                            for food_id, distance in similar]}
+
+
+# /portions/compute
+class PortionSerializer(serializers.Serializer):
+    """
+    One portion of a food: a quantity of a unit (a mass unit like g or oz,
+    or a measure of the food like cup) or of a food measure (seq_id).
+    """
+    food_id = serializers.CharField(max_length=5)
+    unit = serializers.CharField(max_length=84, required=False)
+    seq_id = serializers.CharField(max_length=2, required=False)
+    quantity = serializers.DecimalField(max_digits=9, decimal_places=3,
+                                        min_value=0, default=Decimal('1'))
+
+    def validate(self, attrs):
+        if ('unit' in attrs) == ('seq_id' in attrs):
+            raise serializers.ValidationError(
+                "Give either a unit or a seq_id for each portion.")
+        return attrs
+
+
+class PortionListSerializer(serializers.Serializer):
+    """
+    Validates a batch of portions and the nutrients to include.
+    """
+    portions = PortionSerializer(many=True)
+    nutrients = serializers.ListField(
+        child=serializers.CharField(max_length=3), required=False)
+
+
+class PortionObj(object):
+    """
+    Custom object, like FoodSeqNutrientObj, for the nutrients of arbitrary
+    portions of foods.
+    """
+    def __init__(self, portions, nutr_ids=None):
+        self.portions = portions
+        self.nutr_ids = nutr_ids
+
+    def calculate(self):
+        """
+        Scale the nutrient values of each portion.
+        """
+        # see calculations.py for the gram factors and rounding
+        try:
+            results = portion_nutrients(self.portions, self.nutr_ids)
+        except LookupError as e:
+            raise serializers.ValidationError({"portions": [str(e)]})
+        for portion, result in zip(self.portions, results):
+            result["quantity"] = portion["quantity"]
+            if "unit" in portion:
+                result["unit"] = portion["unit"]
+            else:
+                result["seq_id"] = portion["seq_id"]
+        return {"portions": results}
+
+
+# /diets/optimize
+class DietTargetSerializer(serializers.Serializer):
+    """
+    A nutrient target of a diet: a minimum and/or a maximum total value.
+    """
+    nutr_id = serializers.CharField(max_length=3)
+    min = serializers.DecimalField(max_digits=10, decimal_places=3,
+                                   min_value=0, required=False)
+    max = serializers.DecimalField(max_digits=10, decimal_places=3,
+                                   min_value=0, required=False)
+
+    def validate(self, attrs):
+        if 'min' not in attrs and 'max' not in attrs:
+            raise serializers.ValidationError(
+                "Give a min, a max or both for each target.")
+        if attrs.get('min', 0) > attrs.get('max', attrs.get('min', 0)):
+            raise serializers.ValidationError("min is more than max.")
+        return attrs
+
+
+class DietSerializer(serializers.Serializer):
+    """
+    Validates the targets and restrictions of a diet.
+    """
+    targets = DietTargetSerializer(many=True)
+    objective = serializers.ChoiceField(choices=OBJECTIVES,
+                                        default='mass')
+    food_groups = serializers.ListField(
+        child=serializers.CharField(max_length=4), required=False)
+    exclude = serializers.ListField(
+        child=serializers.CharField(max_length=5), required=False)
+    max_grams = serializers.DecimalField(max_digits=6, decimal_places=1,
+                                         min_value=1, default=Decimal('500'))
+
+
+class DietPlanObj(object):
+    """
+    Custom object for the foods meeting nutrient targets at the least total
+    mass or energy.
+    """
+    def __init__(self, targets, objective='mass', food_groups=None,
+                 exclude=(), max_grams=500):
+        self.targets = targets
+        self.objective = objective
+        self.food_groups = food_groups
+        self.exclude = exclude
+        self.max_grams = max_grams
+
+    def calculate(self):
+        """
+        Solve the diet, see optimizer.py.
+        """
+        reference_cache = get_reference_cache()
+        for target in self.targets:
+            if reference_cache.nutrient_def(target["nutr_id"]) is None:
+                raise serializers.ValidationError(
+                    {"targets": ["Unknown nutrient %s." % target["nutr_id"]]})
+        targets = [(target["nutr_id"],
+                    float(target["min"]) if "min" in target else None,
+                    float(target["max"]) if "max" in target else None)
+                   for target in self.targets]
+        try:
+            return optimize_diet(targets, self.objective, self.food_groups,
+                                 self.exclude, float(self.max_grams))
+        except Infeasible as e:
+            raise serializers.ValidationError({"targets": [str(e)]})
+
 
 # /nutrients
-# /foods/<food_id>/seqs/<seq_id>/nutrients  ## TODO: filter on food_id
 class NutrientBasicSerializer(serializers.ModelSerializer):
     """
     List of Nutrient Definitions.
@@ -89,6 +392,43 @@ class NutrientBasicSerializer(serializers.ModelSerializer):
         fields = ('nutr_id', 'nutr_desc')
 
 
+# /nutrients/<nutr_id>/top
+class NutrientRankingObj(object):
+    """
+    Custom object for the foods highest (or lowest) in a nutrient, per 100 g
+    or per default measure.
+    """
+    def __init__(self, nutr_id, basis='100g', food_group=None, limit=50,
+                 ascending=False):
+        self.nutr_id = nutr_id
+        self.basis = basis
+        self.food_group = food_group
+        self.limit = limit
+        self.ascending = ascending
+
+    def calculate(self):
+        """
+        Rank the foods, see rankings.py for the precomputed indexes.
+        """
+        ranked = top_foods(self.nutr_id, self.basis, self.food_group,
+                           self.limit, self.ascending)
+        descriptions = FoodDesc.objects.in_bulk(
+            [food_id for food_id, _, _, _ in ranked])
+        results = []
+        for food_id, seq_id, grams, value in ranked:
+            item = {"food_id": food_id,
+                    "long_desc": descriptions[food_id].long_desc,
+                    "value": value}
+            if self.basis == 'measure':
+                item["seq_id"] = seq_id
+                item["grams"] = grams
+            results.append(item)
+        return {"nutr_id": self.nutr_id,
+                "basis": self.basis,
+                "food_group": self.food_group,
+                "results": results}
+
+
 # /nutrients/<nutr_id>
 class NutrientDetailSerializer(serializers.ModelSerializer):
     """
@@ -0,0 +1,299 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from restful import matrix
+from restful.release import current_release, current_loaded_at
+
+# "foods like this": nearest neighbours of a food's nutrient profile.
+#
+# Every food is a vector of its values per 100 g (the rows of the nutrient
+# matrix, missing values as 0), each nutrient divided by its standard
+# deviation over all foods so grams of water and micrograms of vitamin B12
+# weigh alike.  Foods are compared by cosine distance (1 - cosine
+# similarity, the shape of the profile) or Euclidean distance, over all
+# nutrients or a chosen subset.
+#
+# The K nearest neighbours over all nutrients are precomputed for every
+# food, in batches of foods x all foods matrix products.  Queries on a
+# subset of nutrients, or for more than K neighbours, are one matrix-vector
+# product over the normalized vectors.
+#
+# The index is built by the build_similarity command, never during a request
+# (it is CPU bound and would block a gevent worker), and saved per release
+# under USDAREST_SIMILARITY_DIR.  Workers memory-map it and share one copy
+# through the page cache; until it exists /foods/<food_id>/similar answers
+# 503.  Every save writes a new version directory and switches the
+# <release> symlink to it with an atomic rename, so concurrent saves and
+# readers never see a half written index.  An index records when load_sr
+# loaded its release and is ignored once the release is loaded again.
+
+METRICS = ('cosine', 'euclidean')
+
+# neighbours precomputed per food and metric
+DEFAULT_K = 50
+
+
+def _distances(vectors, sq_norms, query, metric):
+    """
+    Distances of query (a vector or a batch of vectors) to all vectors.
+    NaN/inf where undefined: cosine distances of all zero vectors.
+    """
+    products = numpy.dot(query, vectors.T)
+    if query.ndim == 1:
+        query_sq = numpy.dot(query, query)
+    else:
+        query_sq = (query * query).sum(axis=1)[:, numpy.newaxis]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'cosine':
+            return 1 - products / numpy.sqrt(query_sq * sq_norms)
+        return numpy.sqrt(numpy.maximum(query_sq - 2 * products + sq_norms,
+                                        0))
+
+
+def _nearest(distances, k):
+    """
+    Columns of the k smallest finite distances of each row, closest first,
+    ties in food_id order.  Rows with fewer are padded with -1.
+    """
+    distances = numpy.where(numpy.isfinite(distances), distances, numpy.inf)
+    order = numpy.argsort(distances, axis=-1, kind='mergesort')[..., :k]
+    if order.ndim == 1:
+        found = distances[order]
+    else:
+        found = distances[numpy.arange(len(order))[:, numpy.newaxis], order]
+    return numpy.where(numpy.isfinite(found), order, -1).astype(numpy.int32)
+
+
+class SimilarityIndex(object):
+    """
+    Nutrient profile similarity of the foods of a release.
+
+    food_ids, nutr_ids: rows and columns of vectors (as in the matrix).
+    vectors: float32 array of the normalized nutrient vectors.
+    neighbours: {metric: int32 array (foods x K)} of the rows of the K
+                nearest foods over all nutrients, -1 padded.
+    loaded_at: when load_sr had loaded the release it was built from (see
+               release.current_loaded_at()).
+    """
+    def __init__(self, release, food_ids, nutr_ids, vectors, neighbours,
+                 loaded_at=None):
+        self.release = release
+        self.loaded_at = loaded_at
+        self.food_ids = food_ids
+        self.nutr_ids = nutr_ids
+        self.vectors = vectors
+        self.neighbours = neighbours
+        self.k = neighbours[METRICS[0]].shape[1]
+        self.food_index = dict((food_id, i) for i, food_id in enumerate(food_ids))
+        self.nutr_index = dict((nutr_id, i) for i, nutr_id in enumerate(nutr_ids))
+
+    @classmethod
+    def build(cls, nutrient_matrix, k=DEFAULT_K, batch_size=512,
+              loaded_at=None):
+        values = numpy.nan_to_num(nutrient_matrix.values.astype(numpy.float64))
+        scales = values.std(axis=0)
+        scales[scales == 0] = 1
+        vectors = (values / scales).astype(numpy.float32)
+
+        wide, sq_norms = _wide(vectors)
+        k = min(k, len(vectors) - 1)
+        neighbours = {}
+        for metric in METRICS:
+            nearest = numpy.empty((len(vectors), max(k, 0)), dtype=numpy.int32)
+            for start in range(0, len(vectors), batch_size):
+                batch = slice(start, start + batch_size)
+                distances = _distances(wide, sq_norms, wide[batch], metric)
+                # a food isn't its own neighbour
+                rows = numpy.arange(distances.shape[0])
+                distances[rows, rows + start] = numpy.inf
+                nearest[batch] = _nearest(distances, k)
+            neighbours[metric] = nearest
+        return cls(nutrient_matrix.release, list(nutrient_matrix.food_ids),
+                   list(nutrient_matrix.nutr_ids), vectors, neighbours,
+                   loaded_at)
+
+    def save(self, directory):
+        """
+        Write the index to a new version directory under directory and
+        switch the directory/<release> symlink to it atomically, then remove
+        the version it replaced.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        version = tempfile.mkdtemp(prefix='%s.' % self.release, dir=directory)
+        numpy.save(os.path.join(version, 'vectors.npy'), self.vectors)
+        for metric, nearest in self.neighbours.items():
+            numpy.save(os.path.join(version, 'neighbours_%s.npy' % metric),
+                       nearest)
+        with open(os.path.join(version, 'index.json'), 'w') as f:
+            json.dump({'release': self.release, 'loaded_at': self.loaded_at,
+                       'food_ids': self.food_ids, 'nutr_ids': self.nutr_ids},
+                      f)
+
+        path = os.path.join(directory, self.release)
+        if os.path.isdir(path) and not os.path.islink(path):
+            # saved before indexes were versioned
+            shutil.rmtree(path)
+        previous = os.path.realpath(path) if os.path.islink(path) else None
+        link = os.path.join(directory, '.%s' % os.path.basename(version))
+        os.symlink(os.path.basename(version), link)
+        os.replace(link, path)
+        if previous is not None and previous != os.path.realpath(version):
+            # workers that mapped it keep their open files
+            shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, release, loaded_at=None):
+        """
+        Memory-map the index of a release saved by save(), None if there
+        isn't one or it was built before the release was loaded at
+        loaded_at.
+        """
+        # resolve the symlink once, a concurrent save() may switch it
+        path = os.path.realpath(os.path.join(directory, release))
+        try:
+            with open(os.path.join(path, 'index.json')) as f:
+                index = json.load(f)
+            if index.get('loaded_at') != loaded_at:
+                return None
+            vectors = numpy.load(os.path.join(path, 'vectors.npy'),
+                                 mmap_mode='r')
+            neighbours = dict(
+                (metric, numpy.load(os.path.join(path, 'neighbours_%s.npy' %
+                                                 metric), mmap_mode='r'))
+                for metric in METRICS)
+        except (IOError, OSError, ValueError):
+            return None
+        return cls(index['release'], index['food_ids'], index['nutr_ids'],
+                   vectors, neighbours, loaded_at)
+
+    def similar(self, food_id, nutr_ids=None, metric='cosine', limit=10):
+        """
+        The `limit` foods closest to a food as (food_id, distance) tuples,
+        over the nutrients nutr_ids (default: all).  None if the food does
+        not exist.  Raises KeyError for an unknown nutrient.
+        """
+        row = self.food_index.get(food_id)
+        if row is None:
+            return None
+        query = numpy.asarray(self.vectors[row], dtype=numpy.float64)
+        if nutr_ids is None and limit <= self.k:
+            # precomputed, only the neighbours' distances are needed
+            nearest = self.neighbours[metric][row][:limit]
+            nearest = nearest[nearest >= 0]
+            distances = _distances(
+                *_wide(self.vectors[nearest]), query=query, metric=metric)
+        else:
+            vectors = self.vectors
+            if nutr_ids is not None:
+                cols = sorted(set(self.nutr_index[nutr_id]
+                                  for nutr_id in nutr_ids))
+                vectors = vectors[:, cols]
+                query = query[cols]
+            distances = _distances(*_wide(vectors), query=query,
+                                   metric=metric)
+            distances[row] = numpy.inf
+            nearest = _nearest(distances, limit)
+            nearest = nearest[nearest >= 0]
+            distances = distances[nearest]
+        return [(self.food_ids[i], float(distance))
+                for i, distance in zip(nearest, distances)]
+
+
+def _wide(vectors):
+    """
+    float64 copy of vectors and their squared norms.
+    """
+    vectors = numpy.asarray(vectors, dtype=numpy.float64)
+    return vectors, (vectors * vectors).sum(axis=1)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_directory():
+    return getattr(settings, 'USDAREST_SIMILARITY_DIR', None)
+
+
+def build(release=None):
+    """
+    Build the index of the current release from the nutrient matrix, save
+    it if USDAREST_SIMILARITY_DIR is set and serve it from this process.
+    CPU bound, see the build_similarity command.
+    """
+    global _index
+    release = release or current_release()
+    if matrix.is_enabled():
+        nutrient_matrix = matrix.get_matrix()
+    else:
+        nutrient_matrix = matrix.NutrientMatrix.build(release)
+    index = SimilarityIndex.build(nutrient_matrix,
+                                  loaded_at=current_loaded_at())
+    directory = get_directory()
+    if directory:
+        index.save(directory)
+    with _lock:
+        _index = index
+    return index
+
+
+def get_similarity_index():
+    """
+    Return the SimilarityIndex of the current release, memory-mapped from
+    USDAREST_SIMILARITY_DIR on first use.  None until the build_similarity
+    command (or build()) made one, it is never built during a request.
+    """
+    global _index
+    release = current_release()
+    loaded_at = current_loaded_at()
+    index = _index
+    if index is None or (index.release, index.loaded_at) != (release,
+                                                              loaded_at):
+        with _lock:
+            if _index is None or (_index.release, _index.loaded_at) != (
+                    release, loaded_at):
+                directory = get_directory()
+                _index = None
+                if directory:
+                    _index = SimilarityIndex.load(directory, release,
+                                                  loaded_at)
+            index = _index
+    return index
+
+
+def load():
+    """
+    Memory-map a saved index at worker startup.
+    """
+    global _index
+    directory = get_directory()
+    if directory:
+        index = SimilarityIndex.load(directory, current_release(),
+                                     current_loaded_at())
+        if index is not None:
+            with _lock:
+                _index = index
+
+
+def invalidate():
+    """
+    Drop the index, it is loaded again on next use.
+    """
+    global _index
+    with _lock:
+        _index = None
+
+
+@receiver(setting_changed)
+def _reset(**kwargs):
+    if kwargs['setting'] == 'USDAREST_SIMILARITY_DIR':
+        invalidate()
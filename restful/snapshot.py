@@ -0,0 +1,346 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from bisect import bisect_left
+from decimal import Decimal
+
+import numpy
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import models
+from django.dispatch import receiver
+
+from restful.models import FoodGroup, FoodDesc, Weight, NutrientDef, \
+    NutrientData
+from restful.release import current_release, current_loaded_at
+
+# compact binary snapshot of the usda_* tables of a release.
+#
+# A worker that wants the SR data in memory otherwise queries the database
+# and builds hundreds of thousands of Python objects.  The snapshot holds the
+# same tables as flat numpy columns in one file that workers memory-map:
+# loading it only parses a small JSON header, and workers forked from a
+# preloaded gunicorn master share its pages through the page cache.
+#
+# Layout (little endian):
+#
+#   "USDASNAP", uint32 format version, uint32 header length, JSON header,
+#   then every column, 8 byte aligned, at the offset the header gives.
+#
+# Columns are fixed width:
+#   CharField:    int32 id in the string pool (each distinct string is stored
+#                 once), -1 for NULL
+#   DecimalField: int32 or int64 fixed point, the value times 10 **
+#                 decimal_places, the dtype's minimum for NULL
+#   ForeignKey:   int32 row of the referenced table
+# Weight and NutrientData rows are sorted by food and indexed by
+# "<table>.offsets": the rows of food_desc row i are offsets[i]:offsets[i+1].
+#
+# Build snapshots with the build_snapshot command.  The header records the
+# release and when load_sr loaded it: a snapshot is ignored once the release
+# is loaded again, until it is rebuilt.  The nutrient matrix is loaded from
+# the snapshot of the current release when there is one (see matrix.py).
+
+MAGIC = b'USDASNAP'
+
+# bump on any change of the layout, older snapshots are then ignored
+FORMAT_VERSION = 2
+
+_PREFIX = struct.Struct('<8sII')
+
+# (table, model, ordering), referenced tables come first
+TABLES = (
+    ('food_group', FoodGroup, ('food_group_id',)),
+    ('nutrient_def', NutrientDef, ('sr_order', 'nutr_id')),
+    ('food_desc', FoodDesc, ('food_id',)),
+    ('weight', Weight, ('food', 'seq')),
+    ('nutrient_data', NutrientData, ('food', 'nutrient')),
+)
+
+# tables indexed by food
+FOOD_INDEXED = ('weight', 'nutrient_data')
+
+_MODELS = dict((table, model) for table, model, _ in TABLES)
+_TABLE_NAMES = dict((model, table) for table, model, _ in TABLES)
+
+
+class SnapshotError(Exception):
+    """
+    The file is not a snapshot of this format version.
+    """
+
+
+def _fields(model):
+    return [field for field in model._meta.concrete_fields
+            if not isinstance(field, models.AutoField)]
+
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+
+def _decimal_dtype(field):
+    return numpy.int32 if field.max_digits <= 9 else numpy.int64
+
+
+def write(path, release=None):
+    """
+    Write a snapshot of the current release's tables to path, replacing it
+    atomically.
+    """
+    strings = {}
+    arrays = []  # (name, array)
+    decimal_places = {}
+    rows = {}
+    pk_rows = {}  # {model: {pk: row}}
+
+    def intern(value):
+        if value is None:
+            return -1
+        return strings.setdefault(value, len(strings))
+
+    for table, model, ordering in TABLES:
+        fields = _fields(model)
+        values = list(model.objects.order_by(*ordering).values_list(
+            *[field.attname for field in fields]).iterator())
+        rows[table] = len(values)
+        columns = zip(*values) if values else [()] * len(fields)
+        for field, column in zip(fields, columns):
+            name = '%s.%s' % (table, field.attname)
+            if isinstance(field, models.ForeignKey):
+                index = pk_rows[field.rel.to]
+                array = numpy.array([index[pk] for pk in column],
+                                    dtype=numpy.int32)
+            elif isinstance(field, models.DecimalField):
+                dtype = _decimal_dtype(field)
+                scaled = numpy.round(numpy.array(
+                    [numpy.nan if value is None else float(value)
+                     for value in column]) * 10 ** field.decimal_places)
+                array = numpy.where(numpy.isnan(scaled),
+                                    numpy.iinfo(dtype).min,
+                                    numpy.nan_to_num(scaled)).astype(dtype)
+                decimal_places[name] = field.decimal_places
+            else:
+                array = numpy.array([intern(value) for value in column],
+                                    dtype=numpy.int32)
+            arrays.append((name, array))
+            if field.primary_key:
+                pk_rows[model] = dict((pk, row)
+                                      for row, pk in enumerate(column))
+        if table in FOOD_INDEXED:
+            food_rows = dict(arrays)['%s.food_id' % table]
+            arrays.append(('%s.offsets' % table, numpy.searchsorted(
+                food_rows, numpy.arange(rows['food_desc'] + 1)).astype(
+                numpy.int32)))
+
+    pool = sorted(strings, key=strings.get)
+    encoded = [value.encode('utf-8') for value in pool]
+    arrays.append(('strings.offsets', numpy.cumsum(
+        [0] + [len(value) for value in encoded]).astype(numpy.int64)))
+    arrays.append(('strings.data', numpy.frombuffer(b''.join(encoded) or
+                                                    b'\0', dtype=numpy.uint8)))
+
+    layout = {}
+    offset = 0
+    for name, array in arrays:
+        layout[name] = [array.dtype.str, offset, len(array)]
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({'release': release or current_release(),
+                         'loaded_at': current_loaded_at(), 'rows': rows, 'columns': layout,
+                         'decimal_places': decimal_places},
+                        sort_keys=True).encode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        start = _align(_PREFIX.size + len(header))
+        for name, array in arrays:
+            f.seek(start + layout[name][1])
+            f.write(array.tobytes())
+    os.rename(tmp, path)
+
+
+class Snapshot(object):
+    """
+    A memory-mapped snapshot.
+
+    release: the release it was written from.
+    loaded_at: when load_sr had loaded that release (see
+               release.current_loaded_at()).
+    rows: {table: number of rows}.
+    columns: {"table.column": read-only numpy array over the mapped file}.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, length = _PREFIX.unpack_from(self._mmap)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError("%s is not a version %d snapshot." %
+                                (path, FORMAT_VERSION))
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + length]
+                            .decode('utf-8'))
+        start = _align(_PREFIX.size + length)
+        self.release = header['release']
+        self.loaded_at = header['loaded_at']
+        self.rows = header['rows']
+        self.decimal_places = header['decimal_places']
+        self.columns = dict(
+            (name, numpy.frombuffer(self._mmap, dtype=dtype, count=count,
+                                    offset=start + offset)
+             if count else numpy.empty(0, dtype=dtype))
+            for name, (dtype, offset, count) in header['columns'].items())
+        self._string_offsets = self.columns['strings.offsets']
+        self._string_data = self.columns['strings.data']
+        self._food_ids = None
+
+    def string(self, string_id):
+        if string_id < 0:
+            return None
+        start, end = self._string_offsets[string_id:string_id + 2]
+        return self._string_data[start:end].tobytes().decode('utf-8')
+
+    def strings(self, name):
+        """
+        The values of a CharField column as a list.
+        """
+        return [self.string(string_id) for string_id in self.columns[name]]
+
+    def decimal(self, name, value):
+        """
+        A value of a DecimalField column as a Decimal, None for NULL.
+        """
+        if value == numpy.iinfo(value.dtype).min:
+            return None
+        return Decimal(int(value)).scaleb(-self.decimal_places[name])
+
+    @property
+    def food_ids(self):
+        """
+        Sorted food_id of every food_desc row.
+        """
+        if self._food_ids is None:
+            self._food_ids = self.strings('food_desc.food_id')
+        return self._food_ids
+
+    def food_row(self, food_id):
+        row = bisect_left(self.food_ids, food_id)
+        if row < len(self.food_ids) and self.food_ids[row] == food_id:
+            return row
+        return None
+
+    def record(self, table, row):
+        """
+        A row of a table as a {field attname: value} dict, foreign keys as
+        the referenced primary keys.
+        """
+        record = {}
+        for field in _fields(_MODELS[table]):
+            name = '%s.%s' % (table, field.attname)
+            value = self.columns[name][row]
+            if isinstance(field, models.ForeignKey):
+                value = self.string(self.columns['%s.%s' % (
+                    _TABLE_NAMES[field.rel.to],
+                    field.rel.to._meta.pk.attname)][value])
+            elif isinstance(field, models.DecimalField):
+                value = self.decimal(name, value)
+            else:
+                value = self.string(value)
+            record[field.attname] = value
+        return record
+
+    def food(self, food_id):
+        """
+        The food_desc record of a food, None if it does not exist.
+        """
+        row = self.food_row(food_id)
+        return None if row is None else self.record('food_desc', row)
+
+    def food_records(self, table, food_id):
+        """
+        The weight or nutrient_data records of a food.
+        """
+        row = self.food_row(food_id)
+        if row is None:
+            return []
+        offsets = self.columns['%s.offsets' % table]
+        return [self.record(table, i)
+                for i in range(offsets[row], offsets[row + 1])]
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_directory():
+    return getattr(settings, 'USDAREST_SNAPSHOT_DIR', None)
+
+
+def get_path(release=None):
+    directory = get_directory()
+    if not directory:
+        return None
+    return os.path.join(directory, '%s.snapshot' % (release or
+                                                    current_release()))
+
+
+def get_snapshot():
+    """
+    The Snapshot of the current release, memory-mapped on first use.  None
+    without USDAREST_SNAPSHOT_DIR or an up to date snapshot of the release
+    in it.
+    """
+    global _snapshot
+    release = current_release()
+    loaded_at = current_loaded_at()
+    snapshot = _snapshot
+    if snapshot is None or (snapshot.release, snapshot.loaded_at) != (
+            release, loaded_at):
+        path = get_path(release)
+        if not path or not os.path.exists(path):
+            return None
+        with _lock:
+            if _snapshot is None or (_snapshot.release, _snapshot.loaded_at) \
+                    != (release, loaded_at):
+                try:
+                    snapshot = Snapshot(path)
+                except SnapshotError:
+                    return None
+                if (snapshot.release, snapshot.loaded_at) != (release,
+                                                              loaded_at):
+                    # another release's, or written before a reload
+                    return None
+                _snapshot = snapshot
+            snapshot = _snapshot
+    return snapshot
+
+
+def load():
+    """
+    Memory-map the snapshot at worker startup.
+    """
+    get_snapshot()
+
+
+def invalidate():
+    """
+    Drop the snapshot, it is mapped again on next use.
+    """
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+@receiver(setting_changed)
+def _reset(**kwargs):
+    if kwargs['setting'] == 'USDAREST_SNAPSHOT_DIR':
+        invalidate()
@@ -0,0 +1,259 @@
+import csv
+import io
+import os
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
+from restful.search import SEARCH_VECTOR
+
+# the USDA SR ASCII files and the usda_* tables they are loaded into.
+#
+# The files are latin1 encoded, '^' separates fields and text fields are
+# enclosed in '~'.  An empty numeric field is a null.  See sr27_doc.pdf
+# pages 25-36 for the file formats.
+#
+# Table layouts are the same as models.py, these tables have "managed=False"
+# so their schema is defined here rather than by Django.  usda_weight and
+# usda_nutrient_data get a serial "id" surrogate key as per Django's
+# requirements, their composite keys are enforced as unique constraints.
+#
+# Constraints are (name suffix, definition) so a loader can add them, named
+# <table>_<suffix>, once the rows are in (see management/commands/load_sr.py).
+
+Column = namedtuple('Column', ['name', 'sql_type', 'numeric'])
+Table = namedtuple('Table', ['name', 'file_name', 'columns', 'surrogate_id',
+                             'constraints'])
+
+
+def _columns(*columns):
+    return tuple(Column(name, sql_type,
+                        sql_type.startswith('NUMERIC'))
+                 for name, sql_type in columns)
+
+
+TABLES = OrderedDict((table.name, table) for table in (
+    # Food Group Description, 25 records
+    Table('usda_food_group', 'FD_GROUP.txt', _columns(
+        ('food_group_id', 'CHAR(4) NOT NULL'),
+        ('food_group_desc', 'CHAR(60) NOT NULL'),
+    ), False, (('pkey', 'PRIMARY KEY (food_group_id)'),)),
+
+    # Food Description, 8,618 records
+    Table('usda_food_desc', 'FOOD_DES.txt', _columns(
+        ('food_id', 'CHAR(5) NOT NULL'),
+        ('food_group_id', 'CHAR(4) NOT NULL'),
+        ('long_desc', 'VARCHAR(200) NOT NULL'),
+        ('short_desc', 'VARCHAR(200) NOT NULL'),
+        ('common_name', 'VARCHAR(100)'),
+        ('manufacture_name', 'VARCHAR(65)'),
+        ('survey', 'CHAR(1)'),
+        ('refuse_desc', 'VARCHAR(135)'),
+        ('refuse', 'NUMERIC(2,0)'),
+        ('scientific_name', 'VARCHAR(65)'),
+        ('n_factor', 'NUMERIC(4,2)'),
+        ('pro_factor', 'NUMERIC(4,2)'),
+        ('fat_factor', 'NUMERIC(4,2)'),
+        ('cho_factor', 'NUMERIC(4,2)'),
+    ), False, (('pkey', 'PRIMARY KEY (food_id)'),)),
+
+    # Nutrient Definition, 150 records
+    Table('usda_nutrient_def', 'NUTR_DEF.txt', _columns(
+        ('nutr_id', 'CHAR(3) NOT NULL'),
+        ('units', 'VARCHAR(7) NOT NULL'),
+        ('tagname', 'VARCHAR(20)'),
+        ('nutr_desc', 'VARCHAR(60) NOT NULL'),
+        ('decimal_places', 'CHAR(1) NOT NULL'),
+        ('sr_order', 'NUMERIC(6,0) NOT NULL'),
+    ), False, (('pkey', 'PRIMARY KEY (nutr_id)'),)),
+
+    # Weight, 15,228 records
+    Table('usda_weight', 'WEIGHT.txt', _columns(
+        ('food_id', 'CHAR(5)'),
+        ('seq', 'CHAR(2)'),
+        ('amount', 'NUMERIC(5,3) NOT NULL'),
+        ('measure_desc', 'VARCHAR(84) NOT NULL'),
+        ('grams', 'NUMERIC(7,1) NOT NULL'),
+        ('num_data_pts', 'NUMERIC(4,0)'),
+        ('std_dev', 'NUMERIC(7,3)'),
+    ), True, (('pkey', 'PRIMARY KEY (id)'),
+           ('food_id_seq_key', 'UNIQUE (food_id, seq)'))),
+
+    # Nutrient Data, 654,572 records
+    Table('usda_nutrient_data', 'NUT_DATA.txt', _columns(
+        ('food_id', 'CHAR(5) NOT NULL'),
+        ('nutr_id', 'CHAR(3) NOT NULL'),
+        ('nutr_value', 'NUMERIC(10,3) NOT NULL'),
+        ('num_data_pts', 'NUMERIC(5,0) NOT NULL'),
+        ('std_error', 'NUMERIC(8,3)'),
+        ('source_code', 'CHAR(2) NOT NULL'),
+        ('derivation_code', 'CHAR(4)'),
+        ('ref_food_id', 'CHAR(5)'),
+        ('fortified', 'CHAR(1)'),
+        ('number_studies', 'NUMERIC(2,0)'),
+        ('min_value', 'NUMERIC(10,3)'),
+        ('max_value', 'NUMERIC(10,3)'),
+        ('degrees_freedom', 'NUMERIC(4,0)'),
+        ('low_error_bound', 'NUMERIC(10,3)'),
+        ('upper_error_bound', 'NUMERIC(10,3)'),
+        ('statistical_cmt', 'CHAR(10)'),
+        ('addmod_date', 'CHAR(10)'),
+        ('confidence_code', 'CHAR(1)'),
+    ), True, (('pkey', 'PRIMARY KEY (id)'),
+           ('food_id_nutr_id_key', 'UNIQUE (food_id, nutr_id)'))),
+))
+
+# (index name, table, definition) of the secondary indexes on the usda_*
+# tables, also created by the migrations in restful/migrations.
+INDEXES = (
+    ('usda_food_desc_search', 'usda_food_desc',
+     'USING gin ((%s))' % SEARCH_VECTOR),
+    ('usda_food_desc_long_desc_trgm', 'usda_food_desc',
+     'USING gin (long_desc gin_trgm_ops)'),
+    # index-only scans for nutrient values of a food
+    ('usda_nutrient_data_food_nutr_value', 'usda_nutrient_data',
+     '(food_id, nutr_id) INCLUDE (nutr_value)'),
+    # foods ordered by a nutrient's value
+    ('usda_nutrient_data_nutr_value', 'usda_nutrient_data',
+     '(nutr_id, nutr_value)'),
+    # index-only scans for the grams of a food's measure
+    ('usda_weight_food_seq_grams', 'usda_weight',
+     '(food_id, seq) INCLUDE (grams)'),
+    ('usda_food_desc_food_group', 'usda_food_desc', '(food_group_id)'),
+)
+
+# INDEXES that need the pg_trgm extension, load_sr skips them without it
+TRIGRAM_INDEXES = ('usda_food_desc_long_desc_trgm',)
+
+
+# (table, columns) compared between releases to find the foods that changed,
+# nutrient data by its addmod_date
+CHANGE_COLUMNS = (
+    ('usda_nutrient_data', ('food_id', 'nutr_id', 'addmod_date')),
+    ('usda_food_desc', tuple(column.name for column in
+                             TABLES['usda_food_desc'].columns)),
+    ('usda_weight', tuple(column.name for column in
+                          TABLES['usda_weight'].columns)),
+)
+
+# tables every food's data depends on: if these change every food changed
+REFERENCE_TABLES = ('usda_food_group', 'usda_nutrient_def')
+
+
+def changed_foods_sql(old_schema, new_schema):
+    """
+    SELECT of the food_ids whose rows differ between two release schemas.
+    """
+    selects = []
+    for table, columns in CHANGE_COLUMNS:
+        columns = ', '.join(columns)
+        for a, b in ((new_schema, old_schema), (old_schema, new_schema)):
+            selects.append(
+                '(SELECT {columns} FROM {a}.{table} '
+                'EXCEPT SELECT {columns} FROM {b}.{table})'.format(
+                    columns=columns, a=a, b=b, table=table))
+    return ' UNION '.join('SELECT food_id FROM %s AS d%d' % (select, i)
+                          for i, select in enumerate(selects))
+
+
+def reference_changed_sql(old_schema, new_schema):
+    """
+    SELECT returning a row if a reference table differs between two release
+    schemas.
+    """
+    selects = []
+    for table in REFERENCE_TABLES:
+        for a, b in ((new_schema, old_schema), (old_schema, new_schema)):
+            selects.append('(SELECT * FROM %s.%s EXCEPT SELECT * FROM %s.%s)'
+                           % (a, table, b, table))
+    return 'SELECT 1 WHERE EXISTS (%s)' % ' UNION '.join(selects)
+
+
+def create_table_sql(table, name=None):
+    """
+    CREATE TABLE statement for a table, optionally under another name,
+    without its constraints.
+    """
+    definitions = []
+    if table.surrogate_id:
+        definitions.append('id SERIAL NOT NULL')
+    definitions.extend('%s %s' % (column.name, column.sql_type)
+                       for column in table.columns)
+    return 'CREATE TABLE %s (\n    %s\n)' % (name or table.name,
+                                             ',\n    '.join(definitions))
+
+
+def copy_line(row):
+    """
+    A row in PostgreSQL's COPY text format: tab separated, \\N for null.
+    """
+    return '\t'.join(
+        '\\N' if value is None else
+        value.replace('\\', '\\\\').replace('\t', '\\t')
+             .replace('\n', '\\n').replace('\r', '\\r')
+        for value in row) + '\n'
+
+
+class CopyStream(object):
+    """
+    File-like object feeding rows to cursor.copy_expert() in COPY text
+    format without holding more than one read() worth of them in memory.
+
+    rows: the number of rows read so far.
+    progress: optional callable, called with rows every `every` rows.
+    """
+    def __init__(self, rows, progress=None, every=100000):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.rows = 0
+        self.progress = progress
+        self.every = every
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = copy_line(row)
+            chunks.append(line)
+            length += len(line)
+            self.rows += 1
+            if self.progress and self.rows % self.every == 0:
+                self.progress(self.rows)
+        data = ''.join(chunks)
+        if size < 0:
+            size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def read_rows(path, columns, typed=False):
+    """
+    Stream the rows of an SR ASCII file as tuples.
+
+    Empty numeric fields are None, everything else is a str unless typed is
+    True, then numeric fields are Decimals.
+    """
+    numeric = [column.numeric for column in columns]
+    with io.open(path, encoding='latin1', newline='') as f:
+        reader = csv.reader(f, delimiter='^', quotechar='~')
+        for fields in reader:
+            if not fields:
+                continue
+            if len(fields) != len(columns):
+                raise ValueError("%s line %d: expected %d fields, got %d." % (
+                    os.path.basename(path), reader.line_num, len(columns),
+                    len(fields)))
+            yield tuple(
+                (None if value == '' else Decimal(value) if typed else value)
+                if is_numeric else value
+                for value, is_numeric in zip(fields, numeric))
+
+
+def read_table(directory, table, typed=False):
+    """
+    Stream the rows of a table's SR ASCII file in directory.
+    """
+    return read_rows(os.path.join(directory, table.file_name), table.columns,
+                     typed=typed)
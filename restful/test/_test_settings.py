@@ -8,3 +8,20 @@ TEST_RUNNER = 'restful.test.runner.UnManagedModelTestRunner'
 FIXTURE_DIRS = ('restful/test/fixtures',)
 
 MIGRATION_MODULES = {'restful': 'migrations_not_used_in_tests'}
+
+
+# tests look at response.data, which only DRF responses have, so rendered
+# responses are not cached and serializers are not bypassed unless a test
+# turns it on.
+USDAREST_RESPONSE_CACHE = {'BACKEND': 'restful.cache.DummyBackend'}
+USDAREST_FAST_SERIALIZERS = False
+
+# tests serve USDA_RELEASE, tests of release switching call release.check()
+USDAREST_RELEASE_CHECK_INTERVAL = None
+
+# similarity indexes are built in memory, tests of saving them use a
+# temporary directory
+USDAREST_SIMILARITY_DIR = None
+
+# no snapshots either, tests of them use a temporary directory
+USDAREST_SNAPSHOT_DIR = None
@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from restful import similarity
+from restful.management.commands.benchmark import check_coverage, \
+    percentile, regressions
+
+
+class BenchmarkTestCase(TestCase):
+    def test_coverage(self):
+        self.assertEqual(check_coverage(), [])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_regressions(self):
+        base = {'mode': 'client', 'method': 'GET', 'path': '/foods/01001',
+                'p95': 2.0, 'queries': 1}
+        baseline = {'results': [base]}
+        self.assertEqual(regressions([dict(base, p95=2.3)], baseline, 0.2,
+                                     1.0), [])
+        # slower by more than 20% but less than the 1 ms slack
+        self.assertEqual(regressions([dict(base, p95=2.9)], baseline, 0.2,
+                                     1.0), [])
+        self.assertEqual(len(regressions([dict(base, p95=3.5)], baseline,
+                                         0.2, 1.0)), 1)
+        self.assertEqual(len(regressions([dict(base, queries=2)], baseline,
+                                         0.2, 1.0)), 1)
+
+    def test_command(self):
+        out = StringIO()
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        # /foods/<food_id>/similar needs the index
+        similarity.build()
+        self.addCleanup(similarity.invalidate)
+        call_command('benchmark', mode='client', requests=2, warmup=0,
+                     output=path, stdout=out)
+        with open(path) as f:
+            results = json.load(f)['results']
+        self.assertIn('/foods/01001', out.getvalue())
+        self.assertEqual(results[0]['requests'], 2)
+
+        # a baseline that made fewer queries fails the run
+        for result in results:
+            result['queries'] = 0
+        with open(path, 'w') as f:
+            json.dump({'results': results}, f)
+        self.assertRaises(CommandError, call_command, 'benchmark',
+                          mode='client', requests=2, warmup=0,
+                          baseline=path, stdout=StringIO())
@@ -0,0 +1,168 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from rest_framework.test import APITestCase
+from restful.cache import ReferenceCache, LocalMemoryBackend, \
+    DjangoCacheBackend, get_reference_cache
+from restful import release
+from restful.models import FoodGroup, Release
+
+
+class ReferenceCacheTestCase(TestCase):
+    def test_cache_lookups(self):
+        reference_cache = ReferenceCache(LocalMemoryBackend())
+        with self.assertNumQueries(4):
+            reference_cache.warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(reference_cache.food_groups()), 25)
+            self.assertEqual(reference_cache.food_group('0100').pk, '0100')
+            self.assertEqual(len(reference_cache.nutrient_defs()), 150)
+            self.assertEqual(reference_cache.nutrient_def('203').units, 'g')
+            self.assertEqual([w.seq for w in reference_cache.weights('01001')],
+                             ['1', '2', '3', '4'])
+            self.assertEqual(reference_cache.weight('01001', '2').measure_desc,
+                             'tbsp')
+            self.assertEqual(reference_cache.weight('01001', '9'), None)
+            factors = reference_cache.gram_factors('01001')
+            self.assertEqual(factors['2'], factors['tbsp'])
+            self.assertEqual(factors['pat'], Decimal('5'))
+
+    def test_cache_keyed_by_release(self):
+        reference_cache = ReferenceCache(LocalMemoryBackend())
+        reference_cache.warm()
+        with self.settings(USDA_RELEASE='SR28'):
+            with self.assertNumQueries(1):
+                reference_cache.food_groups()
+
+    def test_cache_keyed_by_load(self):
+        # load_sr loading the release again is seen by every worker, the
+        # old tables are dropped
+        sr27 = Release.objects.create(
+            name='SR27', schema='public',
+            release_date=datetime.date(2014, 8, 29), active=True)
+        self.addCleanup(release.check, force=True)
+        self.addCleanup(Release.objects.all().delete)
+        release.check(force=True)
+        backend = LocalMemoryBackend()
+        reference_cache = ReferenceCache(backend)
+        reference_cache.warm()
+        old_key = reference_cache.key('foodgroups')
+        Release.objects.filter(name='SR27').update(
+            loaded_at=sr27.loaded_at + datetime.timedelta(hours=1))
+        release.check(force=True)
+        with self.assertNumQueries(1):
+            reference_cache.food_groups()
+        self.assertNotEqual(reference_cache.key('foodgroups'), old_key)
+        self.assertEqual(list(reference_cache._local),
+                         [reference_cache.key('foodgroups')])
+        self.assertEqual(backend.get(old_key), None)
+
+    def test_cache_invalidate(self):
+        reference_cache = ReferenceCache(LocalMemoryBackend())
+        reference_cache.warm()
+        FoodGroup.objects.filter(pk='0100').update(food_group_desc='Dairy')
+        self.assertNotEqual(reference_cache.food_group('0100').food_group_desc,
+                            'Dairy')
+        reference_cache.invalidate()
+        self.assertEqual(reference_cache.food_group('0100').food_group_desc,
+                         'Dairy')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cache_shared_backend(self):
+        # a second worker process finds the tables in the shared cache
+        ReferenceCache(DjangoCacheBackend()).warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                len(ReferenceCache(DjangoCacheBackend()).nutrient_defs()), 150)
+
+    def test_warm_cache_command(self):
+        out = StringIO()
+        call_command('warm_cache', invalidate=True, stdout=out)
+        self.assertIn("release SR27", out.getvalue())
+        with self.assertNumQueries(0):
+            get_reference_cache().nutrient_def('203')
+
+
+class ReferenceEndpointsTestCase(APITestCase):
+    def test_reference_endpoints_skip_database(self):
+        get_reference_cache().warm()
+        with self.assertNumQueries(0):
+            self.client.get('/foodgroups')
+            self.client.get('/foodgroups/0100')
+            self.client.get('/nutrients')
+            self.client.get('/nutrients/203')
+            self.client.get('/foods/01001/seqs')
+            self.client.get('/foods/01001/seqs/1')
+        self.assertEqual(self.client.get('/foods/01001/seqs/9').status_code,
+                         404)
+        self.assertEqual(self.client.get('/nutrients/999').status_code, 404)
+
+
+@override_settings(USDAREST_RESPONSE_CACHE={
+    'BACKEND': 'restful.cache.LocalMemoryBackend'})
+class CachedResponseTestCase(APITestCase):
+    def test_conditional_get(self):
+        url = '/foods/01001'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"SR27-'))
+        self.assertEqual(response['Last-Modified'],
+                         'Fri, 29 Aug 2014 00:00:00 GMT')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+
+        # 304 with a matching ETag or a later If-Modified-Since
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE='Sat, 30 Aug 2014 00:00:00 GMT')
+        self.assertEqual(response.status_code, 304)
+
+        # other URLs and releases don't match
+        response = self.client.get('/foods/01002', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        with self.settings(USDA_RELEASE='SR28'):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_conditional_get_missing(self):
+        # a food that doesn't exist is a 404 whatever the validators say
+        url = '/foods/99999'
+        etag = self.client.get('/foods/01001')['ETag']
+        for headers in ({'HTTP_IF_MODIFIED_SINCE':
+                         'Sat, 30 Aug 2099 00:00:00 GMT'},
+                        {'HTTP_IF_NONE_MATCH': '*'},
+                        {'HTTP_IF_NONE_MATCH': etag}):
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 404, headers)
+            self.assertFalse(response.has_header('ETag'))
+            self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get('/nutrients/203/top?limit=x',
+                                   HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rendered_response_cache(self):
+        url = '/foods/01001/seqs/1/nutrients/203'
+        response = self.client.get(url)
+        content = response.content
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {"food_id": "01001", "seq_id": "1", "nutr_id": "203",
+                          "value": 0.0425})
+
+        # errors are not cached
+        url = '/foods/01001/seqs/9/nutrients/203'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,53 @@
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+from restful.encoders import RawJSON, RowEncoder
+from restful.serializers import FoodDetailSerializer
+
+
+class FastSerializerTestCase(APITestCase):
+    """
+    JSON from the precompiled encoders must match the serializers' exactly.
+    """
+    endpoints = ('/foods', '/foods?page_size=7',
+                 '/foods?page_size=3&count=true', '/foods/01001',
+                 '/foods/01005', '/foods/01001/seqs', '/foods/01001/seqs/2',
+                 '/foods/search?q=cheese', '/nutrients',
+                 '/nutrients?page_size=10', '/nutrients/203', '/nutrients/317',
+                 '/foodgroups', '/foodgroups/0100')
+
+    def get(self, url, fast):
+        with override_settings(USDAREST_FAST_SERIALIZERS=fast):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_byte_compatible(self):
+        for url in self.endpoints:
+            fast = self.get(url, True)
+            self.assertIsInstance(fast.data, RawJSON)
+            self.assertEqual(fast.content, self.get(url, False).content, url)
+            self.assertEqual(fast['Content-Type'], 'application/json')
+
+    def test_next_pages(self):
+        url = '/foods?page_size=6'
+        while url:
+            fast = self.get(url, True)
+            self.assertEqual(fast.content, self.get(url, False).content, url)
+            url = self.get(url, False).data['next']
+
+    def test_fallbacks(self):
+        with override_settings(USDAREST_FAST_SERIALIZERS=True):
+            self.assertEqual(self.client.get('/foods/01001').status_code, 200)
+            response = self.client.get('/foods/99999')
+            self.assertEqual(response.status_code, 404)
+            # the browsable API and indented JSON use the serializers
+            response = self.client.get('/foods/01001?format=api')
+            self.assertIn(b'Butter, salted', response.content)
+            response = self.client.get(
+                '/foods/01001', HTTP_ACCEPT='application/json; indent=4')
+            self.assertIn(b'\n    "food_id": "01001"', response.content)
+
+    def test_encoder(self):
+        encoder = RowEncoder.for_serializer(FoodDetailSerializer)
+        self.assertIs(encoder, RowEncoder.for_serializer(FoodDetailSerializer))
+        self.assertEqual(encoder.sources[:2], ('food_id', 'food_group_id'))
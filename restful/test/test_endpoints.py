@@ -1,6 +1,8 @@
 from django.core.urlresolvers import reverse
 from rest_framework.test import APITestCase
 from decimal import Decimal
+from restful.cache import get_reference_cache
+from restful.models import Weight
 
 
 class AssertStatusCodesMixin(object):
@@ -43,6 +45,58 @@ class FoodTest(APITestCase, AssertStatusCodesMixin):
         _keys = {"food_id": 0, "long_desc": 0, "short_desc": 0}.keys()
         self.assertEqual(response.data["results"][0].keys(), _keys)
 
+    def test_endpoint_food_bulk(self):
+        url = reverse("food:food-list", kwargs={})
+        get_reference_cache().warm()
+
+        # the same number of queries for any number of foods
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'ids': '01002,01001,99999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([food["food_id"] for food in response.data["results"]],
+                         ["01002", "01001"])
+        self.assertEqual(response.data["not_found"], ["99999"])
+        butter = response.data["results"][1]
+        self.assertEqual(butter["long_desc"], "Butter, salted")
+        self.assertEqual([weight["seq"] for weight in butter["weights"]],
+                         ["1", "2", "3", "4"])
+        self.assertEqual(butter["weights"][1]["grams"], "14.2")
+        self.assertNotIn("nutrients", butter)
+
+        ids = ','.join('010%02d' % i for i in range(1, 21))
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'ids': ids,
+                                             'nutrients': '204,203'})
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertEqual(response.data["results"][0]["nutrients"],
+                         [{"nutr_id": "203", "value": "0.850"},
+                          {"nutr_id": "204", "value": "81.110"}])
+        self.assertEqual(response.data["results"][1]["nutrients"], [])
+
+        self.assertEqual(self.client.get(url, {'ids': ''}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'ids': '01001',
+                                               'nutrients': '999'}
+                                         ).status_code, 400)
+        ids = ','.join(str(i) for i in range(501))
+        self.assertEqual(self.client.get(url, {'ids': ids}).status_code, 400)
+        # duplicates count against the limit, they are dropped after it
+        self.assertEqual(self.client.get(url, {'ids': ','.join(
+            ['01001'] * 501)}).status_code, 400)
+        response = self.client.get(url, {'ids': '01001,01002,01001'})
+        self.assertEqual([food["food_id"] for food in response.data["results"]],
+                         ["01001", "01002"])
+
+    def test_endpoint_food_bulk_weight_order(self):
+        # seqs in numeric order, not as text
+        url = reverse("food:food-list", kwargs={})
+        for seq in ('10', '2', '1'):
+            Weight.objects.create(food_id='01002', seq=seq, amount=1,
+                                  measure_desc='cup', grams=200)
+        response = self.client.get(url, {'ids': '01002'})
+        self.assertEqual([weight["seq"] for weight in
+                          response.data["results"][0]["weights"]],
+                         ["1", "2", "10"])
+
     def test_endpoint_food_detail(self):
         url = reverse("food:food-detail", kwargs={'food_id': '01001'})
 
@@ -102,16 +156,25 @@ class WeightTest(APITestCase, AssertStatusCodesMixin):
 class NutrientTest(APITestCase, AssertStatusCodesMixin):
     # **in the food url namespace
     def test_endpoint_food_nutrient_list(self):
-        url = reverse("food:nutrient-list", kwargs={'food_id': '01001', 'seq_id': '01'})
+        url = reverse("food:nutrient-list", kwargs={'food_id': '01001', 'seq_id': '1'})
 
         # test response status codes
         self.assert_readonly_endpoint(url)
 
         # test response data
         response = self.client.get(url)
-        # grab the dict_keys type with the desired keys
-        _keys = {"nutr_id": 0, "nutr_desc": 0}.keys()
-        self.assertEqual(response.data["results"][0].keys(), _keys)
+        self.assertEqual(response.data["grams"], Decimal('5.0'))
+        self.assertEqual(len(response.data["nutrients"]), 114)
+        protein = [n for n in response.data["nutrients"]
+                   if n["nutr_id"] == "203"]
+        self.assertEqual(protein, [{"nutr_id": "203",
+                                    "nutr_desc": "Protein",
+                                    "units": "g",
+                                    "value": Decimal('0.0425')}])
+
+        # unknown measure
+        url = reverse("food:nutrient-list", kwargs={'food_id': '01001', 'seq_id': '9'})
+        self.assertEqual(self.client.get(url).status_code, 404)
 
     def test_endpoint_food_nutrient_detail(self):
         url = reverse("food:nutrient-detail", kwargs={'food_id': '01001',
@@ -129,6 +192,37 @@ class NutrientTest(APITestCase, AssertStatusCodesMixin):
                 "seq_id": "1"}
         self.assertEqual(response.data, data)
 
+    def test_endpoint_food_nutrient_batch(self):
+        url = reverse("food:nutrient-batch", kwargs={})
+
+        # test response status codes, POST only
+        self.assert_statuses(url, {'get': 405, 'post': 200, 'put': 405,
+                                   'patch': 405, 'delete': 405,
+                                   'options': 200, 'head': 405})
+
+        # test response data
+        items = [{"food_id": "01001", "seq_id": "1", "nutr_id": "203"},
+                 {"food_id": "01001", "seq_id": "9", "nutr_id": "203"}]
+        response = self.client.post(url, items, format='json')
+        data = [{"value": Decimal('0.0425'),
+                 "food_id": "01001",
+                 "nutr_id": "203",
+                 "seq_id": "1"},
+                {"value": None,
+                 "food_id": "01001",
+                 "nutr_id": "203",
+                 "seq_id": "9"}]
+        self.assertEqual(response.data, data)
+
+        # malformed items are rejected
+        response = self.client.post(url, [{"food_id": "01001"}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # too many items, whether valid or not
+        response = self.client.post(url, [{}] * 1001, format='json')
+        self.assertEqual(response.data,
+                         {"detail": "At most 1000 items per request."})
+
     # **in the nutrient url namespace
     def test_endpoint_nutrient_list(self):
         url = reverse("nutrient:nutrient-list", kwargs={})
@@ -157,3 +251,116 @@ class NutrientTest(APITestCase, AssertStatusCodesMixin):
                 "decimal_places": "2",
                 "sr_order": "600"}
         self.assertEqual(response.data, data)
+
+
+class RecipeTest(APITestCase, AssertStatusCodesMixin):
+    def test_endpoint_recipe_compute(self):
+        url = reverse("recipe:recipe-compute", kwargs={})
+
+        # test response status codes, POST only
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.put(url).status_code, 405)
+        self.assertEqual(self.client.delete(url).status_code, 405)
+
+        # test response data: 2 pats of butter and 50 g of butter
+        recipe = {"ingredients": [
+            {"food_id": "01001", "seq_id": "1", "quantity": "2"},
+            {"food_id": "01001", "grams": "50"}]}
+        response = self.client.post(url, recipe, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["grams"], Decimal('60.0'))
+        self.assertEqual(len(response.data["nutrients"]), 114)
+        # rounded to the nutrient's decimal_places
+        self.assertEqual(response.data["nutrients"][0],
+                         {"nutr_id": "255", "nutr_desc": "Water", "units": "g",
+                          "value": Decimal('9.52')})
+        self.assertEqual(
+            [(i["food_id"], i["grams"], i["nutrients"]["203"])
+             for i in response.data["ingredients"]],
+            [("01001", Decimal('10.0'), Decimal('0.09')),
+             ("01001", Decimal('50.0'), Decimal('0.43'))])
+
+        # ingredients need either a seq_id or grams, and must exist
+        for ingredient in ({"food_id": "01001"},
+                           {"food_id": "01001", "seq_id": "9"},
+                           {"food_id": "99999", "grams": "10"}):
+            response = self.client.post(url, {"ingredients": [ingredient]},
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+
+        # too many ingredients, whether valid or not
+        response = self.client.post(url, {"ingredients": [{}] * 101},
+                                    format='json')
+        self.assertEqual(response.data,
+                         {"detail": "Give between 1 and 100 ingredients."})
+
+
+class PortionTest(APITestCase):
+    def test_endpoint_portion_compute(self):
+        url = reverse("portion:portion-compute", kwargs={})
+
+        # POST only
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        # butter: 250 g, 3 oz, 1.5 cups and 2 tbsp (seq 2), protein only
+        portions = {"portions": [
+            {"food_id": "01001", "quantity": "250", "unit": "g"},
+            {"food_id": "01001", "quantity": "3", "unit": "oz"},
+            {"food_id": "01001", "quantity": "1.5", "unit": "Cups"},
+            {"food_id": "01001", "quantity": "2", "seq_id": "2"}],
+            "nutrients": ["203"]}
+        response = self.client.post(url, portions, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(p["grams"], p["nutrients"][0]["value"])
+             for p in response.data["portions"]],
+            [(Decimal('250.0'), Decimal('2.13')),
+             (Decimal('85.0'), Decimal('0.72')),
+             (Decimal('340.5'), Decimal('2.89')),
+             (Decimal('28.4'), Decimal('0.24'))])
+        self.assertEqual(response.data["portions"][1]["unit"], "oz")
+        self.assertEqual(response.data["portions"][3]["seq_id"], "2")
+
+        # all nutrients by default, a measure found by its first word
+        response = self.client.post(url, {"portions": [
+            {"food_id": "01001", "unit": "pat"}]}, format='json')
+        portion = response.data["portions"][0]
+        self.assertEqual(portion["grams"], Decimal('5.0'))
+        self.assertEqual(len(portion["nutrients"]), 114)
+
+        # a unit or a seq_id, both must exist
+        for item in ({"food_id": "01001"},
+                     {"food_id": "01001", "unit": "g", "seq_id": "1"},
+                     {"food_id": "01001", "unit": "bushel"},
+                     {"food_id": "01001", "seq_id": "9"},
+                     {"food_id": "99999", "unit": "g"}):
+            response = self.client.post(url, {"portions": [item]},
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+
+        # too many portions, whether valid or not
+        response = self.client.post(url, {"portions": [{}] * 1001},
+                                    format='json')
+        self.assertEqual(response.data,
+                         {"detail": "Give between 1 and 1000 portions."})
+
+    def test_endpoint_portion_ambiguous_unit(self):
+        url = reverse("portion:portion-compute", kwargs={})
+        Weight.objects.create(food_id='01002', seq='1', amount=1,
+                              measure_desc='cup, melted', grams=200)
+        Weight.objects.create(food_id='01002', seq='2', amount=1,
+                              measure_desc='cup, whipped', grams=150)
+        get_reference_cache().invalidate()
+        self.addCleanup(get_reference_cache().invalidate)
+
+        # "cup" could be either, the error lists them
+        response = self.client.post(url, {"portions": [
+            {"food_id": "01002", "unit": "cups"}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["portions"],
+                         ['Portion 0: "cups" is ambiguous, one of: '
+                          'cup, melted; cup, whipped.'])
+        response = self.client.post(url, {"portions": [
+            {"food_id": "01002", "unit": "Cup, whipped"}]}, format='json')
+        self.assertEqual(response.data["portions"][0]["grams"],
+                         Decimal('150.0'))
@@ -0,0 +1,57 @@
+import csv
+import gzip
+import io
+import json
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+
+class FoodExportTest(TestCase):
+    def get_content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_export_ndjson(self):
+        url = reverse("export:food-export", kwargs={'export_format': 'ndjson'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        lines = self.get_content(response).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 20)
+
+        food = json.loads(lines[0])
+        self.assertEqual(food["food_id"], "01001")
+        self.assertEqual(food["food_group_id"], "0100")
+        self.assertEqual(food["long_desc"], "Butter, salted")
+        self.assertEqual([w["seq"] for w in food["weights"]],
+                         ["1", "2", "3", "4"])
+        self.assertEqual(food["weights"][1]["measure_desc"], "tbsp")
+        self.assertEqual(float(food["weights"][1]["grams"]), 14.2)
+        self.assertEqual(len(food["nutrients"]), 114)
+        self.assertEqual(float(food["nutrients"]["203"]), 0.85)
+
+        # foods without weights or nutrient data
+        food = json.loads(lines[1])
+        self.assertEqual((food["food_id"], food["weights"], food["nutrients"]),
+                         ("01002", [], {}))
+
+    def test_export_csv(self):
+        url = reverse("export:food-export", kwargs={'export_format': 'csv'})
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(
+            self.get_content(response).decode('utf-8'))))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0]["food_id"], "01001")
+        self.assertEqual(float(rows[0]["nutr_203"]), 0.85)
+        self.assertEqual(rows[1]["nutr_203"], "")
+        self.assertEqual(len(json.loads(rows[0]["weights"])), 4)
+
+    def test_export_gzip(self):
+        url = reverse("export:food-export", kwargs={'export_format': 'ndjson'})
+        plain = self.get_content(self.client.get(url))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(self.get_content(response)), plain)
@@ -0,0 +1,68 @@
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+from restful import matrix
+from restful.filtering import filter_foods
+from restful.test.test_similarity import NutrientDataMixin
+
+
+class FilterFoodsTestCase(NutrientDataMixin, APITestCase):
+    # protein, fat and carbohydrate per 100 g: 01001 (0.85, 81.11, 0.06) and
+    # see NutrientDataMixin for 01002 to 01006
+
+    def setUp(self):
+        super(FilterFoodsTestCase, self).setUp()
+        matrix.invalidate()
+
+    def tearDown(self):
+        super(FilterFoodsTestCase, self).tearDown()
+        matrix.invalidate()
+
+    def assertFilter(self, expected, *args, **kwargs):
+        self.assertEqual(filter_foods(*args, **kwargs), expected)
+        with override_settings(USDAREST_NUTRIENT_MATRIX=True):
+            matrix.get_matrix()
+            with self.assertNumQueries(0):
+                self.assertEqual(filter_foods(*args, **kwargs), expected)
+
+    def test_filter_foods(self):
+        self.assertFilter(['01004', '01005', '01006'], [('203', 20, None)])
+        self.assertFilter(['01004', '01006'],
+                          [('203', 20, None), ('204', None, 29)])
+        # bounds are inclusive, foods without the nutrient never match
+        self.assertFilter(['01001', '01002'], [('203', 0.85, 1)])
+        self.assertFilter(['01002', '01003', '01005'],
+                          [('205', None, 0), ('203', 0.1, None)])
+        self.assertFilter([], [('203', 20, None)], food_group='0200')
+        self.assertFilter(['01004'], [('203', 20, None), ('205', 1, None)],
+                          food_group='0100')
+
+    def test_filter_foods_per_measure(self):
+        # 0.85 g of protein per 100 g, the pat (seq 1) of butter is 5 g, the
+        # other foods have no measures
+        self.assertFilter(['01001'], [('203', 0.0425, 0.0425)],
+                          basis='measure')
+        self.assertFilter([], [('203', 0.05, None)], basis='measure')
+
+    def test_filter_endpoint(self):
+        response = self.client.get('/foods/filter?min_203=0.5&max_204=99'
+                                   '&page_size=2&count=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([food['food_id'] for food in response.data['results']],
+                         ['01001', '01002'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([food['food_id'] for food in response.data['results']],
+                         ['01004', '01005'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([food['food_id'] for food in response.data['results']],
+                         ['01006'])
+        self.assertEqual(response.data['next'], None)
+
+        response = self.client.get('/foods/filter?min_203=0.04&basis=measure')
+        self.assertEqual(response.data['results'][0]['food_id'], '01001')
+
+    def test_filter_endpoint_errors(self):
+        for url in ('/foods/filter', '/foods/filter?min_999=1',
+                    '/foods/filter?min_203=a', '/foods/filter?food_group=0100',
+                    '/foods/filter?min_203=1&basis=cup'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
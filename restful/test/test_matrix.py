@@ -0,0 +1,75 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+from restful import matrix
+from restful.cache import get_reference_cache
+from restful.models import Weight
+from restful.calculations import nutrient_values, nutrient_profile, \
+    recipe_nutrients
+from decimal import Decimal
+import numpy
+
+
+class NutrientMatrixTestCase(TestCase):
+    """
+    The in-memory nutrient matrix must give the same results as the database.
+    """
+    def setUp(self):
+        matrix.invalidate()
+
+    def tearDown(self):
+        matrix.invalidate()
+
+    def test_matrix_build(self):
+        nutrient_matrix = matrix.get_matrix()
+        self.assertEqual(nutrient_matrix.release, 'SR27')
+        self.assertEqual(nutrient_matrix.values.shape, (20, 150))
+        self.assertEqual(nutrient_matrix.values.dtype, numpy.float32)
+        self.assertEqual(nutrient_matrix.value('01001', '203'), Decimal('0.850'))
+        # missing values are NaN
+        self.assertEqual(nutrient_matrix.value('01002', '203'), None)
+        self.assertEqual(int(numpy.isnan(nutrient_matrix.values).sum()),
+                         20 * 150 - 114)
+        self.assertEqual(nutrient_matrix.grams('01001', '2'), Decimal('14.2'))
+
+    def test_matrix_calculations(self):
+        triples = [('01001', '1', '203'), ('01001', '4', '208'),
+                   ('01001', '9', '203'), ('01002', '1', '203')]
+        expected = nutrient_values(triples)
+        expected_profile = nutrient_profile('01001', '3')
+
+        with override_settings(USDAREST_NUTRIENT_MATRIX=True):
+            matrix.get_matrix()
+            with self.assertNumQueries(0):
+                self.assertEqual(nutrient_values(triples), expected)
+                self.assertEqual(nutrient_profile('01001', '3'),
+                                 expected_profile)
+                self.assertEqual(nutrient_profile('01001', '9'), None)
+
+    def test_matrix_profile_without_nutrients(self):
+        # a measure of a food without nutrient rows is an empty profile
+        Weight.objects.create(food_id='01002', seq='1', amount=1,
+                              measure_desc='pat', grams=Decimal('3.8'))
+        get_reference_cache().invalidate()
+        self.addCleanup(get_reference_cache().invalidate)
+        expected = (Decimal('3.8'), [])
+        self.assertEqual(nutrient_profile('01002', '1'), expected)
+        with override_settings(USDAREST_NUTRIENT_MATRIX=True):
+            self.assertEqual(nutrient_profile('01002', '1'), expected)
+
+    def test_matrix_recipe(self):
+        ingredients = [{'food_id': '01001', 'seq_id': '2',
+                        'quantity': Decimal('1.5')},
+                       {'food_id': '01001', 'grams': Decimal('100')}]
+        expected = recipe_nutrients(ingredients)
+        self.assertEqual(expected['grams'], Decimal('121.3'))
+
+        with override_settings(USDAREST_NUTRIENT_MATRIX=True):
+            matrix.get_matrix()
+            with self.assertNumQueries(0):
+                self.assertEqual(recipe_nutrients(ingredients), expected)
+
+    def test_matrix_rebuilds_on_release_change(self):
+        nutrient_matrix = matrix.get_matrix()
+        self.assertIs(matrix.get_matrix(), nutrient_matrix)
+        with override_settings(USDA_RELEASE='SR28'):
+            self.assertEqual(matrix.get_matrix().release, 'SR28')
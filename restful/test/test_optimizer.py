@@ -0,0 +1,100 @@
+import numpy
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+from restful import matrix
+from restful.cache import get_reference_cache
+from restful.models import Weight
+from restful.optimizer import Infeasible, linprog
+from restful.test.test_similarity import NutrientDataMixin
+
+
+class LinprogTestCase(SimpleTestCase):
+    def test_linprog(self):
+        # max x + 2y (min -x - 2y) st x + y <= 4, x + 3y <= 6, x <= 3
+        x = linprog(numpy.array([-1.0, -2.0]),
+                    numpy.array([[1.0, 1.0], [1.0, 3.0]]),
+                    numpy.array([4.0, 6.0]), numpy.array([3.0, 10.0]))
+        numpy.testing.assert_allclose(x, [3, 1])
+
+        # min x + y st x + 2y >= 4 (-x - 2y <= -4), 3x + y >= 3
+        x = linprog(numpy.array([1.0, 1.0]),
+                    numpy.array([[-1.0, -2.0], [-3.0, -1.0]]),
+                    numpy.array([-4.0, -3.0]), numpy.array([10.0, 10.0]))
+        numpy.testing.assert_allclose(x, [0.4, 1.8])
+
+    def test_linprog_infeasible(self):
+        # x >= 2 with x <= 1
+        with self.assertRaises(Infeasible):
+            linprog(numpy.array([1.0]), numpy.array([[-1.0]]),
+                    numpy.array([-2.0]), numpy.array([1.0]))
+
+
+class DietOptimizerTestCase(NutrientDataMixin, APITestCase):
+    url = '/diets/optimize'
+
+    def setUp(self):
+        super(DietOptimizerTestCase, self).setUp()
+        # only butter has measures in the fixture
+        for food_id in self.values:
+            Weight.objects.create(food_id=food_id, seq='1', amount=1,
+                                  measure_desc='cup', grams=200)
+        get_reference_cache().invalidate()
+        matrix.invalidate()
+
+    def tearDown(self):
+        super(DietOptimizerTestCase, self).tearDown()
+        get_reference_cache().invalidate()
+        matrix.invalidate()
+
+    def optimize(self, data, status_code=200):
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status_code, response.data)
+        return response.data
+
+    def test_optimize_mass(self):
+        # 01005 has the most protein per gram, 25 g per 100 g
+        data = {'targets': [{'nutr_id': '203', 'min': '20'}]}
+        plan = self.optimize(data)
+        self.assertEqual(plan['grams'], 80)
+        self.assertEqual(plan['foods'], [
+            {'food_id': '01005', 'long_desc': 'Cheese, brick', 'seq_id': '1',
+             'measure_desc': 'cup', 'quantity': 0.4, 'grams': 80}])
+        self.assertEqual(plan['nutrients'][0]['value'], 20)
+
+        with override_settings(USDAREST_NUTRIENT_MATRIX=True):
+            self.assertEqual(self.optimize(data), plan)
+
+        # excluded foods, food groups and most grams of a food
+        data['exclude'] = ['01005']
+        self.assertEqual(self.optimize(data)['grams'], 95.2)
+        data = {'targets': [{'nutr_id': '203', 'min': '20'}], 'max_grams': 50}
+        plan = self.optimize(data)
+        self.assertEqual([(food['food_id'], food['grams'])
+                          for food in plan['foods']],
+                         [('01004', 35.7), ('01005', 50)])
+        data['food_groups'] = ['0200']
+        self.optimize(data, 400)
+
+    def test_optimize_energy(self):
+        # butter is the only food with an energy value, 717 kcal
+        plan = self.optimize({'targets': [{'nutr_id': '203', 'min': '0.5'}],
+                              'objective': 'energy'})
+        self.assertEqual([(food['food_id'], food['seq_id'], food['quantity'])
+                          for food in plan['foods']], [('01001', '1', 11.76)])
+        self.assertEqual(plan['energy'], 421.8)
+
+    def test_optimize_errors(self):
+        # no food has more protein than fat
+        self.optimize({'targets': [{'nutr_id': '203', 'min': '20'},
+                                   {'nutr_id': '204', 'max': '20'}]}, 400)
+        self.optimize({'targets': []}, 400)
+        self.optimize({'targets': [{'nutr_id': '999', 'min': '1'}]}, 400)
+        self.optimize({'targets': [{'nutr_id': '203'}]}, 400)
+        self.optimize({'targets': [{'nutr_id': '203', 'min': '2',
+                                    'max': '1'}]}, 400)
+        self.optimize({'targets': [{'nutr_id': '203', 'min': '1'}],
+                       'objective': 'taste'}, 400)
+        # too many targets, whether valid or not
+        self.assertEqual(self.optimize({'targets': [{}] * 51}, 400),
+                         {'detail': 'Give between 1 and 50 targets.'})
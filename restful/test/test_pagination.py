@@ -0,0 +1,50 @@
+from rest_framework.test import APITestCase
+
+
+class KeysetPaginationTest(APITestCase):
+    def walk(self, url):
+        """ Follow the next links from url, return the pages' results. """
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data["results"])
+            url = response.data["next"]
+        return pages
+
+    def test_pagination_food_list(self):
+        pages = self.walk('/foods?page_size=8')
+        self.assertEqual([len(page) for page in pages], [8, 8, 4])
+        food_ids = [food["food_id"] for page in pages for food in page]
+        self.assertEqual(food_ids, ['%05d' % i for i in range(1001, 1021)])
+
+    def test_pagination_nutrient_list(self):
+        # served from the reference cache as a list
+        pages = self.walk('/nutrients?page_size=100')
+        self.assertEqual([len(page) for page in pages], [100, 50])
+        nutr_ids = [nutrient["nutr_id"] for page in pages for nutrient in page]
+        self.assertEqual(nutr_ids, sorted(nutr_ids))
+
+    def test_pagination_count(self):
+        response = self.client.get('/foods')
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertEqual(response.data["next"], None)
+        response = self.client.get('/foods?count=true&page_size=5')
+        self.assertEqual(response.data["count"], 20)
+
+    def test_pagination_page_size_bounds(self):
+        response = self.client.get('/nutrients?page_size=5000')
+        self.assertEqual(len(response.data["results"]), 150)
+        response = self.client.get('/nutrients?page_size=0')
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_pagination_invalid_cursor(self):
+        response = self.client.get('/foods?cursor=%%%')
+        self.assertEqual(response.status_code, 404)
+
+    def test_pagination_queries(self):
+        # one query per page, no COUNT(*) and no OFFSET
+        response = self.client.get('/foods?page_size=5')
+        with self.assertNumQueries(1):
+            self.client.get(response.data["next"])
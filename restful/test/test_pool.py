@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from restful.backends.pooled.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.usable = True
+        self.closed = False
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('restful.backends.pooled.pool.time.time',
+                        lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.reset = True
+        self.pool = ConnectionPool(
+            FakeConnection, lambda conn: conn.usable,
+            lambda conn: self.reset, self.close, max_size=2, timeout=0.01,
+            health_check_interval=30, max_lifetime=3600)
+
+    def close(self, conn):
+        conn.closed = True
+
+    def test_reuse(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        self.assertIs(self.pool.get(), conn)
+        self.assertEqual(self.pool.size, 1)
+
+    def test_max_size(self):
+        first, second = self.pool.get(), self.pool.get()
+        self.assertRaises(PoolTimeout, self.pool.get)
+        self.pool.put(first)
+        self.assertIs(self.pool.get(), first)
+        self.pool.put(second, discard=True)
+        self.assertTrue(second.closed)
+        self.assertIsNot(self.pool.get(), second)
+
+    def test_failed_reset(self):
+        conn = self.pool.get()
+        self.reset = False
+        self.pool.put(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual((self.pool.size, self.pool.idle), (0, 0))
+
+    def test_health_check(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        conn.usable = False
+        # only connections idle for a while are checked
+        self.now += 10
+        self.assertIs(self.pool.get(), conn)
+        self.pool.put(conn)
+        self.now += 60
+        replacement = self.pool.get()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+
+    def test_max_lifetime(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        self.now += 3601
+        self.assertIsNot(self.pool.get(), conn)
+        self.assertTrue(conn.closed)
+
+    def test_clear(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        self.pool.clear()
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.size, 0)
@@ -0,0 +1,43 @@
+import json
+
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+from restful import profiling
+
+
+@override_settings(USDAREST_PROFILING_SAMPLE_RATE=1)
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        profiling.reset()
+
+    def test_server_timing(self):
+        with self.assertLogs('restful.profiling', 'INFO') as logs:
+            response = self.client.get('/foods/01001/seqs/1/nutrients/203')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(';desc="1 queries"', timing)
+        for phase in ('serialize', 'render', 'total'):
+            self.assertIn(phase + ';dur=', timing)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'food:nutrient-detail')
+        self.assertEqual(record['queries'], 1)
+        self.assertEqual(record['status'], 200)
+        self.assertGreaterEqual(record['total_ms'], record['db_ms'])
+
+    def test_metrics(self):
+        self.client.get('/foodgroups/0100')
+        self.client.get('/foodgroups/0100')
+        content = self.client.get('/metrics').content.decode('utf-8')
+        self.assertIn('usdarest_requests_total{view="foodgroup:'
+                      'foodgroup-detail"} 2', content)
+        self.assertIn('usdarest_request_seconds_count{phase="total",'
+                      'view="foodgroup:foodgroup-detail"} 2', content)
+        self.assertIn('usdarest_request_queries_bucket{le="+Inf",'
+                      'view="foodgroup:foodgroup-detail"} 2', content)
+
+    def test_sampling(self):
+        with override_settings(USDAREST_PROFILING_SAMPLE_RATE=0):
+            response = self.client.get('/nutrients/203')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(profiling.metrics().count('nutrient-detail'), 0)
@@ -0,0 +1,70 @@
+from decimal import Decimal
+from django.core.urlresolvers import reverse
+from rest_framework.test import APITestCase
+from restful import matrix
+from restful.models import NutrientData, Weight
+from django.test.utils import override_settings
+from restful.rankings import get_ranking_index, top_foods
+
+
+class NutrientRankingTest(APITestCase):
+    def setUp(self):
+        # the fixture only has nutrient data for 01001
+        for food_id, value in (('01002', '5.000'), ('01004', '21.400')):
+            NutrientData.objects.create(food_id=food_id, nutrient_id='203',
+                                        nutr_value=Decimal(value),
+                                        num_data_pts=0, source_code='1')
+        Weight.objects.create(food_id='01004', seq='1', amount=Decimal('1'),
+                              measure_desc='oz', grams=Decimal('28.4'))
+        matrix.invalidate()
+
+    def tearDown(self):
+        matrix.invalidate()
+
+    def top(self, **kwargs):
+        return [food_id for food_id, _, _, _ in
+                get_ranking_index().top('203', **kwargs)]
+
+    def test_ranking_per_100g(self):
+        self.assertEqual(self.top(), ['01004', '01002', '01001'])
+        self.assertEqual(self.top(limit=2), ['01004', '01002'])
+        self.assertEqual(self.top(ascending=True), ['01001', '01002', '01004'])
+        self.assertEqual(self.top(food_group='0100'), ['01004', '01002', '01001'])
+        self.assertEqual(self.top(food_group='0200'), [])
+
+    def test_ranking_per_measure(self):
+        # 01002 has no measures
+        self.assertEqual(get_ranking_index().top('203', basis='measure'),
+                         [('01004', '1', Decimal('28.4'), Decimal('6.0776')),
+                          ('01001', '1', Decimal('5.0'), Decimal('0.0425'))])
+
+    def test_ranking_from_database(self):
+        # without the nutrient matrix, the same rankings in SQL
+        for kwargs in ({}, {'limit': 2}, {'ascending': True},
+                       {'food_group': '0100'}, {'food_group': '0200'},
+                       {'basis': 'measure'},
+                       {'basis': 'measure', 'ascending': True, 'limit': 1}):
+            with override_settings(USDAREST_NUTRIENT_MATRIX=False):
+                with self.assertNumQueries(1):
+                    ranked = top_foods('203', **kwargs)
+            self.assertEqual(ranked, get_ranking_index().top('203', **kwargs),
+                             kwargs)
+
+    def test_endpoint_nutrient_top(self):
+        url = reverse("nutrient:nutrient-top", kwargs={'nutr_id': '203'})
+        response = self.client.get(url, {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            "nutr_id": "203", "basis": "100g", "food_group": None,
+            "results": [{"food_id": "01004", "long_desc": "Cheese, blue",
+                         "value": Decimal('21.400')}]})
+
+        response = self.client.get(url, {'basis': 'measure',
+                                         'food_group': '0100', 'order': 'asc'})
+        self.assertEqual([(r["food_id"], r["seq_id"]) for r in
+                          response.data["results"]],
+                         [('01001', '1'), ('01004', '1')])
+
+        self.assertEqual(self.client.get(url, {'basis': 'cup'}).status_code, 400)
+        url = reverse("nutrient:nutrient-top", kwargs={'nutr_id': '999'})
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+from restful import records
+from restful.models import FoodDesc, NutrientData
+from restful.records import FoodRecord, NutrientRecord, WeightRecord
+
+
+class RecordsTestCase(TestCase):
+    def test_from_values_list(self):
+        foods = records.from_values_list(FoodRecord)
+        self.assertEqual(len(foods), 20)
+        butter = foods[0]
+        food = FoodDesc.objects.get(pk='01001')
+        self.assertEqual(butter.food_id, '01001')
+        self.assertEqual(butter.food_group_id, '0100')
+        self.assertEqual(butter.long_desc, food.long_desc)
+        self.assertEqual(butter.n_factor, float(food.n_factor))
+
+        rows = records.from_values_list(NutrientRecord, NutrientData.objects
+                                        .filter(food='01001', nutrient='203'))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0].nutr_id, rows[0].nutr_value), ('203', 0.85))
+        self.assertIsInstance(rows[0].nutr_value, float)
+
+        weights = records.from_values_list(WeightRecord)
+        self.assertEqual([(w.seq.strip(), w.grams) for w in weights],
+                         [('1', 5.0), ('2', 14.2), ('3', 227.0), ('4', 113.0)])
+
+    def test_records_are_read_only(self):
+        food = records.from_values_list(FoodRecord)[0]
+        with self.assertRaises(AttributeError):
+            food.long_desc = 'Margarine'
+        with self.assertRaises(AttributeError):
+            food.extra = 1
+
+    def test_from_sr_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'WEIGHT.txt'), 'wb') as f:
+            f.write(b'~01001~^~1~^1^~pat (1" sq, 1/3" high)~^5.0^^\r\n'
+                    b'~01001~^~2~^1^~tbsp~^14.2^4^0.5\r\n')
+        weights = records.from_sr_file(WeightRecord, directory)
+        self.assertEqual(weights[1], WeightRecord(
+            '01001', '2', 1.0, 'tbsp', 14.2, 4.0, 0.5))
+        self.assertEqual(weights[0].num_data_pts, None)
+        # codes are shared
+        self.assertIs(weights[0].food_id, weights[1].food_id)
+
+    def test_records_memory_command(self):
+        out = StringIO()
+        call_command('records_memory', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(lines[2].startswith('usda_food_desc'))
+        self.assertTrue(lines[-1].startswith('total'))
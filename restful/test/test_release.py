@@ -0,0 +1,110 @@
+import datetime
+
+from django.test import TestCase
+from rest_framework.test import APITestCase
+from restful import matrix, release, search
+from restful.models import Release, ReleaseChange
+
+
+class ReleasesMixin(object):
+    """
+    SR28 loaded next to SR27, changing food 01002.
+    """
+    def setUp(self):
+        self.sr27 = Release.objects.create(
+            name='SR27', schema='public',
+            release_date=datetime.date(2014, 8, 29), active=True)
+        self.sr28 = Release.objects.create(
+            name='SR28', schema='sr28',
+            release_date=datetime.date(2015, 9, 1))
+        ReleaseChange.objects.create(release=self.sr28, food_id='01002')
+        release.check(force=True)
+
+    def tearDown(self):
+        Release.objects.all().delete()
+        release.check(force=True)
+
+
+class ReleaseTestCase(ReleasesMixin, TestCase):
+    def test_switch(self):
+        self.assertEqual(release.current_release(), 'SR27')
+        self.sr28.activate()
+        # running workers only notice on their next check
+        self.assertEqual(release.current_release(), 'SR27')
+        release.check(force=True)
+        self.assertEqual(release.current_release(), 'SR28')
+        self.assertEqual(release.food_version('01001'),
+                         'SR27@%s' % self.sr27.loaded_at.isoformat())
+        self.assertEqual(release.food_version('01002'),
+                         'SR28@%s' % self.sr28.loaded_at.isoformat())
+
+        self.sr27.activate()
+        release.check(force=True)
+        self.assertEqual(release.current_release(), 'SR27')
+        self.assertEqual(release.food_version('01002'),
+                         release.current_version())
+
+    def test_reload(self):
+        # load_sr loading the active release again is a new state
+        loaded_at = release.current_loaded_at()
+        self.assertEqual(loaded_at, self.sr27.loaded_at.isoformat())
+        Release.objects.filter(name='SR27').update(
+            loaded_at=self.sr27.loaded_at + datetime.timedelta(hours=1))
+        release.check(force=True)
+        self.assertEqual(release.current_release(), 'SR27')
+        self.assertNotEqual(release.current_loaded_at(), loaded_at)
+
+    def test_pinned(self):
+        release.pin()
+        try:
+            self.sr28.activate()
+            release.check(force=True)
+            self.assertEqual(release.current_release(), 'SR27')
+        finally:
+            release.unpin()
+        self.assertEqual(release.current_release(), 'SR28')
+
+
+class ReleaseResponseTestCase(ReleasesMixin, APITestCase):
+    def test_etags_survive_unchanged_foods(self):
+        unchanged = self.client.get('/foods/01001')
+        changed = self.client.get('/foods/01002')
+        nutrient = self.client.get('/nutrients/203')
+
+        self.sr28.activate()
+        release.check(force=True)
+
+        response = self.client.get('/foods/01001',
+                                   HTTP_IF_NONE_MATCH=unchanged['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Last-Modified'],
+                         'Fri, 29 Aug 2014 00:00:00 GMT')
+        response = self.client.get('/foods/01002',
+                                   HTTP_IF_NONE_MATCH=changed['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"SR28@'))
+        self.assertEqual(response['Last-Modified'],
+                         'Tue, 01 Sep 2015 00:00:00 GMT')
+        response = self.client.get('/nutrients/203',
+                                   HTTP_IF_NONE_MATCH=nutrient['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_reload_changes_etags(self):
+        # load_sr loading the active release again under the same name
+        food = self.client.get('/foods/01001')
+        nutrient = self.client.get('/nutrients/203')
+        nutrient_matrix = matrix.get_matrix()
+        search_index = search.get_search_index()
+
+        Release.objects.filter(name='SR27').update(
+            loaded_at=self.sr27.loaded_at + datetime.timedelta(hours=1))
+        release.check(force=True)
+
+        for url, previous in (('/foods/01001', food),
+                              ('/nutrients/203', nutrient)):
+            response = self.client.get(url,
+                                       HTTP_IF_NONE_MATCH=previous['ETag'])
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], previous['ETag'])
+        self.assertIsNot(matrix.get_matrix(), nutrient_matrix)
+        self.assertIsNot(search.get_search_index(), search_index)
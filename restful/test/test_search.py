@@ -0,0 +1,58 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from rest_framework.test import APITestCase
+from restful.search import search_foods, tokenize, get_search_index
+
+
+class SearchIndexTestCase(TestCase):
+    """
+    The in-memory index used when not running on PostgreSQL.
+    """
+    def food_ids(self, q, **kwargs):
+        return [food['food_id'] for food in search_foods(q, **kwargs)]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Cheese, cottage, lowfat, 2% milkfat"),
+                         ['cheese', 'cottage', 'lowfat', '2', 'milkfat'])
+
+    def test_search_words(self):
+        self.assertEqual(self.food_ids("butter"), ['01001', '01003', '01002'])
+        self.assertEqual(self.food_ids("salted butter"), ['01001'])
+        self.assertEqual(self.food_ids("cottage 1%"), ['01016'])
+        self.assertEqual(self.food_ids("tofu"), [])
+        self.assertEqual(self.food_ids(" ,, "), [])
+
+    def test_search_prefix(self):
+        self.assertEqual(self.food_ids("chedd"), ['01009'])
+        self.assertEqual(self.food_ids("cheese br"), ['01006', '01005'])
+        # exact words rank above prefixes
+        self.assertEqual(self.food_ids("cream")[0], '01017')
+
+    def test_search_filters(self):
+        self.assertEqual(len(self.food_ids("cheese")), 17)
+        self.assertEqual(len(self.food_ids("cheese", limit=5)), 5)
+        self.assertEqual(self.food_ids("cheese", food_group='0200'), [])
+
+    def test_search_index_reused(self):
+        get_search_index()
+        with self.assertNumQueries(0):
+            search_foods("brie")
+
+
+class FoodSearchTest(APITestCase):
+    def test_endpoint_food_search(self):
+        url = reverse("food:food-search", kwargs={})
+        response = self.client.get(url, {'q': 'cheese, bri', 'food_group': '0100'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{"food_id": "01006",
+                                          "long_desc": "Cheese, brie",
+                                          "short_desc": "CHEESE,BRIE"},
+                                         {"food_id": "01005",
+                                          "long_desc": "Cheese, brick",
+                                          "short_desc": "CHEESE,BRICK"}])
+        self.assertEqual(len(self.client.get(url, {'q': 'cheese',
+                                                   'limit': 3}).data), 3)
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'a', 'limit': 'x'}).status_code,
+                         400)
+        self.assertEqual(self.client.post(url).status_code, 405)
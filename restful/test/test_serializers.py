@@ -1,4 +1,6 @@
+from django.http import Http404
 from django.test import TestCase
+from restful.calculations import nutrient_values
 from restful.serializers import FoodSeqNutrientObj
 from decimal import Decimal
 
@@ -13,3 +15,38 @@ class CalculateNutrientValueTestCase(TestCase):
                                   'value': Decimal('0.0425'),
                                   'food_id': '01001',
                                   'seq_id': '1'})
+
+    def test_serializer_nutrient_values_batch(self):
+        objs = [FoodSeqNutrientObj(food_id='01001', seq_id='1', nutr_id='203'),
+                FoodSeqNutrientObj(food_id='01001', seq_id='2', nutr_id='204'),
+                FoodSeqNutrientObj(food_id='01001', seq_id='9', nutr_id='203'),
+                FoodSeqNutrientObj(food_id='01002', seq_id='1', nutr_id='203')]
+        result = FoodSeqNutrientObj.calculate_many(objs)
+        self.assertEqual([item['value'] for item in result],
+                         [Decimal('0.0425'), Decimal('11.51762'), None, None])
+        self.assertEqual(result[1], {'nutr_id': '204',
+                                     'value': Decimal('11.51762'),
+                                     'food_id': '01001',
+                                     'seq_id': '2'})
+
+    def test_nutrient_values_exact_triples(self):
+        # only the requested (food, measure, nutrient) rows are fetched, not
+        # every measure of every food times every nutrient
+        triples = [('01001', '1', '203'), ('01001', '4', '204')]
+        with self.assertNumQueries(1):
+            self.assertEqual(nutrient_values(triples),
+                             [Decimal('0.0425'), Decimal('91.6543')])
+
+        # many (food, measure) pairs take more than one query
+        triples = [('010%02d' % food, str(seq), '203')
+                   for food in range(1, 21) for seq in range(1, 16)]
+        with self.assertNumQueries(2):
+            values = nutrient_values(triples)
+        self.assertEqual(values[:5], [Decimal('0.0425'), Decimal('0.1207'),
+                                      Decimal('1.9295'), Decimal('0.9605'),
+                                      None])
+        self.assertEqual(values[5:], [None] * 295)
+
+    def test_serializer_nutrient_value_missing(self):
+        obj = FoodSeqNutrientObj(food_id='01001', seq_id='9', nutr_id='203')
+        self.assertRaises(Http404, obj.calculate)
@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+
+import numpy
+from django.test import TestCase
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+from restful import matrix, similarity
+from restful.models import NutrientData
+from restful.similarity import SimilarityIndex
+
+
+class NutrientDataMixin(object):
+    """
+    The fixture only has nutrient data for 01001, give 5 more foods protein,
+    fat and carbohydrate values.
+    """
+    values = {'01002': (1, 80, 0), '01003': (0.3, 99, 0), '01004': (21, 29, 2),
+              '01005': (25, 30, 0), '01006': (20, 28, 0.5)}
+
+    def setUp(self):
+        for food_id, values in self.values.items():
+            for nutr_id, value in zip(('203', '204', '205'), values):
+                NutrientData.objects.create(
+                    food_id=food_id, nutrient_id=nutr_id, nutr_value=value,
+                    num_data_pts=1, source_code='1')
+        similarity.invalidate()
+
+    def tearDown(self):
+        similarity.invalidate()
+
+
+class SimilarityIndexTestCase(NutrientDataMixin, TestCase):
+    def setUp(self):
+        super(SimilarityIndexTestCase, self).setUp()
+        self.index = SimilarityIndex.build(matrix.NutrientMatrix.build('SR27'))
+
+    def brute_force(self, food_id, metric, cols=None):
+        vectors = self.index.vectors.astype(numpy.float64)
+        if cols is not None:
+            vectors = vectors[:, cols]
+        query = vectors[self.index.food_index[food_id]]
+        if metric == 'cosine':
+            with numpy.errstate(invalid='ignore'):
+                distances = 1 - vectors.dot(query) / (
+                    numpy.linalg.norm(vectors, axis=1) *
+                    numpy.linalg.norm(query))
+        else:
+            distances = numpy.linalg.norm(vectors - query, axis=1)
+        return sorted((distance, self.index.food_ids[i])
+                      for i, distance in enumerate(distances)
+                      if self.index.food_ids[i] != food_id and
+                      numpy.isfinite(distance))
+
+    def test_build(self):
+        self.assertEqual(self.index.vectors.shape, (20, 150))
+        # 19 other foods
+        self.assertEqual(self.index.k, 19)
+        self.assertEqual(self.index.neighbours['cosine'].shape, (20, 19))
+
+    def test_similar(self):
+        for metric in similarity.METRICS:
+            expected = self.brute_force('01001', metric)[:5]
+            similar = self.index.similar('01001', metric=metric, limit=5)
+            self.assertEqual([food_id for food_id, _ in similar],
+                             [food_id for _, food_id in expected])
+            for (_, distance), (expected_distance, _) in zip(similar,
+                                                               expected):
+                self.assertAlmostEqual(distance, expected_distance, places=5)
+            # beyond the precomputed neighbours, cosine distances are only
+            # defined for the foods with nutrient data
+            self.assertEqual(len(self.index.similar('01001', metric=metric,
+                                                    limit=100)),
+                             5 if metric == 'cosine' else 19)
+        self.assertIsNone(self.index.similar('99999'))
+
+    def test_nutrient_subset(self):
+        cols = [self.index.nutr_index['203'], self.index.nutr_index['204']]
+        expected = self.brute_force('01001', 'euclidean', cols)[:3]
+        similar = self.index.similar('01001', ['203', '204'], 'euclidean', 3)
+        self.assertEqual([food_id for food_id, _ in similar],
+                         [food_id for _, food_id in expected])
+        self.assertRaises(KeyError, self.index.similar, '01001', ['999'])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.index.save(directory)
+        loaded = SimilarityIndex.load(directory, 'SR27')
+        self.assertIsInstance(loaded.vectors, numpy.memmap)
+        self.assertEqual(loaded.similar('01001'), self.index.similar('01001'))
+        self.assertIsNone(SimilarityIndex.load(directory, 'SR28'))
+        # built before the release was loaded again
+        self.assertIsNone(SimilarityIndex.load(directory, 'SR27',
+                                               '2015-01-01T00:00:00'))
+
+        with override_settings(USDAREST_SIMILARITY_DIR=directory):
+            similarity.load()
+            self.assertIsInstance(similarity.get_similarity_index().vectors,
+                                  numpy.memmap)
+
+    def test_save_again(self):
+        # a new version is switched to, the old one removed
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.index.save(directory)
+        first = os.path.realpath(os.path.join(directory, 'SR27'))
+        loaded = SimilarityIndex.load(directory, 'SR27')
+        self.index.save(directory)
+        self.assertTrue(os.path.islink(os.path.join(directory, 'SR27')))
+        self.assertNotEqual(os.path.realpath(os.path.join(directory, 'SR27')),
+                            first)
+        self.assertEqual(len(os.listdir(directory)), 2)
+        # readers of the old version are not disturbed
+        self.assertEqual(loaded.similar('01001'), self.index.similar('01001'))
+        self.assertEqual(SimilarityIndex.load(directory, 'SR27').similar(
+            '01001'), self.index.similar('01001'))
+
+    def test_not_built_on_use(self):
+        self.assertIsNone(similarity.get_similarity_index())
+
+
+class SimilarFoodsTestCase(NutrientDataMixin, APITestCase):
+    def test_endpoint(self):
+        similarity.build()
+        response = self.client.get('/foods/01004/similar?limit=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['metric'], 'cosine')
+        results = response.data['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(results, key=lambda r: r['distance']),
+                         results)
+        self.assertEqual([r['food_id'] for r in results][:2],
+                         ['01006', '01005'])
+
+        response = self.client.get(
+            '/foods/01001/similar?nutrients=203,204&metric=euclidean')
+        self.assertEqual(response.data['nutrients'], ['203', '204'])
+
+        self.assertEqual(self.client.get('/foods/99999/similar').status_code,
+                         404)
+        for query in ('metric=manhattan', 'nutrients=999', 'limit=x'):
+            response = self.client.get('/foods/01001/similar?' + query)
+            self.assertEqual(response.status_code, 400)
+
+    def test_endpoint_not_built(self):
+        response = self.client.get('/foods/01004/similar')
+        self.assertEqual(response.status_code, 503)
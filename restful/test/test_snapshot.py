@@ -0,0 +1,102 @@
+import datetime
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+import numpy
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from restful import matrix, release, snapshot
+from restful.models import FoodDesc, NutrientData, Release, Weight
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'SR27.snapshot')
+        snapshot.invalidate()
+        matrix.invalidate()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        snapshot.invalidate()
+        matrix.invalidate()
+
+    def test_snapshot_records(self):
+        snapshot.write(self.path)
+        with self.assertNumQueries(0):
+            snap = snapshot.Snapshot(self.path)
+            self.assertEqual(snap.release, 'SR27')
+            self.assertEqual(snap.rows['food_desc'], 20)
+            self.assertEqual(snap.rows['nutrient_data'], 114)
+            food = snap.food('01001')
+            weights = snap.food_records('weight', '01001')
+            nutrient_data = snap.food_records('nutrient_data', '01001')
+            self.assertEqual(snap.food('99999'), None)
+            self.assertEqual(snap.food_records('weight', '01002'), [])
+
+        expected = FoodDesc.objects.filter(pk='01001').values()[0]
+        self.assertEqual(food, expected)
+        self.assertEqual(weights, list(
+            Weight.objects.filter(food='01001').order_by('seq').values(
+                *weights[0].keys())))
+        self.assertEqual(len(nutrient_data), 114)
+        protein = [row for row in nutrient_data if row['nutrient_id'] == '203']
+        self.assertEqual(protein[0], NutrientData.objects.filter(
+            food='01001', nutrient='203').values(*protein[0].keys())[0])
+        self.assertEqual(protein[0]['nutr_value'], Decimal('0.85'))
+
+    def test_snapshot_matrix(self):
+        expected = matrix.NutrientMatrix.build('SR27')
+        snapshot.write(self.path)
+        with override_settings(USDAREST_SNAPSHOT_DIR=self.directory):
+            with self.assertNumQueries(0):
+                nutrient_matrix = matrix.get_matrix()
+        self.assertEqual(nutrient_matrix.food_ids, expected.food_ids)
+        self.assertEqual(nutrient_matrix.food_groups, expected.food_groups)
+        self.assertEqual(nutrient_matrix.nutr_ids, expected.nutr_ids)
+        self.assertEqual(nutrient_matrix.nutrients, expected.nutrients)
+        self.assertEqual(nutrient_matrix.weights, expected.weights)
+        numpy.testing.assert_array_equal(nutrient_matrix.values,
+                                         expected.values)
+
+    def test_snapshot_ignored(self):
+        with override_settings(USDAREST_SNAPSHOT_DIR=self.directory):
+            # none yet, another release's, another format version
+            self.assertEqual(snapshot.get_snapshot(), None)
+            snapshot.write(os.path.join(self.directory, 'SR28.snapshot'),
+                           release='SR28')
+            self.assertEqual(snapshot.get_snapshot(), None)
+            with self.settings(USDA_RELEASE='SR28'):
+                self.assertEqual(snapshot.get_snapshot().release, 'SR28')
+            with open(self.path, 'wb') as f:
+                f.write(snapshot.MAGIC + b'\0' * 8)
+            self.assertEqual(snapshot.get_snapshot(), None)
+
+    def test_snapshot_stale(self):
+        # written before load_sr loaded the release again
+        sr27 = Release.objects.create(
+            name='SR27', schema='public',
+            release_date=datetime.date(2014, 8, 29), active=True)
+        self.addCleanup(release.check, force=True)
+        self.addCleanup(Release.objects.all().delete)
+        release.check(force=True)
+        with override_settings(USDAREST_SNAPSHOT_DIR=self.directory):
+            snapshot.write(self.path)
+            self.assertEqual(snapshot.get_snapshot().loaded_at,
+                             sr27.loaded_at.isoformat())
+            Release.objects.filter(name='SR27').update(
+                loaded_at=sr27.loaded_at + datetime.timedelta(hours=1))
+            release.check(force=True)
+            self.assertEqual(snapshot.get_snapshot(), None)
+
+    def test_build_snapshot_command(self):
+        out = StringIO()
+        with override_settings(USDAREST_SNAPSHOT_DIR=self.directory):
+            call_command('build_snapshot', stdout=out)
+        self.assertIn("release SR27 (20 foods, 114 nutrient values)",
+                      out.getvalue())
+        self.assertTrue(os.path.exists(self.path))
@@ -0,0 +1,62 @@
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.test import SimpleTestCase
+from restful import sr
+
+SR_PATH = os.path.join(os.path.dirname(settings.BASE_DIR), 'database',
+                       'sr27asc')
+
+
+class ReadTableTestCase(SimpleTestCase):
+    """
+    Parsing the SR ASCII files shipped in database/sr27asc.
+    """
+    def rows(self, table_name, typed=False):
+        return list(sr.read_table(SR_PATH, sr.TABLES[table_name], typed))
+
+    def test_food_groups(self):
+        rows = self.rows('usda_food_group')
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0], ('0100', 'Dairy and Egg Products'))
+
+    def test_nutrient_defs(self):
+        rows = self.rows('usda_nutrient_def', typed=True)
+        self.assertEqual(len(rows), 150)
+        self.assertEqual(rows[0], ('203', 'g', 'PROCNT', 'Protein', '2',
+                                   Decimal('600')))
+
+    def test_weights(self):
+        rows = self.rows('usda_weight')
+        self.assertEqual(len(rows), 15228)
+        # unquoted seq, empty numeric fields are nulls
+        self.assertEqual(rows[0], ('01001', '1', '1', 'pat (1" sq, 1/3" high)',
+                                   '5.0', None, None))
+
+    def test_foods(self):
+        self.assertEqual(len(self.rows('usda_food_desc')), 8618)
+
+    def test_latin1(self):
+        units = dict((row[0], row[1]) for row in self.rows('usda_nutrient_def'))
+        self.assertEqual(units['317'], '\xb5g')
+
+
+class CopyStreamTestCase(SimpleTestCase):
+    def test_copy_line(self):
+        self.assertEqual(sr.copy_line(('a\tb', None, 'c\\d\n')),
+                         'a\\tb\t\\N\tc\\\\d\\n\n')
+
+    def test_read(self):
+        progress = []
+        stream = sr.CopyStream([('1', 'a'), ('2', None), ('3', 'c')],
+                               progress=progress.append, every=2)
+        chunks = []
+        chunk = stream.read(5)
+        while chunk:
+            self.assertLessEqual(len(chunk), 5)
+            chunks.append(chunk)
+            chunk = stream.read(5)
+        self.assertEqual(''.join(chunks), '1\ta\n2\t\\N\n3\tc\n')
+        self.assertEqual(stream.rows, 3)
+        self.assertEqual(progress, [2])
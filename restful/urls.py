@@ -6,14 +6,20 @@ from restful import views
 food_urls = [
     # foods/
     url(r'^$', views.FoodList.as_view(), name='food-list'),
+    url(r'^/search$', views.FoodSearch.as_view(), name='food-search'),
+    url(r'^/filter$', views.FoodFilter.as_view(), name='food-filter'),
+    url(r'^/nutrients$', views.FoodSeqNutrientBatchView.as_view(),
+        name='nutrient-batch'),
     url(r'^/(?P<food_id>\d+)$', views.FoodDetail.as_view(),
         name='food-detail'),
+    url(r'^/(?P<food_id>\d+)/similar$', views.SimilarFoods.as_view(),
+        name='food-similar'),
     url(r'^/(?P<food_id>\d+)/seqs$', views.FoodSeqList.as_view(),
         name='weight-list'),
     url(r'^/(?P<food_id>\d+)/seqs/(?P<seq_id>\d+)$',
         views.FoodSeqDetail.as_view(), name='weight-detail'),
     url(r'^/(?P<food_id>\d+)/seqs/(?P<seq_id>\d+)/nutrients$',
-        views.NutrientList.as_view(), name='nutrient-list'),
+        views.FoodSeqNutrientList.as_view(), name='nutrient-list'),
     url(r'^/(?P<food_id>\d+)/seqs/(?P<seq_id>\d+)/nutrients/(?P<nutr_id>\d+)$',
         views.FoodSeqNutrientView.as_view(), name='nutrient-detail'),
 ]
@@ -22,7 +28,9 @@ nutrients_urls = [
     # nutrients/
     url(r'^$', views.NutrientList.as_view(), name='nutrient-list'),
     url(r'^/(?P<nutr_id>\d+)$', views.NutrientDetail.as_view(),
-        name='nutrient-detail')
+        name='nutrient-detail'),
+    url(r'^/(?P<nutr_id>\d+)/top$', views.NutrientTopFoods.as_view(),
+        name='nutrient-top'),
 ]
 
 food_group_urls = [
@@ -32,8 +40,37 @@ food_group_urls = [
         name='foodgroup-detail'),
 ]
 
+recipe_urls = [
+    # recipes/
+    url(r'^/compute$', views.RecipeComputeView.as_view(),
+        name='recipe-compute'),
+]
+
+portion_urls = [
+    # portions/
+    url(r'^/compute$', views.PortionComputeView.as_view(),
+        name='portion-compute'),
+]
+
+diet_urls = [
+    # diets/
+    url(r'^/optimize$', views.DietOptimizeView.as_view(),
+        name='diet-optimize'),
+]
+
+export_urls = [
+    # export/
+    url(r'^/foods\.(?P<export_format>ndjson|csv)$', views.FoodExport.as_view(),
+        name='food-export'),
+]
+
 urlpatterns = [
     url(r'^foods', include(food_urls, namespace='food')),
     url(r'^nutrients', include(nutrients_urls, namespace='nutrient')),
     url(r'^foodgroups', include(food_group_urls, namespace='foodgroup')),
+    url(r'^recipes', include(recipe_urls, namespace='recipe')),
+    url(r'^portions', include(portion_urls, namespace='portion')),
+    url(r'^diets', include(diet_urls, namespace='diet')),
+    url(r'^export', include(export_urls, namespace='export')),
+    url(r'^metrics$', views.metrics_response, name='metrics'),
 ]
@@ -1,15 +1,36 @@
-from django.http import HttpResponse
+import re
+from collections import OrderedDict
+
+from django.db.models import Prefetch
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.utils.html import escape
+from django.utils.text import compress_sequence
+from django.views.generic import View
 
-from restful.models import FoodGroup, FoodDesc, Weight, NutrientDef
+from restful.models import FoodGroup, FoodDesc, NutrientData
 from restful.serializers import FoodGroupSerializer, FoodDescBasicSerializer, \
     FoodDetailSerializer, FoodSeqListSerializer, FoodSeqSerializer, \
-    NutrientBasicSerializer, NutrientDetailSerializer, FoodSeqNutrientObj
-from restful.mixins import MultipleFieldLookupMixin
+    NutrientBasicSerializer, NutrientDetailSerializer, FoodSeqNutrientObj, \
+    FoodSeqNutrientSerializer, FoodSeqNutrientProfileObj, RecipeSerializer, \
+    RecipeObj, NutrientRankingObj, PortionListSerializer, PortionObj, \
+    SimilarFoodsObj, DietSerializer, DietPlanObj, FoodBulkSerializer, \
+    FoodBulkNutrientsSerializer
+from restful.mixins import MultipleFieldLookupMixin, CachedResponseMixin, \
+    FastSerializerMixin
+from restful.cache import get_reference_cache
+from restful.pagination import KeysetPagination
+from restful import export, prepared, profiling
+from restful.search import search_foods
+from restful.filtering import filter_foods
+from restful.rankings import BASES
+from restful.similarity import METRICS, get_similarity_index
+from restful.release import current_release, current_version
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics
+from rest_framework.exceptions import ValidationError
 
 
 
@@ -23,6 +44,16 @@ def home_response(request):
     example: <a href="/nutrients/203">/nutrients/203</a>"""))
 
 
+# /metrics
+def metrics_response(request):
+    """
+    Request counts and profiling histograms of this process, in the
+    Prometheus text format (see profiling.py).
+    """
+    return HttpResponse(profiling.metrics(),
+                        content_type='text/plain; version=0.0.4')
+
+
 # these views comprise a read-only REST api of the foods, nutrients and food
 # groups of the USDA Food Database
 #
@@ -37,67 +68,219 @@ def home_response(request):
 #   serializer_class: data handler defined in serializers.py
 #   queryset: queryset that defines the possible objects to be returned
 #   lookup_field: used to select an object from the queryset
+#
+# food groups, nutrient definitions and weights are served from the reference
+# cache (see cache.py) instead of the database.
+#
+# CachedResponseMixin (see mixins.py) adds ETag and conditional GET support,
+# with cache_rendered_response = True repeat hits are served from the
+# rendered response cache.  FastSerializerMixin (see mixins.py) renders JSON
+# with precompiled encoders instead of the serializers.
 
 
 # /foods
-class FoodList(generics.ListAPIView):
+# /foods?ids=<food_id>,<food_id>,...&nutrients=<nutr_id>,<nutr_id>,...
+class FoodList(CachedResponseMixin, FastSerializerMixin,
+               generics.ListAPIView):
     """
     A paginated list of all foods in the database, basic information only.
+
+    With ids: the details of those foods (in the given order) with their
+    measures and, with nutrients, their values per 100 g of those
+    nutrients, in a fixed number of queries.  Unknown ids are listed in
+    "not_found".
+    """
+    serializer_class = FoodDescBasicSerializer
+    queryset = FoodDesc.objects.all()
+    pagination_class = KeysetPagination
+    max_ids = 500
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.bulk(request)
+        return super(FoodList, self).list(request, *args, **kwargs)
+
+    def bulk(self, request):
+        invalid = ValidationError({'ids': [
+            'Give between 1 and %d food ids.' % self.max_ids]})
+        ids = request.query_params['ids'].split(',')
+        # before deduplicating, duplicates count
+        if len(ids) > self.max_ids:
+            raise invalid
+        # in the order given, without duplicates
+        food_ids = list(OrderedDict.fromkeys(
+            food_id.strip() for food_id in ids if food_id.strip()))
+        if not food_ids:
+            raise invalid
+
+        # one query for the foods, one per prefetched relation
+        prefetches = [Prefetch('weight', to_attr='weights')]
+        serializer_class = FoodBulkSerializer
+        nutrients = request.query_params.get('nutrients')
+        if nutrients:
+            nutr_ids = [nutr_id.strip() for nutr_id in nutrients.split(',')]
+            for nutr_id in nutr_ids:
+                if get_reference_cache().nutrient_def(nutr_id) is None:
+                    raise ValidationError(
+                        {'nutrients': ['Unknown nutrient %s.' % nutr_id]})
+            prefetches.append(Prefetch(
+                'nutrient_data', queryset=NutrientData.objects.filter(
+                    nutrient_id__in=nutr_ids).order_by('nutrient__sr_order')))
+            serializer_class = FoodBulkNutrientsSerializer
+
+        foods = dict((food.food_id, food) for food in FoodDesc.objects.filter(
+            food_id__in=food_ids).prefetch_related(*prefetches))
+        found = [foods[food_id] for food_id in food_ids if food_id in foods]
+        # seq is a CHAR(2) column, ordering it in SQL puts '10' before '2'
+        for food in found:
+            food.weights.sort(key=lambda weight: int(weight.seq))
+        return Response(OrderedDict([
+            ('results', serializer_class(found, many=True).data),
+            ('not_found', [food_id for food_id in food_ids
+                           if food_id not in foods])]))
+
+
+# /foods/search?q=<words>&food_group=<food_group_id>&limit=<n>
+class FoodSearch(CachedResponseMixin, FastSerializerMixin,
+                 generics.ListAPIView):
+    """
+    Foods whose descriptions match the words in q, best match first.  The
+    last word matches as a prefix, for autocomplete.
+    """
+    serializer_class = FoodDescBasicSerializer
+    pagination_class = None
+    default_limit = 25
+    max_limit = 100
+
+    def get_queryset(self):
+        # see search.py for the indexes behind this
+        q = self.request.query_params.get('q', '').strip()
+        if not q:
+            raise ValidationError({'q': ['This query parameter is required.']})
+        try:
+            limit = int(self.request.query_params.get('limit',
+                                                      self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = min(max(limit, 1), self.max_limit)
+        return search_foods(q, food_group=self.request.query_params.get(
+            'food_group'), limit=limit)
+
+
+# /foods/filter?min_<nutr_id>=<value>&max_<nutr_id>=<value>&basis=<100g or measure>&food_group=<food_group_id>
+class FoodFilter(CachedResponseMixin, FastSerializerMixin,
+                 generics.ListAPIView):
+    """
+    A paginated list of the foods within nutrient ranges, per 100 g
+    (default) or per default measure (basis=measure), optionally within a
+    food group.  i.e. ?min_203=20&max_307=100 for foods with at least 20 g
+    of protein and at most 100 mg of sodium.
     """
     serializer_class = FoodDescBasicSerializer
     queryset = FoodDesc.objects.all()
-    paginate_by = 30
+    pagination_class = KeysetPagination
+    constraint_param = re.compile(r'^(min|max)_(\d+)$')
+
+    def get_queryset(self):
+        params = self.request.query_params
+        bounds = {}
+        for name, value in params.items():
+            match = self.constraint_param.match(name)
+            if match is None:
+                continue
+            bound, nutr_id = match.groups()
+            if get_reference_cache().nutrient_def(nutr_id) is None:
+                raise ValidationError({name: ['Unknown nutrient.']})
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValidationError({name: ['A valid number is required.']})
+            bounds.setdefault(nutr_id, {})[bound] = value
+        if not bounds:
+            raise ValidationError({'detail': [
+                'Give at least one min_<nutr_id> or max_<nutr_id>.']})
+        basis = params.get('basis', '100g')
+        if basis not in BASES:
+            raise ValidationError(
+                {'basis': ['One of: %s.' % ', '.join(BASES)]})
+
+        # see filtering.py for the column scan behind this, the paginator
+        # only reads the page's foods
+        self.pagination_keys = filter_foods(
+            [(nutr_id, bound.get('min'), bound.get('max'))
+             for nutr_id, bound in sorted(bounds.items())],
+            basis, params.get('food_group'))
+        return self.queryset.all()
 
 
 # /foods/<food_id>
-class FoodDetail(generics.RetrieveAPIView):
+class FoodDetail(CachedResponseMixin, FastSerializerMixin,
+                 generics.RetrieveAPIView):
     """
     Details of a single food object.
     """
+    cache_rendered_response = True
     serializer_class = FoodDetailSerializer
     lookup_field = 'food_id'
     queryset = FoodDesc.objects.all()
 
+    def get_row(self, encoder):
+        food_id = self.kwargs.get('food_id')
+        if prepared.is_enabled():
+            rows = prepared.execute(
+                'usdarest_food_detail',
+                'SELECT %s FROM usda_food_desc WHERE food_id = $1' %
+                ', '.join(encoder.sources), [food_id])
+            row = rows[0] if rows else None
+        else:
+            row = self.get_queryset().filter(food_id=food_id).values_list(
+                *encoder.sources).first()
+        if row is None:
+            raise Http404
+        return row
+
 
 # /foods/<food_id>/seqs
-class FoodSeqList(generics.ListAPIView):
+class FoodSeqList(CachedResponseMixin, FastSerializerMixin,
+                  generics.ListAPIView):
     """
     A list of available food measures, by sequence number.
     """
+    cache_rendered_response = True
     serializer_class = FoodSeqListSerializer
     lookup_field = 'food_id'
+
     def get_queryset(self):
-        queryset = Weight.objects.all().filter(food=self.kwargs.get('food_id'))
-        return queryset
+        return get_reference_cache().weights(self.kwargs.get('food_id'))
 
 
 # /foods/<food_id>/seqs/<seq_id>
-class FoodSeqDetail(generics.RetrieveAPIView, MultipleFieldLookupMixin):
+class FoodSeqDetail(CachedResponseMixin, FastSerializerMixin,
+                    generics.RetrieveAPIView, MultipleFieldLookupMixin):
     """
     Detail information of a specific measure of a food.
     """
+    cache_rendered_response = True
     # see mixins.py for details on multiple lookup fields
     serializer_class = FoodSeqSerializer
     lookup_fields = ('food_id', 'seq_id')
 
     def get_object(self):
-        queryset = Weight.objects.all().filter(food=self.kwargs.get('food_id')).filter(seq=self.kwargs.get('seq_id'))
-        # food and seq are "together_unique" in the database so this queryset
-        # will have at most one member.  If this could be an objects.get() call
-        # it would avoid any errors resulting from calling an index on an empty
-        # queryset.
-        try:
-            obj = queryset[0]
-        except IndexError:
-            return
+        # food and seq are "together_unique" in the database so there is at
+        # most one measure for a food_id and seq_id.
+        obj = get_reference_cache().weight(self.kwargs.get('food_id'),
+                                           self.kwargs.get('seq_id'))
+        if obj is None:
+            raise Http404
         return obj
 
 
 # /foods/<food_id>/seqs/<seq_id>/nutrients/<nutr_id>
-class FoodSeqNutrientView(APIView):
+class FoodSeqNutrientView(CachedResponseMixin, APIView):
     """
     Nutrient value for a given food, and seq_id (measurement)
     """
+    cache_rendered_response = True
     def get(self, request, *args, **kwargs):
         food = kwargs.get('food_id')
         seq = kwargs.get('seq_id')
@@ -110,47 +293,326 @@ class FoodSeqNutrientView(APIView):
         return response
 
 
+# /foods/nutrients
+class FoodSeqNutrientBatchView(APIView):
+    """
+    Nutrient values for many (food_id, seq_id, nutr_id) items in one request.
+
+    POST a list of {"food_id": ..., "seq_id": ..., "nutr_id": ...} objects,
+    the response lists the same items with a "value" in the same order.
+    Items that can't be found have a value of null.
+    """
+    max_items = 1000
+
+    def post(self, request, *args, **kwargs):
+        # before validating every item of an oversized payload
+        if isinstance(request.data, list) and \
+                len(request.data) > self.max_items:
+            return Response(
+                {"detail": "At most %d items per request." % self.max_items},
+                status=status.HTTP_400_BAD_REQUEST)
+        serializer = FoodSeqNutrientSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+
+        # see serializers.py for definition of FoodSeqNutrientObj
+        objs = [FoodSeqNutrientObj(item['food_id'], item['seq_id'],
+                                   item['nutr_id']) for item in items]
+        result = FoodSeqNutrientObj.calculate_many(objs)
+        return Response(result, status=status.HTTP_200_OK)
+
+
 # /foods/<food_id>/seqs/<seq_id>/nutrients
+class FoodSeqNutrientList(CachedResponseMixin, APIView):
+    """
+    Value of every nutrient for a given food and seq_id (measurement)
+    """
+    cache_rendered_response = True
+    def get(self, request, *args, **kwargs):
+        food = kwargs.get('food_id')
+        seq = kwargs.get('seq_id')
+
+        # see serializers.py for definition of FoodSeqNutrientProfileObj
+        obj = FoodSeqNutrientProfileObj(food, seq)
+        result = obj.calculate()
+        response = Response(result, status=status.HTTP_200_OK)
+        return response
+
+
+# /foods/<food_id>/similar?nutrients=<nutr_id,...>&metric=<cosine or euclidean>&limit=<n>
+class SimilarFoods(CachedResponseMixin, APIView):
+    """
+    Foods with the most similar nutrient profiles per 100 g, over all
+    nutrients or a comma separated list of them, by cosine (default) or
+    euclidean distance.  For substitution suggestions.
+    """
+    default_limit = 10
+    max_limit = 100
+
+    def data_version(self):
+        # the neighbours depend on every food, not just this one
+        return current_version()
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        metric = params.get('metric', 'cosine')
+        if metric not in METRICS:
+            raise ValidationError(
+                {'metric': ['One of: %s.' % ', '.join(METRICS)]})
+        nutr_ids = None
+        if params.get('nutrients'):
+            nutr_ids = params['nutrients'].split(',')
+            unknown = [nutr_id for nutr_id in nutr_ids
+                       if get_reference_cache().nutrient_def(nutr_id) is None]
+            if unknown:
+                raise ValidationError(
+                    {'nutrients': ['Unknown: %s.' % ', '.join(unknown)]})
+        try:
+            limit = int(params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = min(max(limit, 1), self.max_limit)
+        if get_similarity_index() is None:
+            # built by the build_similarity command, never during a request
+            return Response(
+                {"detail": "The similarity index is not built yet."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # see serializers.py for definition of SimilarFoodsObj
+        obj = SimilarFoodsObj(kwargs.get('food_id'), nutr_ids, metric, limit)
+        return Response(obj.calculate(), status=status.HTTP_200_OK)
+
+
 # /nutrients
-class NutrientList(generics.ListAPIView):
+class NutrientList(CachedResponseMixin, FastSerializerMixin,
+                   generics.ListAPIView):
     """
     List of all nutrients.
     """
     serializer_class = NutrientBasicSerializer
-    queryset = NutrientDef.objects.all()
-    paginate_by = 30
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return get_reference_cache().nutrient_defs()
 
 
 # /nutrients/<nutr_id>
-class NutrientDetail(generics.RetrieveAPIView):
+class NutrientDetail(CachedResponseMixin, FastSerializerMixin,
+                     generics.RetrieveAPIView):
     """
     Details of a specific nutrient.
     """
+    cache_rendered_response = True
     serializer_class = NutrientDetailSerializer
     lookup_field = 'nutr_id'
-    queryset = NutrientDef.objects.all()
+
+    def get_object(self):
+        obj = get_reference_cache().nutrient_def(self.kwargs.get('nutr_id'))
+        if obj is None:
+            raise Http404
+        return obj
+
+
+# /nutrients/<nutr_id>/top?basis=<100g|measure>&food_group=<id>&limit=<n>&order=<desc|asc>
+class NutrientTopFoods(CachedResponseMixin, APIView):
+    """
+    Foods highest in a nutrient, per 100 g (default) or per default measure
+    (basis=measure), optionally within a food group.  order=asc for the
+    lowest instead.
+    """
+    default_limit = 50
+    max_limit = 500
+
+    def get(self, request, *args, **kwargs):
+        nutr_id = kwargs.get('nutr_id')
+        if get_reference_cache().nutrient_def(nutr_id) is None:
+            raise Http404
+
+        params = request.query_params
+        basis = params.get('basis', '100g')
+        if basis not in BASES:
+            raise ValidationError(
+                {'basis': ['One of: %s.' % ', '.join(BASES)]})
+        order = params.get('order', 'desc')
+        if order not in ('desc', 'asc'):
+            raise ValidationError({'order': ['One of: desc, asc.']})
+        try:
+            limit = int(params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = min(max(limit, 1), self.max_limit)
+
+        # see serializers.py for definition of NutrientRankingObj
+        obj = NutrientRankingObj(nutr_id, basis, params.get('food_group'),
+                                 limit, ascending=order == 'asc')
+        return Response(obj.calculate(), status=status.HTTP_200_OK)
+
+
+# /recipes/compute
+class RecipeComputeView(APIView):
+    """
+    Total nutrients of a recipe, with a per-ingredient breakdown.
+
+    POST {"ingredients": [{"food_id": ..., "seq_id": ..., "quantity": ...},
+                          {"food_id": ..., "grams": ..., "quantity": ...}]}
+    """
+    max_ingredients = 100
+
+    def post(self, request, *args, **kwargs):
+        # before validating every ingredient of an oversized payload
+        ingredients = request.data.get('ingredients') \
+            if isinstance(request.data, dict) else None
+        if isinstance(ingredients, list) and \
+                not 0 < len(ingredients) <= self.max_ingredients:
+            return Response(
+                {"detail": "Give between 1 and %d ingredients." %
+                           self.max_ingredients},
+                status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ingredients = serializer.validated_data['ingredients']
+
+        # see serializers.py for definition of RecipeObj
+        result = RecipeObj(ingredients).calculate()
+        return Response(result, status=status.HTTP_200_OK)
+
+
+# /portions/compute
+class PortionComputeView(APIView):
+    """
+    Nutrients of arbitrary portions of foods, i.e. "250 g", "3 oz" or
+    "1.5 cup" of a food.  Values are rounded to each nutrient's
+    decimal_places.
+
+    A unit is a mass unit or one of the food's measure descriptions, also
+    matched by its first word ("cup" for "cup, chopped").  When that word
+    starts measures of different weights the request is rejected with a
+    400 listing them, give the full description or a seq_id instead.
+
+    POST {"portions": [{"food_id": ..., "quantity": ..., "unit": ...},
+                       {"food_id": ..., "quantity": ..., "seq_id": ...}],
+          "nutrients": [nutr_id, ...]}  (optional, default: all)
+    """
+    max_portions = 1000
+
+    def post(self, request, *args, **kwargs):
+        # before validating every portion of an oversized payload
+        portions = request.data.get('portions') \
+            if isinstance(request.data, dict) else None
+        if isinstance(portions, list) and \
+                not 0 < len(portions) <= self.max_portions:
+            return Response(
+                {"detail": "Give between 1 and %d portions." %
+                           self.max_portions},
+                status=status.HTTP_400_BAD_REQUEST)
+        serializer = PortionListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        portions = serializer.validated_data['portions']
+
+        # see serializers.py for definition of PortionObj
+        result = PortionObj(portions,
+                            serializer.validated_data.get('nutrients')
+                            ).calculate()
+        return Response(result, status=status.HTTP_200_OK)
+
+
+# /diets/optimize
+class DietOptimizeView(APIView):
+    """
+    The foods that meet nutrient targets at the least total mass (or
+    energy), each a quantity of its default measure.
+
+    POST {"targets": [{"nutr_id": ..., "min": ..., "max": ...}, ...],
+          "objective": "mass" or "energy",  (optional, default: mass)
+          "food_groups": [food_group_id, ...],  (optional, default: all)
+          "exclude": [food_id, ...],  (optional)
+          "max_grams": ...}  (optional, most grams of any food, default: 500)
+    """
+    max_targets = 50
+
+    def post(self, request, *args, **kwargs):
+        # before validating every target of an oversized payload
+        targets = request.data.get('targets') \
+            if isinstance(request.data, dict) else None
+        if isinstance(targets, list) and \
+                not 0 < len(targets) <= self.max_targets:
+            return Response(
+                {"detail": "Give between 1 and %d targets." %
+                           self.max_targets},
+                status=status.HTTP_400_BAD_REQUEST)
+        serializer = DietSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        # see serializers.py for definition of DietPlanObj
+        result = DietPlanObj(data['targets'], data['objective'],
+                             data.get('food_groups'), data.get('exclude', ()),
+                             data['max_grams']).calculate()
+        return Response(result, status=status.HTTP_200_OK)
 
 
 # /foodgroups
-class FoodGroupList(generics.ListAPIView):
+class FoodGroupList(CachedResponseMixin, FastSerializerMixin,
+                    generics.ListAPIView):
     """
     List of available food groups.
     """
     model = FoodGroup
     serializer_class = FoodGroupSerializer
-    queryset = FoodGroup.objects.all()
+
+    def get_queryset(self):
+        return get_reference_cache().food_groups()
 
 
 # /foodgroups/<foodgroup_id>
-class FoodGroupDetail(generics.RetrieveAPIView):
+class FoodGroupDetail(CachedResponseMixin, FastSerializerMixin,
+                      generics.RetrieveAPIView):
     """
     Details of a specific food group.
     """
-    model = FoodDesc
+    cache_rendered_response = True
+    model = FoodGroup
     serializer_class = FoodGroupSerializer
     lookup_field = 'food_group_id'
-    queryset = FoodGroup.objects.all()
-    def get_queryset(self):
-        queryset = super(FoodGroupDetail, self).get_queryset()
-        return queryset.filter(food_group=self.kwargs.get('food_group_id'))
 
+    def get_object(self):
+        obj = get_reference_cache().food_group(
+            self.kwargs.get('food_group_id'))
+        if obj is None:
+            raise Http404
+        return obj
+
+
+# /export/foods.ndjson
+# /export/foods.csv
+class FoodExport(View):
+    """
+    The whole dataset in one streamed download: every food with its weights
+    and nutrient values, as newline delimited JSON or CSV.  Compressed with
+    gzip if the client accepts it.
+
+    A plain django view rather than an APIView: the response is streamed
+    and doesn't go through DRF's content negotiation and renderers.
+    """
+    formats = {
+        'ndjson': (export.ndjson, 'application/x-ndjson; charset=utf-8'),
+        'csv': (export.csv_rows, 'text/csv; charset=utf-8'),
+    }
+    accepts_gzip = re.compile(r'\bgzip\b')
+
+    def get(self, request, *args, **kwargs):
+        export_format = kwargs.get('export_format')
+        generate, content_type = self.formats[export_format]
+        content = (chunk.encode('utf-8') for chunk in generate())
+
+        gzip = self.accepts_gzip.search(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if gzip:
+            content = compress_sequence(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Content-Disposition'] = 'attachment; filename="%s-foods.%s"' % (
+            current_release().lower(), export_format)
+        return response
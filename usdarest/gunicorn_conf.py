@@ -0,0 +1,50 @@
+# gunicorn settings, used by the Procfile:
+#   gunicorn usdarest.wsgi -c usdarest/gunicorn_conf.py
+#
+# Workers are gevent workers by default: each request runs in a greenlet and
+# waiting on PostgreSQL or on a slow client yields to the other requests, so
+# one worker holds up to GUNICORN_WORKER_CONNECTIONS concurrent connections
+# instead of one.  psycopg2 is made cooperative with psycogreen after the
+# fork.  The views stay as they are: under gevent the blocking calls inside
+# them are the async points.
+#
+# CPU bound work (building the nutrient matrix and rankings at startup, see
+# wsgi.py) still blocks a worker's event loop while it runs.  Without
+# USDAREST_NUTRIENT_MATRIX nothing is built, rankings come from the database.
+#
+# GUNICORN_WORKER_CLASS=sync goes back to one request per worker.
+#
+# Database connections: without a pool every concurrent greenlet opens its
+# own PostgreSQL connection, so WEB_CONCURRENCY x GUNICORN_WORKER_CONNECTIONS
+# connections could be attempted and exhaust max_connections.  gevent
+# workers therefore turn on the pooled backend (USDAREST_DB_POOL, see
+# usdarest/settings.py) unless it is set: a worker then holds at most
+# USDAREST_DB_POOL_SIZE connections and other requests wait for one.  With
+# USDAREST_DB_POOL=0 worker_connections is capped at USDAREST_DB_POOL_SIZE
+# instead.
+
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+if worker_class == 'gevent':
+    # read by usdarest/settings.py, which is imported after this file
+    os.environ.setdefault('USDAREST_DB_POOL', '1')
+    if os.environ['USDAREST_DB_POOL'] != '1':
+        worker_connections = min(worker_connections, int(
+            os.environ.get('USDAREST_DB_POOL_SIZE', 10)))
+
+# mobile clients reuse connections between requests
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+timeout = 30
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+        server.log.info("Worker %s: psycopg2 patched for gevent.", worker.pid)
@@ -41,6 +41,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'restful.middleware.ProfilingMiddleware',
+    'restful.middleware.ReleaseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,6 +74,68 @@ TEMPLATES = [
 WSGI_APPLICATION = 'usdarest.wsgi.application'
 
 
+REST_FRAMEWORK = {
+    # restful.encoders.JSONRenderer also renders the precompiled JSON of
+    # restful.mixins.FastSerializerMixin
+    'DEFAULT_RENDERER_CLASSES': (
+        'restful.encoders.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Render JSON of the list and detail endpoints with precompiled encoders
+# instead of DRF serializers (see restful/encoders.py).
+USDAREST_FAST_SERIALIZERS = True
+
+# USDA data release served by the API.  In-memory engines and caches built
+# from the usda_* tables are keyed on it.  Releases loaded with
+# `manage.py load_sr --release` take over once activated (see
+# restful/release.py), workers look for a newly activated release every
+# USDAREST_RELEASE_CHECK_INTERVAL seconds.
+USDA_RELEASE = 'SR27'
+USDA_RELEASE_DATE = '2014-08-29'
+USDAREST_RELEASE_CHECK_INTERVAL = 30
+
+# Serve nutrient calculations from an in-memory NumPy matrix of
+# usda_nutrient_data loaded at worker startup (see restful/matrix.py).
+USDAREST_NUTRIENT_MATRIX = os.environ.get('USDAREST_NUTRIENT_MATRIX') == '1'
+
+# Directory of the saved food similarity indexes, one per release, that
+# workers memory-map at startup (see restful/similarity.py and the
+# build_similarity command).  None: no index, /foods/<food_id>/similar
+# answers 503.
+USDAREST_SIMILARITY_DIR = os.environ.get(
+    'USDAREST_SIMILARITY_DIR',
+    os.path.join(os.path.dirname(BASE_DIR), 'database', 'similarity'))
+
+# Directory of the binary snapshots of the SR tables, one per release, that
+# workers memory-map at startup to fill the nutrient matrix without querying
+# the database (see restful/snapshot.py and the build_snapshot command).
+# None: always read the database.
+USDAREST_SNAPSHOT_DIR = os.environ.get(
+    'USDAREST_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(BASE_DIR), 'database', 'snapshots'))
+
+# Backend of the read-through cache of the food group, nutrient definition
+# and weight tables (see restful/cache.py).  Use
+# 'restful.cache.DjangoCacheBackend' with {'alias': ...} in OPTIONS to share
+# one copy between workers through CACHES.
+USDAREST_REFERENCE_CACHE = {
+    'BACKEND': 'restful.cache.LocalMemoryBackend',
+    'OPTIONS': {},
+}
+
+# Rendered JSON responses of the read-only detail endpoints, same format as
+# USDAREST_REFERENCE_CACHE (see restful/mixins.py).
+USDAREST_RESPONSE_CACHE = {
+    'BACKEND': 'restful.cache.LocalMemoryBackend',
+    'OPTIONS': {'max_entries': 50000},
+}
+
+# Cache-Control max-age, in seconds, of read-only responses
+USDAREST_CACHE_MAX_AGE = 24 * 60 * 60
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -111,9 +175,48 @@ LOGGING = {
     "loggers": {
         "django": {
             "handlers": ["console"],
-        }
+        },
+        # one JSON line per profiled request, see restful/profiling.py
+        "restful.profiling": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     }
 }
 
+# Fraction of the requests profiled by restful.middleware.ProfilingMiddleware
+# (0 to 1): their query count and time, serializer and render time go to a
+# Server-Timing header, the restful.profiling logger and /metrics.  0 turns
+# profiling off.
+USDAREST_PROFILING_SAMPLE_RATE = float(
+    os.environ.get('USDAREST_PROFILING_SAMPLE_RATE', 0))
+
 DATABASES = {'default': dj_database_url.config(default=os.environ['DATABASE_URL'])}
 DATABASES['default']['engine'] = 'django.db.backends.postgresql_psycopg2'
+
+# Seconds to keep a database connection open between requests (0: close it
+# after each request).
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+
+# USDAREST_DB_POOL=1 hands out connections from a per-process pool with
+# health checks (restful/backends/pooled) instead of opening one per
+# request, and lets the hot lookups run as prepared statements (see
+# USDAREST_PREPARED_STATEMENTS).  MAX_SIZE caps the connections of a worker,
+# with gevent workers a request waits up to TIMEOUT seconds for one.
+# usdarest/gunicorn_conf.py turns the pool on for gevent workers (or caps
+# their worker_connections at USDAREST_DB_POOL_SIZE if USDAREST_DB_POOL=0),
+# each greenlet would otherwise open a connection of its own.
+if os.environ.get('USDAREST_DB_POOL') == '1':
+    DATABASES['default']['ENGINE'] = 'restful.backends.pooled'
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': int(os.environ.get('USDAREST_DB_POOL_SIZE', 10)),
+        'TIMEOUT': int(os.environ.get('USDAREST_DB_POOL_TIMEOUT', 10)),
+        'HEALTH_CHECK_INTERVAL': int(
+            os.environ.get('USDAREST_DB_POOL_HEALTH_CHECK', 30)),
+        'MAX_LIFETIME': int(os.environ.get('USDAREST_DB_POOL_LIFETIME', 3600)),
+    }
+
+# Run the FoodDetail and single nutrient value lookups as server-side
+# prepared statements on pooled connections (see restful/prepared.py).
+USDAREST_PREPARED_STATEMENTS = True
@@ -16,3 +16,13 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "usdarest.settings")
 
 # application = get_wsgi_application()
 application = Cling(get_wsgi_application())
+
+# pick the active release, memory-map its snapshot, then load the in-memory
+# nutrient matrix and rankings, if enabled, and memory-map the similarity
+# index before serving requests
+from restful import matrix, rankings, release, similarity, snapshot
+release.check(force=True)
+snapshot.load()
+matrix.load()
+rankings.load()
+similarity.load()